@@ -0,0 +1,42 @@
+#version 130
+#extension GL_EXT_texture_array : enable
+
+uniform sampler2DArray p3d_Texture0; // Tile Sheets used by this layer
+uniform usampler2D tileData;          // GID of each cell of the layer
+uniform sampler2D tileVisuals;        // Row pair of tile visuals per GID
+
+// Input from vertex shader
+in vec2 cellcoord;
+
+// Output from the fragment shader
+out vec4 p3d_FragColor;
+
+void main() {
+
+  // Look up the GID of our cell, empty cells are not drawn
+  ivec2 cell = ivec2(floor(cellcoord));
+  uint gid = texelFetch(tileData, cell, 0).r;
+  if (gid == 0u) {
+    discard;
+  }
+
+  // Fetch the tile visual of the GID
+  uint columns = uint(textureSize(tileVisuals, 0).x);
+  ivec2 visualcoord = ivec2(int(gid % columns), int(gid / columns) * 2);
+  vec4 tileVisual = texelFetch(tileVisuals, visualcoord, 0);
+  float tileSheet = texelFetch(tileVisuals, visualcoord + ivec2(0, 1), 0).r;
+
+  // Texcoords within the cell, laid out like the tile layer quads
+  vec2 local = fract(cellcoord);
+  vec2 texcoord = vec2(1.0 - local.y, local.x);
+
+  // Calculate our base tile image/frame
+  vec2 tileScale = vec2(1.0) / tileVisual.zw;
+  vec3 tilecoord = vec3(
+      (texcoord.x + tileVisual.x) * tileScale.x,
+      (texcoord.y * tileScale.y) + tileVisual.y * tileScale.y,
+      tileSheet);
+
+  vec4 tileColor = texture2DArray(p3d_Texture0, tilecoord);
+  p3d_FragColor = tileColor.rgba;
+}
@@ -0,0 +1,18 @@
+#version 130
+
+// Uniform inputs
+uniform mat4 p3d_ModelViewProjectionMatrix;
+
+// Vertex inputs
+in vec4 p3d_Vertex;
+in vec2 p3d_MultiTexCoord0;
+
+// Output to fragment shader
+out vec2 cellcoord;
+
+void main() {
+  gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
+
+  // Position on the layer in cells
+  cellcoord = p3d_MultiTexCoord0;
+}
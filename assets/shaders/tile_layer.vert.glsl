@@ -2,26 +2,52 @@
 
 // Uniform inputs
 uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform float osg_FrameTime;
+uniform float layerDepth; // Depth offset between the layers of a flattened group
+uniform sampler2D tileAnimations; // Frame table of each animated tile
 
 // Vertex inputs
 in vec4 p3d_Vertex;
-in vec2 p3d_MultiTexCoord0;
 
-in vec2 frct_tilePosition;
-in vec2 frct_tileCount;
-in float frct_tileSheet;
+in uvec4 frct_tileRect;
+in uvec2 frct_tileSheet;
+in uint frct_tileAnimation;
 
 // Output to fragment shader
-out vec2 texcoord;
-out vec2 tilePosition;
-out vec2 tileCount;
+out vec2 tilecoord;
 out float tileSheet;
 
+// Texture coordinates of the four corners of each tile quad
+const vec2 tileTexcoords[4] = vec2[4](vec2(0.0, 1.0), vec2(0.0, 0.0), vec2(1.0, 0.0), vec2(1.0, 1.0));
+
 void main() {
-  gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
+  gl_Position = p3d_ModelViewProjectionMatrix * vec4(p3d_Vertex.xy, -float(frct_tileSheet.y) * layerDepth, 1.0);
+
+  // Origin and size of the tile in its sheet, stored in 1/32768 units
+  vec4 rect = vec4(frct_tileRect) / 32768.0;
+  vec2 origin = rect.xy;
+  tileSheet = float(frct_tileSheet.x);
+
+  // Animated tiles pick their current frame from the animation table.
+  // Column 0 holds the frame count and duration of the animation
+  if (frct_tileAnimation > 0u) {
+    int row = int(frct_tileAnimation) - 1;
+    vec4 animation = texelFetch(tileAnimations, ivec2(0, row), 0);
+    float time = mod(osg_FrameTime, animation.y);
+
+    int frameCount = int(animation.x);
+    vec4 frame = texelFetch(tileAnimations, ivec2(frameCount, row), 0);
+    for (int index = 1; index < frameCount; ++index) {
+      vec4 candidate = texelFetch(tileAnimations, ivec2(index, row), 0);
+      if (time < candidate.w) {
+        frame = candidate;
+        break;
+      }
+    }
+
+    origin = frame.xy * rect.zw;
+    tileSheet = frame.z;
+  }
 
-  texcoord = p3d_MultiTexCoord0;
-  tilePosition = frct_tilePosition;
-  tileCount = frct_tileCount;
-  tileSheet = frct_tileSheet;
+  tilecoord = origin + tileTexcoords[gl_VertexID % 4] * rect.zw;
 }
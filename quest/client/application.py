@@ -44,10 +44,11 @@ class ClientApplication(application.QuestApplication):
         
         super().setup_game()
         
+        # The world manager exists before the flow enters its world loading stage
+        world.ConfigurableWorldCollection.instantiate_singleton('config/worldManager.ini')
         flow.ClientFlowManager.instantiate_singleton('config/flowManager.ini')
         camera.CameraManager.instantiate_singleton('config/cameraManager.ini')
         network.QuestClientNetworkManager.instantiate_singleton()
-        #world.WorldManager.instantiate_singleton('config/worldManager.ini')
 
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
 
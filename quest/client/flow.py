@@ -1,8 +1,10 @@
 from quest.engine import core, prc, showbase
 from quest.engine import runtime, vfs
 from quest.client import splash
-from quest.framework import singleton, configurable
+from quest.framework import singleton, configurable, utilities
+from quest.world import scheduler
 
+from direct.gui.DirectGui import DirectWaitBar
 from stageflow import Flow, prefab, Stage
 
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
@@ -65,6 +67,75 @@ class MainMenuStage(Stage, core.QuestObject):
 
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
 
+class WorldLoadingStage(Stage, core.QuestObject):
+    """
+    Loads the game world and shows the progress of its build work,
+    moving on to the exit stage once the build scheduler is drained
+    """
+
+    def __init__(self, exit_stage: str = 'gameplay', world_id: int = 1):
+        Stage.__init__(self)
+        core.QuestObject.__init__(self)
+
+        self._exit_stage = exit_stage
+        self._world_id = world_id
+        self._progress_bar = None
+
+    def enter(self, data: dict = None) -> None:
+        """
+        Starts loading the world and listening for its build progress
+
+        data
+            Data passed from the exit of the previous :class:`Stage`.
+        """
+
+        self._progress_bar = DirectWaitBar(range=1.0, value=0.0, pos=(0, 0, -0.8), scale=(0.8, 1, 0.5))
+        self.accept(scheduler.BuildScheduler.PROGRESS_EVENT, self._handle_build_progress)
+        self.accept(scheduler.BuildScheduler.COMPLETE_EVENT, self._handle_build_complete)
+
+        if runtime.has_world_mgr():
+            runtime.world_mgr.load_world(self._world_id)
+
+        # Worlds without queued build work finish on the next frame
+        if not scheduler.get_build_scheduler().pending:
+            utilities.do_method_after_n_frames(1, self._handle_build_complete)
+
+    def _handle_build_progress(self, completed: int, total: int) -> None:
+        """
+        Shows the fraction of the world's build steps that have run
+        """
+
+        if self._progress_bar is not None and total:
+            self._progress_bar['value'] = completed / total
+
+    def _handle_build_complete(self) -> None:
+        """
+        Moves on to the exit stage once the world has been built
+        """
+
+        if self._progress_bar is not None:
+            runtime.base.flow.transition(self._exit_stage)
+
+    def exit(self, data: dict = None) -> object:
+        """
+        Stops listening for build progress and removes the progress bar
+
+        data
+            Data that was passed to :class:`Flow.transition`.
+
+        :returns:
+            Arbitrary data for the next active :class:`Stage`.
+        """
+
+        self.ignore_all()
+        if self._progress_bar is not None:
+            self._progress_bar.destroy()
+            self._progress_bar = None
+
+        return data
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
 class GameplayStage(Stage, core.QuestObject):
     """
     """
@@ -127,7 +198,8 @@ class ClientFlowManager(configurable.Configurable, singleton.Singleton, core.Que
         """
 
         stages = dict(
-            splash=splash.Panda3dEngineSplash(exit_stage='gameplay'),
+            splash=splash.Panda3dEngineSplash(exit_stage='loading'),
+            loading=WorldLoadingStage(exit_stage='gameplay'),
             #main_menu=MainMenuStage(),
             gameplay=GameplayStage(),
             quit=prefab.Quit())
@@ -48,7 +48,7 @@ class Runnable(object):
         """
 
         if self._task != None:
-            self._task = utilities.remove_task(self.__task)
+            self._task = utilities.remove_task(self._task)
 
             return True
 
@@ -252,6 +252,29 @@ def get_local_data_path(path: str) -> str:
 
     return os.path.join(get_local_data_directory(), path)
  
+def get_local_cache_directory() -> str:
+    """
+    Returns the application's per user cache directory. Unlike the local
+    data directory it never defaults to the install directory
+    """
+
+    from quest.engine import prc
+    folder_name = prc.get_prc_string('data-folder', 'Quest')
+
+    if sys.platform in ['win32', 'cygwin', 'msys']:
+        return os.path.join(os.getenv('LOCALAPPDATA'), folder_name)
+    elif sys.platform == 'darwin':
+        return os.path.join(os.path.expanduser('~/Library/Caches'), folder_name)
+    else:
+        return os.path.join(os.getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), folder_name)
+
+def get_local_cache_path(path: str) -> str:
+    """
+    Returns the path relative to the application's per user cache directory
+    """
+
+    return os.path.join(get_local_cache_directory(), path)
+ 
 def get_screenshot_directory(absolute: bool = False) -> str:
     """
     Returns the application's screenshot directory
@@ -0,0 +1,382 @@
+"""
+Tile atlases for Tiled worlds. The atlas build step packs every tile used by
+the chunks of a world into uniform sized texture array pages, padding each
+tile by extruding its edge pixels to prevent bleeding between neighbours.
+
+File layout, written next to the .world file:
+    <world>.atlas.json      page size, padding, page files, sources and the remap table
+    <world>.atlas.<n>.png   the atlas pages
+
+The remap table maps (sheet, local tile id) to (page, tile_x, tile_y,
+count_x, count_y) in the units used by the tile visual tables, so every tile
+layer of the world can draw from the one shared texture array.
+"""
+
+from panda3d import core as p3d
+
+from quest.engine import vfs
+from quest.world import tmx, sheet, qmap
+
+import numpy as np
+import json
+import math
+import io
+import os
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+ATLAS_VERSION = 1
+ATLAS_EXTENSION = '.atlas.json'
+ATLAS_PAGE_FORMAT = '%s.atlas.%d.png'
+
+_vfs = p3d.VirtualFileSystem.get_global_ptr()
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+class AtlasError(Exception):
+    """
+    Raised when a tile atlas cannot be built or is malformed
+    """
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+def get_atlas_path(world_file: str) -> str:
+    """
+    Returns the atlas metadata path for the requested world file
+    """
+
+    return os.path.splitext(world_file)[0] + ATLAS_EXTENSION
+
+def get_world_maps(world_file: str) -> list:
+    """
+    Returns the TMX file paths of the chunks listed in a world file
+    """
+
+    with io.open(world_file, 'r') as f:
+        world_data = json.load(f)
+
+    world_directory = os.path.dirname(world_file)
+    return [os.path.join(world_directory, chunk_data['fileName'])
+        for chunk_data in world_data.get('maps', [])]
+
+def collect_used_tiles(tiled_map: object, tiles: dict = None) -> dict:
+    """
+    Collects the tiles drawn by a TiledMap's tile layers, tile objects and
+    tile animations. Returns a dict of (sheet path, local tile id) to the
+    tile's rect in the sheet, None for tiles that use a whole image
+    """
+
+    if tiles is None:
+        tiles = {}
+
+    gids = set()
+    for layer in tiled_map.layers:
+        if isinstance(layer, tmx.TiledChunkedTileLayer):
+            for chunk in layer.chunks.values():
+                gids.update(np.unique(chunk.data).tolist())
+        elif isinstance(layer, tmx.TiledTileLayer):
+            gids.update(np.unique(layer.data).tolist())
+
+    gids.update(obj.gid for obj in tiled_map.objects if obj.gid)
+    for gid in list(gids):
+        props = tiled_map.tile_properties.get(gid, {})
+        gids.update(frame.gid for frame in props.get('frames', []))
+    gids.discard(0)
+
+    map_directory = os.path.dirname(tiled_map.filename)
+    for gid in sorted(gids):
+        props = tiled_map.tile_properties.get(gid, {})
+        source = props.get('source', None)
+        if source:
+            tiles[(sheet.get_sheet_path(os.path.join(map_directory, source)), 0)] = None
+            continue
+
+        tileset = tiled_map.get_tileset_from_gid(gid)
+        if tileset.source is None:
+            continue
+
+        local_id = tiled_map.tiledgidmap[gid] - tileset.firstgid
+        path = sheet.get_sheet_path(os.path.join(map_directory, tileset.source))
+        tiles[(path, local_id)] = tileset.tile_rects[local_id]
+
+    return tiles
+
+def _load_sheet_image(path: str) -> p3d.PNMImage:
+    """
+    Loads a sheet image with an alpha channel for packing
+    """
+
+    image = p3d.PNMImage()
+    if not image.read(p3d.Filename.from_os_specific(path)):
+        raise AtlasError('Failed to read tile sheet %s' % path)
+
+    if not image.has_alpha():
+        image.add_alpha()
+        image.alpha_fill(1.0)
+
+    return image
+
+def _blit_tile(page: p3d.PNMImage, image: p3d.PNMImage, x: int, y: int, rect: tuple, padding: int) -> None:
+    """
+    Copies a tile into the page and extrudes its edge pixels into
+    the surrounding padding
+    """
+
+    tile_x, tile_y, width, height = rect
+    page.copy_sub_image(image, x, y, tile_x, tile_y, width, height)
+
+    for offset in range(1, padding + 1):
+        page.copy_sub_image(page, x - offset, y, x, y, 1, height)
+        page.copy_sub_image(page, x + width - 1 + offset, y, x + width - 1, y, 1, height)
+
+    for offset in range(1, padding + 1):
+        page.copy_sub_image(page, x - padding, y - offset, x - padding, y, width + padding * 2, 1)
+        page.copy_sub_image(page, x - padding, y + height - 1 + offset, x - padding, y + height - 1, width + padding * 2, 1)
+
+def pack_atlas(tiles: dict, page_size: int = 1024, padding: int = 2) -> tuple:
+    """
+    Packs the tiles into uniform square pages. Every tile gets a cell sized
+    for the largest tile plus padding on each side. Returns the list of
+    page images and the remap table of (sheet path, local tile id) to
+    (page, tile_x, tile_y, count_x, count_y)
+    """
+
+    images = {}
+    rects = {}
+    for key, rect in tiles.items():
+        path = key[0]
+        if path not in images:
+            images[path] = _load_sheet_image(path)
+
+        if rect is None:
+            rect = (0, 0, images[path].get_x_size(), images[path].get_y_size())
+        rects[key] = tuple(int(value) for value in rect)
+
+    if not rects:
+        return [], {}
+
+    cell_size = max(max(rect[2], rect[3]) for rect in rects.values()) + padding * 2
+    cells_per_row = page_size // cell_size
+    if not cells_per_row:
+        raise AtlasError('Atlas page size %d is too small for %dpx tile cells' % (page_size, cell_size))
+
+    cells_per_page = cells_per_row * cells_per_row
+    page_count = int(math.ceil(len(rects) / cells_per_page))
+    pages = []
+    for page_index in range(page_count):
+        page = p3d.PNMImage(page_size, page_size, 4)
+        page.fill(0, 0, 0)
+        page.alpha_fill(0)
+        pages.append(page)
+
+    remap = {}
+    for index, key in enumerate(sorted(rects)):
+        page_index, cell = divmod(index, cells_per_page)
+        row, column = divmod(cell, cells_per_row)
+        x = column * cell_size + padding
+        y = row * cell_size + padding
+
+        rect = rects[key]
+        width, height = rect[2], rect[3]
+        _blit_tile(pages[page_index], images[key[0]], x, y, rect, padding)
+
+        # Tile positions are in tile units from the bottom left of the page,
+        # matching the tile visual table rows the tile layer shader reads
+        remap[key] = (
+            page_index,
+            x / width,
+            (page_size - (y + height)) / height,
+            page_size / width,
+            page_size / height)
+
+    return pages, remap
+
+def write_atlas(world_file: str, page_size: int = 1024, padding: int = 2) -> str:
+    """
+    Builds the tile atlas of a world file and writes it next to the
+    world file. Returns the written atlas metadata filename
+    """
+
+    filename = get_atlas_path(world_file)
+    atlas_directory = os.path.dirname(filename)
+    base_name = os.path.splitext(filename[:-len(ATLAS_EXTENSION)])[0]
+
+    tiles = {}
+    sources = [world_file]
+    for tmx_filename in get_world_maps(world_file):
+        tiled_map = tmx.TiledMap(tmx_filename)
+        collect_used_tiles(tiled_map, tiles)
+        sources.extend(source for source in qmap.get_map_sources(tiled_map) if source not in sources)
+
+    pages, remap = pack_atlas(tiles, page_size, padding)
+    sources.extend(sorted(set(key[0] for key in remap)))
+
+    page_files = []
+    for page_index, page in enumerate(pages):
+        page_filename = ATLAS_PAGE_FORMAT % (base_name, page_index)
+        if not page.write(p3d.Filename.from_os_specific(page_filename)):
+            raise AtlasError('Failed to write atlas page %s' % page_filename)
+        page_files.append(os.path.relpath(page_filename, atlas_directory))
+
+    metadata = {
+        'version': ATLAS_VERSION,
+        'page_size': page_size,
+        'padding': padding,
+        'pages': page_files,
+        'sources': [[os.path.relpath(source, atlas_directory), vfs.get_file_date(source)]
+            for source in sources],
+        'tiles': [[os.path.relpath(path, atlas_directory), tile_id] + list(location)
+            for (path, tile_id), location in sorted(remap.items())]
+    }
+
+    with io.open(filename, 'w') as f:
+        json.dump(metadata, f, separators=(',', ':'))
+
+    return filename
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+class TileAtlas(object):
+    """
+    Loaded tile atlas of a world. Remaps tile visual table rows to the
+    atlas pages and owns the texture array shared by every tile layer
+    """
+
+    def __init__(self, filename: str, metadata: dict):
+        atlas_directory = os.path.dirname(filename)
+
+        self._filename = filename
+        self._page_size = metadata['page_size']
+        self._pages = [vfs.fixed_join(atlas_directory, page) for page in metadata['pages']]
+        self._texture = None
+        self._remap = {}
+        for source, tile_id, *location in metadata['tiles']:
+            path = sheet.get_sheet_path(os.path.join(atlas_directory, source))
+            self._remap[(path, tile_id)] = tuple(location)
+
+    @property
+    def filename(self) -> str:
+        """
+        """
+
+        return self._filename
+
+    @property
+    def page_size(self) -> int:
+        """
+        """
+
+        return self._page_size
+
+    @property
+    def page_count(self) -> int:
+        """
+        """
+
+        return len(self._pages)
+
+    def get_location(self, sheet_path: str, tile_id: int) -> tuple:
+        """
+        Returns the (page, tile_x, tile_y, count_x, count_y) of a tile,
+        or None if the tile is not part of the atlas
+        """
+
+        return self._remap.get((sheet_path, tile_id), None)
+
+    def remap_rows(self, rows: np.ndarray, sheets: list) -> np.ndarray:
+        """
+        Rewrites tile visual table rows in place to point at the atlas
+        pages. Rows of tiles that are not in the atlas are left as is.
+        Returns a mask of the rows that are missing from the atlas
+        """
+
+        missing = np.zeros(len(rows), dtype=bool)
+        for index, row in enumerate(rows):
+            if not row['count_x']:
+                continue
+
+            location = self._remap.get((sheets[row['sheet']], int(row['tile_id'])), None)
+            if location is None:
+                missing[index] = True
+                continue
+
+            row['sheet'], row['tile_x'], row['tile_y'], row['count_x'], row['count_y'] = location
+
+        return missing
+
+    @property
+    def texture(self) -> p3d.Texture:
+        """
+        Texture array holding the atlas pages. Created on first use
+        """
+
+        if self._texture is None:
+            texture = p3d.Texture(os.path.basename(self._filename))
+            texture.setup_2d_texture_array(len(self._pages))
+            for page_index, page in enumerate(self._pages):
+                image = p3d.PNMImage()
+                if not image.read(p3d.Filename(page)):
+                    raise AtlasError('Failed to read atlas page %s' % page)
+                texture.load(image, z=page_index, n=0)
+
+            texture.set_magfilter(p3d.Texture.FTNearest)
+            texture.set_minfilter(p3d.Texture.FTNearest)
+            texture.set_wrap_u(p3d.Texture.WMClamp)
+            texture.set_wrap_v(p3d.Texture.WMClamp)
+            self._texture = texture
+
+        return self._texture
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+def read_atlas_metadata(filename: str) -> dict:
+    """
+    Reads the metadata of a tile atlas
+    """
+
+    metadata = json.loads(_vfs.read_file(p3d.Filename(filename), True).decode('utf-8'))
+    if metadata.get('version', None) != ATLAS_VERSION:
+        raise AtlasError('Unsupported atlas version in %s' % filename)
+
+    return metadata
+
+def is_atlas_up_to_date(filename: str, metadata: dict = None) -> bool:
+    """
+    Returns true if the atlas exists and none of its source
+    files have been modified since it was built
+    """
+
+    if not vfs.path_exists(filename):
+        return False
+
+    if metadata is None:
+        try:
+            metadata = read_atlas_metadata(filename)
+        except (AtlasError, ValueError):
+            return False
+
+    atlas_directory = os.path.dirname(filename)
+    for source, date in metadata['sources']:
+        source = vfs.fixed_join(atlas_directory, source)
+        if not vfs.path_exists(source) or vfs.get_file_date(source) > date:
+            return False
+
+    return True
+
+def load_atlas(world_file: str) -> TileAtlas:
+    """
+    Loads the tile atlas of a world file. Returns None when the world has
+    no atlas or its atlas is out of date
+    """
+
+    filename = get_atlas_path(world_file)
+    if not vfs.path_exists(filename):
+        return None
+
+    metadata = read_atlas_metadata(filename)
+    if not is_atlas_up_to_date(filename, metadata):
+        return None
+
+    return TileAtlas(filename, metadata)
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
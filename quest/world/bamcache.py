@@ -0,0 +1,191 @@
+"""
+On disk cache of the built geometry of world chunks. The finished tile layer
+GeomNodes of a chunk are written to a .bam file keyed by a hash of the chunk's
+TMX file, its external tilesets, its tile sheet images, the world's tile atlas
+and the builder version, so unchanged chunks are loaded instead of meshed.
+
+Textures and shaders are not written into the bam files. The layers record
+the sheets they sample as a tag and reapply their texture array and shader
+once loaded.
+Entries are evicted least recently used first once the cache directory
+exceeds its byte budget.
+"""
+
+from panda3d import core as p3d
+
+from quest.engine import core, prc
+from quest.framework import utilities
+from quest.world import qmap, builder, sheet
+
+import hashlib
+import os
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+BAM_EXTENSION = '.bam'
+
+_vfs = p3d.VirtualFileSystem.get_global_ptr()
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+class GeometryCache(core.QuestObject):
+    """
+    Directory of cached chunk geometry bam files
+    """
+
+    def __init__(self, directory: str, budget: int):
+        super().__init__()
+
+        self._directory = directory
+        self._budget = budget
+
+    @property
+    def directory(self) -> str:
+        """
+        """
+
+        return self._directory
+
+    @property
+    def budget(self) -> int:
+        """
+        Number of bytes the cached bam files may occupy
+        """
+
+        return self._budget
+
+    def get_key(self, tiled_map: object, tile_atlas: object = None) -> str:
+        """
+        Returns the cache key of a TiledMap's built geometry. A hash of the
+        builder version and the path, size and date of the map's source
+        files, its tile sheet images and the world's tile atlas. The files
+        themselves are not read, so keys are cheap to make per chunk load
+        """
+
+        digest = hashlib.sha1(b'%d' % builder.BUILDER_VERSION)
+        sources = qmap.get_map_sources(tiled_map)
+
+        # The tile visuals baked into the geometry depend on the sheet sizes
+        sources.extend(path for path in sheet.get_tile_visual_table(tiled_map).sheets if path not in sources)
+        if tile_atlas is not None:
+            sources.append(tile_atlas.filename)
+
+        for source in sources:
+            filename = p3d.Filename.from_os_specific(source)
+            digest.update(source.encode('utf-8'))
+            virtual_file = _vfs.get_file(filename)
+            if virtual_file is not None:
+                digest.update(b'%d:%d' % (virtual_file.get_file_size(), virtual_file.get_timestamp()))
+
+        return digest.hexdigest()
+
+    def get_path(self, key: str) -> str:
+        """
+        Returns the bam filename of a cache key
+        """
+
+        return os.path.join(self._directory, key + BAM_EXTENSION)
+
+    def __contains__(self, key: str) -> bool:
+        """
+        Returns true if the cache holds geometry for the key
+        """
+
+        return os.path.exists(self.get_path(key))
+
+    def load(self, key: str) -> p3d.NodePath:
+        """
+        Loads the cached geometry of a key. Returns None on a cache miss
+        """
+
+        filename = self.get_path(key)
+        if not os.path.exists(filename):
+            return None
+
+        loader = p3d.Loader.get_global_ptr()
+        node = loader.load_sync(p3d.Filename.from_os_specific(filename),
+            p3d.LoaderOptions(p3d.LoaderOptions.LF_no_cache | p3d.LoaderOptions.LF_report_errors))
+        if node is None:
+            self.notify.warning('Failed to load cached geometry %s. Removing it' % filename)
+            os.remove(filename)
+            return None
+
+        # Touch the entry so eviction keeps recently used geometry
+        os.utime(filename)
+        return p3d.NodePath(node)
+
+    def store(self, key: str, root: p3d.NodePath) -> bool:
+        """
+        Writes the geometry under root to the cache and evicts the least
+        recently used entries that no longer fit the budget
+        """
+
+        os.makedirs(self._directory, exist_ok=True)
+        filename = self.get_path(key)
+
+        # Write to a temporary file first so readers never see a partial bam
+        temp_filename = filename + '.tmp'
+        if not root.write_bam_file(p3d.Filename.from_os_specific(temp_filename)):
+            self.notify.warning('Failed to write cached geometry %s' % filename)
+            return False
+
+        os.replace(temp_filename, filename)
+        self.evict()
+
+        return True
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache
+        fits within its byte budget
+        """
+
+        if not os.path.isdir(self._directory):
+            return
+
+        entries = []
+        for name in os.listdir(self._directory):
+            if not name.endswith(BAM_EXTENSION):
+                continue
+
+            stat = os.stat(os.path.join(self._directory, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, name in sorted(entries):
+            if size <= self._budget:
+                break
+
+            os.remove(os.path.join(self._directory, name))
+            size -= entry_size
+
+    def clear(self) -> None:
+        """
+        Removes every cached entry
+        """
+
+        budget, self._budget = self._budget, 0
+        self.evict()
+        self._budget = budget
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+_geometry_cache = None
+
+def get_geometry_cache() -> GeometryCache:
+    """
+    Returns the process wide geometry cache, stored in the per user cache
+    directory unless the geometry-cache-directory PRC option is set. The
+    byte budget is read from the geometry-cache-budget PRC option, in
+    megabytes
+    """
+
+    global _geometry_cache
+    if _geometry_cache is None:
+        budget = prc.get_prc_int('geometry-cache-budget', 256) * 1024 * 1024
+        directory = prc.get_prc_string('geometry-cache-directory', '') or utilities.get_local_cache_path('geometry')
+        _geometry_cache = GeometryCache(directory, budget)
+
+    return _geometry_cache
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
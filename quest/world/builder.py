@@ -1,7 +1,22 @@
+from panda3d import core as p3d
+
 from quest.engine import core, prc, showbase
 from quest.engine import runtime, vfs
 from quest.framework import registry, utilities
 from quest.world import layer as layers
+from quest.world import tmx
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+# Version of the built layer geometry. Bump whenever the geometry the layer
+# nodes build changes so cached chunk geometry is no longer used
+BUILDER_VERSION = 5
+
+# Tile layer node classes by the value of the renderer layer property
+TILE_LAYER_RENDERERS = {
+    'mesh': layers.TiledTileLayerNode,
+    'texture': layers.TiledDataTextureLayerNode
+}
 
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
 
@@ -14,13 +29,81 @@ class WorldChunkBuilder(core.QuestObject):
 
         self._chunk = chunk
 
-    def generate(self, tiled_map: object) -> None:
+    def generate(self, tiled_map: object, cached_root: p3d.NodePath = None) -> None:
         """
+        Generates the layer nodes of the map. Layers with geometry under
+        cached_root adopt their cached geometry instead of being built
         """
 
-        #
+        # Chunked layers of infinite maps are streamed in
+        # by the world chunk as the viewer moves
         for layer in tiled_map.visible_layers:
-            self.generate_layer(layer)
+            if isinstance(layer, tmx.TiledChunkedTileLayer):
+                continue
+
+            cached_node = self.get_cached_node(cached_root, layer.name)
+            if cached_node is not None:
+                self.generate_cached_layer(layer, cached_node)
+            else:
+                self.generate_layer(layer)
+
+        self.generate_flattened_group(tiled_map)
+
+    def get_cached_node(self, cached_root: p3d.NodePath, layer_name: str) -> p3d.GeomNode:
+        """
+        Returns the cached GeomNode of a layer under cached_root, or None.
+        Matched by exact name, as layer names may contain characters that
+        are special to NodePath.find
+        """
+
+        if cached_root is None:
+            return None
+
+        for child in cached_root.get_children():
+            if child.get_name() == layer_name:
+                return child.node()
+
+        return None
+
+    def is_flattened(self, tiled_map: object, layer: object) -> bool:
+        """
+        Returns true if the layer is marked with the flatten property.
+        Layers without one use the flatten property of their map
+        """
+
+        return bool(layer.properties.get('flatten', tiled_map.properties.get('flatten', False)))
+
+    def generate_flattened_group(self, tiled_map: object) -> object:
+        """
+        Merges the flatten marked tile layer meshes of the map
+        into a single layer group
+        """
+
+        layer_nodes = []
+        for layer in tiled_map.visible_layers:
+            layer_inst = self._chunk.get_layer_by_name(layer.name)
+            if isinstance(layer_inst, layers.TiledTileLayerNode) and self.is_flattened(tiled_map, layer):
+                layer_nodes.append(layer_inst)
+
+        # A single layer is already drawn with a single Geom
+        if len(layer_nodes) < 2:
+            return None
+
+        group = layers.TiledFlattenedLayerGroup('Flattened', layer_nodes)
+        self._chunk.add_layer_group(group)
+
+        return group
+
+    def generate_cached_layer(self, layer: object, geom_node: p3d.GeomNode) -> object:
+        """
+        Generates a tile layer node that uses cached geometry
+        """
+
+        layer_inst = layers.TiledTileLayerNode(layer)
+        layer_inst.adopt_geometry(geom_node)
+        self._chunk.add_layer(layer.name, layer_inst)
+
+        return layer_inst
 
     def generate_layer(self, layer: object) -> None:
         """
@@ -37,7 +120,19 @@ class WorldChunkBuilder(core.QuestObject):
             return
 
         layer_cls = layer_types.get(layer.__class__.__name__, None)
+
+        # Tile layers pick their renderer with the renderer layer property
+        if layer_cls is layers.TiledTileLayerNode:
+            renderer = layer.properties.get('renderer', 'mesh')
+            if renderer not in TILE_LAYER_RENDERERS:
+                self.notify.warning('Unknown renderer %s for layer %s. Using mesh' % (renderer, layer.name))
+                renderer = 'mesh'
+
+            layer_cls = TILE_LAYER_RENDERERS[renderer]
+
         layer_inst = layer_cls(layer)
         self._chunk.add_layer(layer.name, layer_inst)
 
+        return layer_inst
+
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
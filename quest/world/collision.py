@@ -0,0 +1,238 @@
+"""
+Collision geometry built from the colliders of Tiled tiles. Tile colliders
+are rasterised into a solid mask per tile layer which is then merged into a
+small set of axis aligned rectangles using greedy meshing.
+
+Rectangles are expressed in tile units, matching the space the tile layer
+nodes are built in. They are exposed per chunk through GameWorldChunk.collision
+and as Panda3D collision solids through create_collision_node. The client has
+no collision traversal and the AI has no world model or pathing yet, so
+nothing consumes them so far.
+"""
+
+from panda3d import core as p3d
+
+from quest.world import tmx
+
+import numpy as np
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+def get_collider_stamps(tiled_map: object, subdivisions: int) -> tuple:
+    """
+    Rasterises the colliders of every tile into a subdivisions x subdivisions
+    stamp. Returns a GID to stamp lookup table and the stamps, stamp 0
+    being the empty stamp
+    """
+
+    lut = np.zeros(max(tiled_map.maxgid, 1), dtype=np.uint32)
+    stamps = [np.zeros((subdivisions, subdivisions), dtype=bool)]
+    flags_by_gid = {gid: flags for gids in tiled_map.gidmap.values() for gid, flags in gids}
+
+    # Cell centers within the tile as a fraction of the tile size
+    centers = (np.arange(subdivisions) + 0.5) / subdivisions
+
+    for gid, colliders in tiled_map.get_tile_colliders():
+        props = tiled_map.tile_properties[gid]
+        tile_width = props.get('width', tiled_map.tilewidth) or tiled_map.tilewidth
+        tile_height = props.get('height', tiled_map.tileheight) or tiled_map.tileheight
+
+        stamp = np.zeros((subdivisions, subdivisions), dtype=bool)
+        for obj in colliders:
+            left, top, right, bottom = tmx.TiledObjectIndex.get_object_bounds(obj)
+            columns = (centers * tile_width >= left) & (centers * tile_width < right)
+            rows = (centers * tile_height >= top) & (centers * tile_height < bottom)
+            stamp |= np.outer(rows, columns)
+
+        flags = flags_by_gid.get(gid, None)
+        if flags is not None:
+            if flags.flipped_diagonally:
+                stamp = stamp.T
+            if flags.flipped_horizontally:
+                stamp = stamp[:, ::-1]
+            if flags.flipped_vertically:
+                stamp = stamp[::-1, :]
+
+        if stamp.any() and gid < len(lut):
+            lut[gid] = len(stamps)
+            stamps.append(stamp)
+
+    return lut, np.array(stamps)
+
+def build_solid_mask(data: np.ndarray, lut: np.ndarray, stamps: np.ndarray) -> np.ndarray:
+    """
+    Builds the solid mask of a tile layer's GID array. Each tile
+    covers a block of stamp sized cells in the returned mask
+    """
+
+    height, width = data.shape
+    subdivisions = stamps.shape[1]
+    gids = np.minimum(data, len(lut) - 1)
+
+    mask = stamps[lut[gids]]
+    return mask.transpose(0, 2, 1, 3).reshape(height * subdivisions, width * subdivisions)
+
+def merge_rectangles(mask: np.ndarray) -> np.ndarray:
+    """
+    Merges the solid cells of a mask into axis aligned rectangles using
+    greedy meshing. Each solid run of a row is grown as wide as possible,
+    then downwards for as long as the rows below are solid across the
+    whole run. Returns an (N, 4) int32 array of x, y, width, height
+    """
+
+    mask = np.array(mask, dtype=bool)
+    height, width = mask.shape
+    rects = []
+
+    for y in range(height):
+        row = mask[y]
+        x = 0
+        while x < width:
+            solid = np.flatnonzero(row[x:])
+            if not len(solid):
+                break
+            x += int(solid[0])
+
+            empty = np.flatnonzero(~row[x:])
+            run = int(empty[0]) if len(empty) else width - x
+
+            run_height = 1
+            while y + run_height < height and mask[y + run_height, x:x + run].all():
+                run_height += 1
+
+            mask[y:y + run_height, x:x + run] = False
+            rects.append((x, y, run, run_height))
+            x += run
+
+    return np.array(rects, dtype=np.int32).reshape(-1, 4)
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+class CollisionGeometry(object):
+    """
+    Merged collision rectangles of the tile layers of a TiledMap. Rectangles
+    are built per layer the first time they are requested and cached until
+    invalidated
+    """
+
+    def __init__(self, tiled_map: object, subdivisions: int = 2):
+        self._tiled_map = tiled_map
+        self._subdivisions = subdivisions
+        self._stamps = None
+        self._layer_rects = {}
+        self._rects = None
+
+    @property
+    def subdivisions(self) -> int:
+        """
+        Number of mask cells along each side of a tile
+        """
+
+        return self._subdivisions
+
+    def _get_layer(self, layer: object) -> object:
+        """
+        Resolves a layer name into its TiledTileLayer. Chunked layers
+        of infinite maps have no collision geometry
+        """
+
+        if isinstance(layer, str):
+            layer = self._tiled_map.get_layer_by_name(layer)
+
+        if not isinstance(layer, tmx.TiledTileLayer):
+            raise ValueError('Layer %s is not a finite tile layer' % getattr(layer, 'name', layer))
+
+        return layer
+
+    def get_solid_mask(self, layer: object) -> np.ndarray:
+        """
+        Returns the solid mask of a tile layer
+        """
+
+        if self._stamps is None:
+            self._stamps = get_collider_stamps(self._tiled_map, self._subdivisions)
+
+        lut, stamps = self._stamps
+        return build_solid_mask(self._get_layer(layer).data, lut, stamps)
+
+    def get_layer_rects(self, layer: object) -> np.ndarray:
+        """
+        Returns the merged collision rectangles of a tile layer as an
+        (N, 4) float32 array of x, y, width, height in tiles
+        """
+
+        layer = self._get_layer(layer)
+        rects = self._layer_rects.get(layer.name, None)
+        if rects is None:
+            rects = merge_rectangles(self.get_solid_mask(layer)).astype(np.float32)
+            rects /= self._subdivisions
+            self._layer_rects[layer.name] = rects
+
+        return rects
+
+    def get_rects(self) -> np.ndarray:
+        """
+        Returns the merged collision rectangles of every tile layer
+        of the map. Chunked layers of infinite maps are not included
+        """
+
+        if self._rects is None:
+            rects = [self.get_layer_rects(layer) for layer in self._tiled_map.layers
+                if isinstance(layer, tmx.TiledTileLayer)]
+            self._rects = np.concatenate(rects) if rects else np.zeros((0, 4), dtype=np.float32)
+
+        return self._rects
+
+    def get_rects_in_rect(self, x: float, y: float, width: float, height: float) -> np.ndarray:
+        """
+        Returns the collision rectangles overlapping the requested
+        rectangle, in tiles
+        """
+
+        rects = self.get_rects()
+        overlapping = (
+            (rects[:, 0] < x + width) & (rects[:, 0] + rects[:, 2] > x) &
+            (rects[:, 1] < y + height) & (rects[:, 1] + rects[:, 3] > y))
+
+        return rects[overlapping]
+
+    def is_solid(self, x: float, y: float) -> bool:
+        """
+        Returns true if the point, in tiles, is inside
+        a collision rectangle
+        """
+
+        rects = self.get_rects()
+        return bool(np.any(
+            (rects[:, 0] <= x) & (rects[:, 0] + rects[:, 2] > x) &
+            (rects[:, 1] <= y) & (rects[:, 1] + rects[:, 3] > y)))
+
+    def invalidate(self, layer: object = None) -> None:
+        """
+        Drops the cached rectangles of a layer, or of every
+        layer when no layer is provided
+        """
+
+        self._stamps = None
+        self._rects = None
+        if layer is None:
+            self._layer_rects = {}
+        else:
+            self._layer_rects.pop(self._get_layer(layer).name, None)
+
+    def create_collision_node(self, name: str, layer: object = None) -> p3d.CollisionNode:
+        """
+        Creates a Panda3D collision node holding a collision box for each
+        merged rectangle of a layer, or of every layer
+        """
+
+        rects = self.get_rects() if layer is None else self.get_layer_rects(layer)
+        collision_node = p3d.CollisionNode(name)
+        for x, y, width, height in rects.tolist():
+            collision_node.add_solid(p3d.CollisionBox(
+                p3d.Point3(x, y, -0.5),
+                p3d.Point3(x + width, y + height, 0.5)))
+
+        return collision_node
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
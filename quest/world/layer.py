@@ -2,10 +2,126 @@ from panda3d import core as p3d
 
 from quest.engine import core, prc, showbase
 from quest.engine import runtime, vfs
-from quest.world import entity
+from quest.world import entity, sheet, scheduler
 
 import numpy as np
-import collections
+import threading
+import json
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+# Corner offsets of a tile quad, in vertex order. The tile layer shader
+# derives the texcoords of each corner from its vertex index
+TILE_CORNERS = np.array([[1, 1], [0, 1], [0, 0], [1, 0]], dtype=np.int16)
+TILE_INDEXES = np.array([0, 1, 3, 1, 2, 3], dtype=np.uint32)
+
+# Depth between the layers of a flattened layer group, in tiles
+FLATTEN_LAYER_DEPTH = 0.01
+
+# Interleaved vertex of the tile layer meshes. rect holds the tile's
+# (u, v, width, height) in its sheet, in 1 / TILE_RECT_SCALE units of
+# the texture, and order the layer's position in a flattened group
+TILE_VERTEX_DTYPE = np.dtype([
+    ('position', '<i2', (2,)),
+    ('rect', '<u2', (4,)),
+    ('sheet', 'u1'),
+    ('order', 'u1'),
+    ('animation', '<u2')])
+
+TILE_RECT_SCALE = 32768
+
+def build_tile_geometry(xs: np.ndarray, ys: np.ndarray, width: int, visuals: np.ndarray, sheets: np.ndarray,
+    quad_ids: np.ndarray = None, animations: np.ndarray = None) -> tuple:
+    """
+    Builds the quads of a set of tiles from their cell positions and tile
+    visual rows. Returns the TILE_VERTEX_DTYPE records of each tile's four
+    vertices and its six triangle indexes. Each tile's quad is its cell
+    index in the layer unless quad_ids are given
+    """
+
+    count = len(xs)
+    vertices = np.zeros((count, 4), dtype=TILE_VERTEX_DTYPE)
+    vertices['position'] = np.stack((xs, ys), axis=-1).astype(np.int16)[:, None, :] + TILE_CORNERS
+
+    # Tiles without a visual have no size in any sheet
+    counts = np.stack((visuals['count_x'], visuals['count_y']), axis=-1).astype(np.float64)
+    sizes = np.divide(1.0, counts, out=np.zeros_like(counts), where=counts != 0)
+    positions = np.stack((visuals['tile_x'], visuals['tile_y']), axis=-1) * sizes
+    rects = np.rint(np.concatenate((positions, sizes), axis=-1) * TILE_RECT_SCALE).astype(np.uint16)
+    vertices['rect'] = rects[:, None, :]
+
+    vertices['sheet'] = np.asarray(sheets, dtype=np.uint8)[:, None]
+    if animations is not None:
+        vertices['animation'] = np.asarray(animations, dtype=np.uint16)[:, None]
+
+    if quad_ids is None:
+        quad_ids = np.asarray(ys, dtype=np.uint32) * width + np.asarray(xs, dtype=np.uint32)
+    triangles = (np.asarray(quad_ids, dtype=np.uint32) * 4)[:, None] + TILE_INDEXES
+
+    return vertices, triangles
+
+def index_quads(data: np.ndarray) -> tuple:
+    """
+    Assigns a quad to each filled cell of the layer data in row order.
+    Returns the (height, width) cell to quad index, -1 for empty
+    cells, and the number of quads
+    """
+
+    filled = data != 0
+    quad_count = int(np.count_nonzero(filled))
+    quad_indexes = np.full(data.shape, -1, dtype=np.int32)
+    quad_indexes[filled] = np.arange(quad_count, dtype=np.int32)
+
+    return quad_indexes, quad_count
+
+def make_sheet_texture_array(sheets: list) -> p3d.Texture:
+    """
+    Loads a list of tile sheet images into a new texture array
+    """
+
+    sheet_collection = p3d.Texture()
+    sheet_collection.setup_2d_texture_array(len(sheets))
+    for sheet_index in range(len(sheets)):
+        sheet = sheets[sheet_index]
+        sheet_collection.load(sheet, z=sheet_index, n=0)
+
+    sheet_collection.set_magfilter(p3d.Texture.FTNearest)
+    sheet_collection.set_minfilter(p3d.Texture.FTNearest)
+    sheet_collection.set_wrap_u(p3d.Texture.WMClamp)
+    sheet_collection.set_wrap_v(p3d.Texture.WMClamp)
+
+    return sheet_collection
+
+def make_animation_texture(texels: np.ndarray) -> p3d.Texture:
+    """
+    Creates the animation texture of a tile layer from a (rows, columns, 4)
+    array of RGBA texels. Column 0 of each row holds the animation's
+    (frame count, duration, 0, 0) followed by a (tile_x, tile_y, sheet,
+    frame end time) texel per frame. Times are in seconds
+    """
+
+    if not len(texels):
+        texels = np.zeros((1, 1, 4), dtype=np.float32)
+
+    animation_texture = p3d.Texture('tile-animations')
+    animation_texture.setup_2d_texture(texels.shape[1], texels.shape[0], p3d.Texture.T_float, p3d.Texture.F_rgba32)
+    animation_texture.set_magfilter(p3d.Texture.FTNearest)
+    animation_texture.set_minfilter(p3d.Texture.FTNearest)
+
+    # Panda3D stores the channels of a ram image in BGRA order
+    animation_texture.set_ram_image(np.ascontiguousarray(texels[..., [2, 1, 0, 3]], dtype=np.float32).tobytes())
+
+    return animation_texture
+
+def load_tile_layer_shader() -> p3d.Shader:
+    """
+    Loads the shader of tile layer meshes
+    """
+
+    return p3d.Shader.load(
+        p3d.Shader.SL_GLSL,
+        vertex="shaders/tile_layer.vert.glsl", 
+        fragment="shaders/tile_layer.frag.glsl")
 
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
 
@@ -20,6 +136,9 @@ class TiledLayerNode(entity.Entity):
 
         self._layer = layer
         self._root = p3d.NodePath(layer.name)
+        self._built = False
+        self._build_callbacks = []
+        self._update_callbacks = []
 
     @property
     def name(self) -> str:
@@ -42,37 +161,87 @@ class TiledLayerNode(entity.Entity):
 
         return self._root
 
+    @property
+    def built(self) -> bool:
+        """
+        Returns true once the layer's geometry has been fully built
+        """
+
+        return self._built
+
+    def add_build_callback(self, callback: object) -> None:
+        """
+        Calls the callback with the layer node once its geometry
+        has been fully built
+        """
+
+        if self._built:
+            callback(self)
+        else:
+            self._build_callbacks.append(callback)
+
+    def add_update_callback(self, callback: object) -> None:
+        """
+        Calls the callback with the layer node each time its built
+        geometry is changed
+        """
+
+        self._update_callbacks.append(callback)
+
+    def _notify_updated(self) -> None:
+        """
+        Notifies the update callbacks of a change to the built geometry
+        """
+
+        for callback in list(self._update_callbacks):
+            callback(self)
+
+    def _finish_build(self) -> None:
+        """
+        Marks the layer as built and notifies its build callbacks
+        """
+
+        self._built = True
+        callbacks, self._build_callbacks = self._build_callbacks, []
+        for callback in callbacks:
+            callback(self)
+
     def setup(self) -> None:
         """
         """
 
         raise NotImplementedError('%s does not implement setup!' % self.__class__.__name__)
 
+    def create_cache_node(self) -> p3d.GeomNode:
+        """
+        Returns a copy of the layer's geometry for the geometry
+        cache. None for layers that are not cached
+        """
+
+        return None
+
     def destroy(self) -> None:
         """
         """
 
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
 
-class TiledTileLayerNode(TiledLayerNode):
+class TiledSheetLayerNode(TiledLayerNode):
     """
+    Base class of layer nodes that draw a tile layer's cells from the
+    tile sheets, or tile atlas, of its map
     """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self._change_queue = collections.deque()
-        self._vertex_format = self._make_vertex_format()
-        self._vertex_data = p3d.GeomVertexData(
-            self.name, self._vertex_format, p3d.Geom.UHStatic)
-        self._vertex_data.set_num_rows(self.tile_count * 4)
-
-        self._triangles = p3d.GeomTriangles(p3d.Geom.UH_static)
-        self._triangles.set_index_type(p3d.Geom.NT_uint32)
-        triangle_data = self._triangles.modify_vertices()
-        triangle_data.set_num_rows(self.tile_count * 6)
-        self._mesh = p3d.Geom(self._vertex_data)
+        self._visual_table = sheet.get_tile_visual_table(self._layer.parent)
+        self._use_atlas = self._visual_table.atlas is not None
+        self._sheet_collection = None
+        self._sheet_collection_count = 0
         self._sheets = []
+        self._sheet_paths = []
+        self._node = None
 
     @property
     def tile_count(self) -> int:
@@ -81,57 +250,418 @@ class TiledTileLayerNode(TiledLayerNode):
 
         return self._layer.width * self._layer.height
 
-    def _make_vertex_format(self) -> None:
+    @property
+    def uses_atlas(self) -> bool:
+        """
+        Returns true if the layer draws its tiles from the tile atlas
+        of its world rather than from its tile sheets
+        """
+
+        return self._use_atlas
+
+    def disable_atlas(self) -> None:
         """
+        Draws the layer from its tile sheets instead of the tile atlas
+        of its world, redrawing every tile
         """
 
-        vertex_format         = p3d.GeomVertexArrayFormat("vertex", 3, p3d.Geom.NT_float32, p3d.Geom.C_point)
-        normal_format         = p3d.GeomVertexArrayFormat("normal", 3, p3d.Geom.NT_float32, p3d.Geom.C_normal)
-        texcoord_format       = p3d.GeomVertexArrayFormat("texcoord", 2, p3d.Geom.NT_float32, p3d.Geom.C_texcoord)
+        if not self._use_atlas:
+            return
 
-        tile_position_format  = p3d.GeomVertexArrayFormat("frct_tilePosition", 2, p3d.Geom.NT_float32, p3d.Geom.C_point)
-        tile_count_format     = p3d.GeomVertexArrayFormat("frct_tileCount", 2, p3d.Geom.NT_float32, p3d.Geom.C_point)
-        tile_sheet_format     = p3d.GeomVertexArrayFormat("frct_tileSheet", 1, p3d.Geom.NT_float32, p3d.Geom.C_point)
+        self._use_atlas = False
+        self._handle_atlas_disabled()
+        self.update_tiles(*np.indices(self.layer.data.shape).reshape(2, -1))
 
-        geom_vertex_format = p3d.GeomVertexFormat()
-        geom_vertex_format.add_array(vertex_format)
-        geom_vertex_format.add_array(normal_format)
-        geom_vertex_format.add_array(texcoord_format)
+    def set_tile(self, x: int, y: int, gid: int) -> None:
+        """
+        Sets a single tile of the layer from a Tiled GID. See set_tiles
+        """
+
+        self.set_tiles((x, y, 1, 1), [gid])
+
+    def set_tiles(self, region: tuple, gids: object) -> None:
+        """
+        Sets the tiles of an (x, y, width, height) region of the layer from
+        Tiled GIDs, as stored in TMX layer data with their flip flags, given
+        row by row. The layer data is updated immediately and the changed
+        tiles are redrawn with the next frame's build work
+        """
+
+        x, y, width, height = region
+        raw_gids = np.asarray(gids, dtype=np.uint32).reshape(height, width)
+        ys, xs = self.layer.set_tiles(x, y, self.layer.parent.register_late_gids(raw_gids))
+        self.update_tiles(ys, xs)
+
+    def update_tiles(self, ys: np.ndarray, xs: np.ndarray) -> None:
+        """
+        Redraws the requested tiles from the current layer data
+        """
+
+        raise NotImplementedError('%s does not implement update_tiles!' % self.__class__.__name__)
 
-        geom_vertex_format.add_array(tile_position_format)
-        geom_vertex_format.add_array(tile_count_format)
-        geom_vertex_format.add_array(tile_sheet_format)
+    def _check_atlas(self, gids: np.ndarray) -> bool:
+        """
+        Stops the layer from using the tile atlas when any of the GIDs is
+        missing from it, as tiles placed after the atlas was built can
+        be. Returns true if the layer stopped using the atlas, in which
+        case the tiles it already drew must be redrawn
+        """
+
+        if not self._use_atlas or self._visual_table.in_atlas(gids).all():
+            return False
+
+        self.notify.info('Layer %s uses tiles missing from the tile atlas. Drawing it from its tile sheets' % self.name)
+        self._use_atlas = False
+        self._handle_atlas_disabled()
+
+        return True
+
+    def _handle_atlas_disabled(self) -> None:
+        """
+        Called once the layer stops using the tile atlas
+        """
+
+    def _get_visuals(self, gids: np.ndarray) -> np.ndarray:
+        """
+        Gathers the tile visual rows of the GIDs, addressing the tile
+        atlas while the layer uses it and the tile sheets otherwise
+        """
+
+        return self._visual_table.get_visuals(gids, self._use_atlas)
+
+    def _get_sheet_columns(self, visuals: np.ndarray) -> np.ndarray:
+        """
+        Returns the frct_tileSheet value of each tile visual. With a tile
+        atlas this is the tile's atlas page, otherwise the index of its
+        sheet in the layer's texture array
+        """
+
+        if self._use_atlas:
+            return visuals['sheet']
+
+        sheet_ids, inverse = np.unique(visuals['sheet'], return_inverse=True)
+        columns = np.zeros(len(sheet_ids), dtype=np.int32)
+        for index, sheet_id in enumerate(sheet_ids.tolist()):
+            sheet_image = self._visual_table.get_sheet_image(sheet_id)
+            if sheet_image not in self._sheets:
+                self._sheets.append(sheet_image)
+                self._sheet_paths.append(self._visual_table.sheets[sheet_id])
+            columns[index] = self._sheets.index(sheet_image)
+
+        return columns[inverse.reshape(-1)]
+
+    def _get_layer_texture(self) -> p3d.Texture:
+        """
+        Returns the texture array the layer samples. A new texture array is
+        created when sheets were added, so a texture that may be drawn is
+        never modified
+        """
+
+        # Layers of worlds with a tile atlas all share the atlas texture array
+        if self._use_atlas:
+            return self._visual_table.atlas.texture
+
+        sheets = list(self._sheets)
+        if self._sheet_collection is None or self._sheet_collection_count != len(sheets):
+            self._sheet_collection = make_sheet_texture_array(sheets)
+            self._sheet_collection_count = len(sheets)
+
+        return self._sheet_collection
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+class TiledTileLayerNode(TiledSheetLayerNode):
+    """
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._scheduler = scheduler.get_build_scheduler()
+        self._threaded = prc.get_prc_bool('want-threaded-tilemap', False)
+        self._vertex_format = self._make_vertex_format()
+
+        # Sparse layers only allocate quads for their filled cells
+        density = prc.get_prc_double('sparse-tilemap-density', 0.5)
+        self._sparse = np.count_nonzero(self._layer.data) < density * self.tile_count
+        self._quad_indexes = None
+        self._quad_count = self.tile_count
+        self._free_quads = []
+        if self._sparse:
+            self._quad_indexes, self._quad_count = index_quads(self._layer.data)
+
+        self._vertex_data, self._triangles, self._mesh = self._create_geometry(self._quad_count)
+
+        self._build_lock = threading.Lock()
+        self._requested_data = None
+        self._edited_tiles = None
+
+        # Quads rewritten since pop_changed_quads was last called. None
+        # when the whole geometry was replaced
+        self._changed_quads = None
+
+        # Animated GIDs map to a 1 based row of the layer's animation texture
+        self._animation_rows = np.zeros(0, dtype=np.uint16)
+        self._animation_frames = []
+        self._animation_texture = None
+
+    @property
+    def sparse(self) -> bool:
+        """
+        Returns true if the layer only has quads for its filled cells
+        """
+
+        return self._sparse
+
+    @property
+    def quad_count(self) -> int:
+        """
+        Number of quads allocated in the layer's vertex data
+        """
+
+        return self._quad_count
+
+    def pop_changed_quads(self) -> np.ndarray:
+        """
+        Returns the quads rewritten since the last call, or None if the
+        layer's whole geometry was built or replaced in the meantime
+        """
+
+        changed_quads, self._changed_quads = self._changed_quads, []
+        if changed_quads is None:
+            return None
+
+        return np.unique(np.concatenate(changed_quads)) if changed_quads else np.zeros(0, dtype=np.intp)
+
+    def _make_vertex_format(self) -> None:
+        """
+        Registers the single interleaved array vertex format of
+        TILE_VERTEX_DTYPE. Texcoords are derived in the shader
+        """
+
+        array_format = p3d.GeomVertexArrayFormat()
+        array_format.add_column("vertex", 2, p3d.Geom.NT_int16, p3d.Geom.C_point, 0, 2)
+        array_format.add_column("frct_tileRect", 4, p3d.Geom.NT_uint16, p3d.Geom.C_other, 4, 2)
+        array_format.add_column("frct_tileSheet", 2, p3d.Geom.NT_uint8, p3d.Geom.C_other, 12, 1)
+        array_format.add_column("frct_tileAnimation", 1, p3d.Geom.NT_uint16, p3d.Geom.C_other, 14, 2)
+        assert array_format.get_stride() == TILE_VERTEX_DTYPE.itemsize
+
+        geom_vertex_format = p3d.GeomVertexFormat()
+        geom_vertex_format.add_array(array_format)
         
         return_geom_vertex_format = \
             p3d.GeomVertexFormat.register_format(geom_vertex_format)
         
         return return_geom_vertex_format
 
+    def _create_geometry(self, quad_count: int) -> tuple:
+        """
+        Creates empty vertex data, triangles and Geom sized for quad_count quads
+        """
+
+        vertex_data = p3d.GeomVertexData(
+            self.name, self._vertex_format, p3d.Geom.UHStatic)
+        vertex_data.set_num_rows(quad_count * 4)
+
+        triangles = p3d.GeomTriangles(p3d.Geom.UH_static)
+        triangles.set_index_type(p3d.Geom.NT_uint32)
+        triangle_data = triangles.modify_vertices()
+        triangle_data.set_num_rows(quad_count * 6)
+
+        return vertex_data, triangles, p3d.Geom(vertex_data)
+
     def setup(self) -> None:
         """
+        Schedules the layer's geometry creation followed by its tiles
+        in batches of rows. With want-threaded-tilemap the layer is built
+        on the tile layer task chain instead. Layers that adopted cached
+        geometry are not built
         """
 
-        self.activate()
-        self._change_queue.append((self._draw_initial_geometry, []))
+        if self._built:
+            return
 
-        for x, y, tile_vis_data in self.layer.tiles():
-            self._change_queue.append((
-                self._handle_tile_draw, (x, y, tile_vis_data)))
+        if self._threaded:
+            self._request_build()
+            return
 
-    async def tick(self, dt: float) -> None:
+        self._scheduler.schedule(self, self.get_build_steps(self._scheduler.batch_size))
+
+    def get_build_steps(self, batch_size: int) -> list:
         """
+        Returns the ordered build steps of the layer. The geometry is
+        created first and its tiles are then built batch_size tiles,
+        rounded to whole rows, at a time. Sparse layers count only
+        their filled cells
         """
 
-        # Apply any remaining changes
-        if self._change_queue:
-            change_func, change_data = self._change_queue.pop()
-            change_func(*change_data)
+        steps = [(self._draw_initial_geometry, ())]
+        if self._quad_indexes is not None:
+            filled = np.cumsum(np.count_nonzero(self._quad_indexes >= 0, axis=1))
+            y = 0
+            while y < self.layer.height:
+                built = int(filled[y - 1]) if y else 0
+                stop = max(y + 1, int(np.searchsorted(filled, built + batch_size, side='right')))
+                steps.append((self._build_row_range, (y, min(stop, self.layer.height))))
+                y = stop
+        else:
+            rows = max(1, batch_size // max(1, self.layer.width))
+            for y in range(0, self.layer.height, rows):
+                steps.append((self._build_row_range, (y, min(y + rows, self.layer.height))))
+
+        steps.append((self._finish_build, ()))
+        return steps
 
     def destroy(self) -> None:
         """
         """
 
-        self.destroy()
+        self.deactivate()
+        self._scheduler.cancel(self)
+        self._edited_tiles = None
+        self._root.remove_node()
+
+    def update_tiles(self, ys: np.ndarray, xs: np.ndarray) -> None:
+        """
+        Redraws the requested tiles from the current layer data. Updates
+        requested within a frame are coalesced and only the vertex rows of
+        the touched tiles are rewritten, after any build work that is
+        already queued
+        """
+
+        if not len(ys):
+            return
+
+        # A threaded build in flight may have snapshotted older layer data
+        if self._threaded and not self._built:
+            self._request_build()
+            return
+
+        if self._edited_tiles is None:
+            self._edited_tiles = np.zeros(self.layer.data.shape, dtype=bool)
+            self._scheduler.schedule(self, [(self._flush_tile_edits, ())])
+
+        self._edited_tiles[ys, xs] = True
+
+    def _flush_tile_edits(self) -> None:
+        """
+        Redraws every tile edited since the last flush
+        """
+
+        edited_tiles, self._edited_tiles = self._edited_tiles, None
+        ys, xs = np.nonzero(edited_tiles)
+        self._handle_tiles_update(xs, ys)
+        if self._built:
+            self._notify_updated()
+
+    def _request_build(self) -> None:
+        """
+        Requests a threaded build of the layer from a snapshot of its
+        current data. The sheets and animations the layer uses are
+        registered here so the worker thread never touches the shared
+        sheet cache
+        """
+
+        self._register_tiles(self.layer.data)
+
+        # Without a task manager the build is run by calling tick. The
+        # task is activated under the lock so tick cannot drop the request
+        with self._build_lock:
+            self._requested_data = self.layer.data.copy()
+            if runtime.has_task_mgr():
+                self.activate()
+
+    async def tick(self, dt: float) -> None:
+        """
+        Builds the requested layer geometry on the tile layer task chain.
+        The finished geometry is handed to the main thread to be swapped
+        in place of the current one. The task stops once the request is
+        taken and is activated again by the next request
+        """
+
+        with self._build_lock:
+            data, self._requested_data = self._requested_data, None
+            self.deactivate()
+
+        if data is not None:
+            self._scheduler.hand_over(self, self._swap_geometry, self._build_detached(data))
+
+    def _build_detached(self, data: np.ndarray) -> tuple:
+        """
+        Builds the geometry of the layer data into new vertex data,
+        triangles and Geom that are not part of the scene graph. The
+        GeomNode and its render state are left to the main thread
+        """
+
+        quad_indexes, quad_count = index_quads(data) if self._sparse else (None, self.tile_count)
+        vertex_data, triangles, mesh = self._create_geometry(quad_count)
+        self._write_rows(vertex_data, triangles, data, 0, quad_indexes)
+        mesh.add_primitive(triangles)
+
+        return vertex_data, triangles, mesh, quad_indexes, quad_count
+
+    def _swap_geometry(self, vertex_data: p3d.GeomVertexData, triangles: p3d.GeomTriangles,
+        mesh: p3d.Geom, quad_indexes: np.ndarray, quad_count: int) -> None:
+        """
+        Replaces the layer's drawn geometry with a detached build
+        """
+
+        if self._root.is_empty():
+            return
+
+        node = self._root.attach_new_node(self._create_geom_node(mesh))
+        if self._node is not None:
+            self._node.remove_node()
+
+        self._node = node
+        self._vertex_data, self._triangles, self._mesh = vertex_data, triangles, mesh
+        self._quad_indexes, self._quad_count, self._free_quads = quad_indexes, quad_count, []
+        self._changed_quads = None
+        if self._built:
+            self._notify_updated()
+        else:
+            self._finish_build()
+
+    def create_cache_node(self) -> p3d.GeomNode:
+        """
+        Returns a copy of the layer's GeomNode for the geometry cache. The
+        texture and shader are replaced by a tag listing the layer's sheets
+        """
+
+        geom_node = self._node.node().make_copy()
+        geom_node.set_state(geom_node.get_state().remove_attrib(p3d.TextureAttrib).remove_attrib(p3d.ShaderAttrib))
+        geom_node.set_tag('sheets', json.dumps(self._sheet_paths))
+        geom_node.set_tag('sparse', '1' if self._sparse else '0')
+        geom_node.set_tag('atlas', '1' if self._use_atlas else '0')
+
+        return geom_node
+
+    def adopt_geometry(self, geom_node: p3d.GeomNode) -> None:
+        """
+        Draws a cached GeomNode created by create_cache_node instead
+        of building the layer's geometry
+        """
+
+        self._use_atlas = self._use_atlas and geom_node.get_tag('atlas') == '1'
+        for path in json.loads(geom_node.get_tag('sheets') or '[]'):
+            sheet_image = self._visual_table.get_sheet_image(self._visual_table.add_sheet(path))
+            self._sheets.append(sheet_image)
+            self._sheet_paths.append(path)
+
+        self._mesh = geom_node.modify_geom(0)
+        self._vertex_data = self._mesh.modify_vertex_data()
+        self._triangles = self._mesh.modify_primitive(0)
+
+        # The cached geometry was built with its quads in row order
+        self._sparse = geom_node.get_tag('sparse') == '1'
+        self._quad_indexes, self._quad_count, self._free_quads = None, self.tile_count, []
+        if self._sparse:
+            self._quad_indexes, self._quad_count = index_quads(self.layer.data)
+
+        self._register_tiles(self.layer.data)
+        self._apply_render_state(geom_node)
+        self._node = self._root.attach_new_node(geom_node)
+        self._finish_build()
 
     def _get_tile_index(self, index: tuple) -> int:
         """
@@ -139,126 +669,734 @@ class TiledTileLayerNode(TiledLayerNode):
 
         return index[1] * self.layer.width + index[0]
 
+    def _register_tiles(self, gids: np.ndarray) -> bool:
+        """
+        Registers the sheets and animations of the GIDs with the layer.
+        Run on the main thread before the GIDs are built. Returns true if
+        a GID missing from the tile atlas stopped the layer from using it
+        """
+
+        use_atlas = self._use_atlas
+        gids = np.unique(gids)
+        gids = gids[gids != 0]
+        self._check_atlas(gids)
+        self._get_sheet_columns(self._get_visuals(gids))
+        self._register_animations(gids)
+
+        return use_atlas and not self._use_atlas
+
+    def _handle_atlas_disabled(self) -> None:
+        """
+        Registers the sheets of every tile the layer registered while
+        it used the tile atlas
+        """
+
+        frame_gids = [frame.gid for frames in self._animation_frames for frame in frames]
+        gids = np.unique(np.concatenate((self.layer.data.ravel(), np.array(frame_gids, dtype=self.layer.data.dtype))))
+        self._get_sheet_columns(self._get_visuals(gids[gids != 0]))
+        self._animation_texture = None
+
+    def _register_animations(self, gids: np.ndarray) -> None:
+        """
+        Adds a row to the layer's animation table for each
+        animated GID that does not have one yet
+        """
+
+        tile_properties = self.layer.parent.tile_properties
+        for gid in gids.tolist():
+            if gid < len(self._animation_rows) and self._animation_rows[gid]:
+                continue
+
+            frames = tile_properties.get(gid, {}).get('frames', None)
+            if not frames:
+                continue
+
+            if gid >= len(self._animation_rows):
+                self._animation_rows = np.concatenate((
+                    self._animation_rows, np.zeros(self.layer.parent.maxgid + 1 - len(self._animation_rows), dtype=np.uint16)))
+
+            # Frame tiles may come from sheets the layer does not draw otherwise
+            frame_gids = np.array([frame.gid for frame in frames])
+            self._check_atlas(frame_gids)
+            self._get_sheet_columns(self._get_visuals(frame_gids))
+            self._animation_frames.append(list(frames))
+            self._animation_rows[gid] = len(self._animation_frames)
+            self._animation_texture = None
+
+    def _get_animation_rows(self, gids: np.ndarray) -> np.ndarray:
+        """
+        Returns the frct_tileAnimation value of each GID. 0 for GIDs
+        that are not animated
+        """
+
+        gids = np.asarray(gids)
+        rows = np.zeros(len(gids), dtype=np.uint16)
+        known = gids < len(self._animation_rows)
+        rows[known] = self._animation_rows[gids[known]]
+
+        return rows
+
+    def _get_animation_texels(self) -> np.ndarray:
+        """
+        Returns the RGBA texels of the layer's animation texture.
+        See make_animation_texture
+        """
+
+        columns = 1 + max((len(frames) for frames in self._animation_frames), default=0)
+        texels = np.zeros((len(self._animation_frames), columns, 4), dtype=np.float32)
+        for row, frames in enumerate(self._animation_frames):
+            frame_gids = np.array([frame.gid for frame in frames])
+            visuals = self._get_visuals(frame_gids)
+            end_times = np.cumsum([frame.duration for frame in frames]) / 1000.0
+
+            texels[row, 0, :2] = len(frames), end_times[-1]
+            texels[row, 1:len(frames) + 1] = np.stack((
+                visuals['tile_x'], visuals['tile_y'], self._get_sheet_columns(visuals), end_times), axis=-1)
+
+        return texels
+
+    def _get_animation_texture(self) -> p3d.Texture:
+        """
+        Returns the texture holding the layer's animation table. A new
+        texture is created when animations were added
+        """
+
+        if self._animation_texture is None:
+            self._animation_texture = make_animation_texture(self._get_animation_texels())
+
+        return self._animation_texture
+
+    def _build_layer_geometry(self) -> None:
+        """
+        Builds the geometry of every tile in the layer at once
+        """
+
+        self._build_row_range(0, self.layer.height)
+
+    def _build_row_range(self, start: int, stop: int) -> None:
+        """
+        Builds the geometry of the tiles in rows start to stop. The rows
+        are contiguous in every array, so each array is written with
+        a single buffer copy
+        """
+
+        self._write_rows(self._vertex_data, self._triangles, self.layer.data[start:stop], start, self._quad_indexes)
+
+    def _write_rows(self, vertex_data: p3d.GeomVertexData, triangles: p3d.GeomTriangles, data: np.ndarray, start: int,
+        quad_indexes: np.ndarray = None) -> None:
+        """
+        Writes the geometry of a block of layer rows, starting at row
+        start, into the vertex data and triangles. Sparse layers pass
+        their cell to quad index
+        """
+
+        if quad_indexes is not None:
+            rows = quad_indexes[start:start + len(data)]
+            ys, xs = np.nonzero(rows >= 0)
+            quad_ids = rows[ys, xs]
+            gids = data[ys, xs]
+            visuals = self._get_visuals(gids)
+            self._write_quads(vertex_data, triangles, quad_ids, build_tile_geometry(
+                xs, ys + start, self.layer.width, visuals, self._get_sheet_columns(visuals), quad_ids,
+                self._get_animation_rows(gids)))
+            return
+
+        ys, xs = np.nonzero(data)
+        gids = data[ys, xs]
+        visuals = self._get_visuals(gids)
+        geometry = build_tile_geometry(xs, ys + start, self.layer.width, visuals, self._get_sheet_columns(visuals),
+            animations=self._get_animation_rows(gids))
+
+        face_ids = ys * self.layer.width + xs
+        range_count = data.size
+        tile_vertices, tile_triangles = geometry
+        range_data = np.zeros((range_count, 4), dtype=TILE_VERTEX_DTYPE)
+        range_data[face_ids] = tile_vertices
+        self._write_range(vertex_data.modify_array(0), start * self.layer.width, range_data)
+
+        triangle_data = np.zeros((range_count, 6), dtype=np.uint32)
+        triangle_data[face_ids] = tile_triangles
+        self._write_range(triangles.modify_vertices(), start * self.layer.width, triangle_data)
+
+    def _write_range(self, array_data: p3d.GeomVertexArrayData, first_tile: int, range_data: np.ndarray) -> None:
+        """
+        Copies the per tile values of a range of tiles into an array
+        """
+
+        tile_stride = range_data[:1].nbytes
+        view = memoryview(array_data).cast('B')
+        view[first_tile * tile_stride:first_tile * tile_stride + range_data.nbytes] = range_data.view('u1').reshape(-1)
+        del view
+
+    def _write_quads(self, vertex_data: p3d.GeomVertexData, triangles: p3d.GeomTriangles, quad_ids: np.ndarray,
+        geometry: tuple) -> None:
+        """
+        Writes built tile geometry to the requested quads in place
+        """
+
+        quad_count = vertex_data.get_num_rows() // 4
+        tile_vertices, tile_triangles = geometry
+        array_view = np.frombuffer(vertex_data.modify_array(0), dtype=TILE_VERTEX_DTYPE)
+        array_view.reshape(quad_count, 4)[quad_ids] = tile_vertices
+        del array_view
+
+        triangle_view = np.frombuffer(triangles.modify_vertices(), dtype=np.uint32)
+        triangle_view.reshape(quad_count, 6)[quad_ids] = tile_triangles
+        del triangle_view
+
+    def _clear_quads(self, quad_ids: np.ndarray) -> None:
+        """
+        Zeroes the requested quads of the layer. Their triangles
+        collapse so they are no longer drawn
+        """
+
+        for array_index in range(self._vertex_data.get_num_arrays()):
+            array_view = np.frombuffer(self._vertex_data.modify_array(array_index), dtype=np.uint8)
+            array_view.reshape(self._quad_count, -1)[quad_ids] = 0
+            del array_view
+
+        triangle_view = np.frombuffer(self._triangles.modify_vertices(), dtype=np.uint32)
+        triangle_view.reshape(self._quad_count, 6)[quad_ids] = 0
+        del triangle_view
+
+    def _allocate_quads(self, xs: np.ndarray, ys: np.ndarray, drawn: np.ndarray) -> np.ndarray:
+        """
+        Updates the cell to quad index of a sparse layer for edited cells.
+        Cleared cells release their quads and newly drawn cells take free
+        quads, growing the vertex data when none are left. Returns the
+        quad of each cell, -1 for empty cells that never had one
+        """
+
+        quad_ids = self._quad_indexes[ys, xs]
+        released = ~drawn & (quad_ids >= 0)
+        self._free_quads.extend(quad_ids[released].tolist())
+        self._quad_indexes[ys[released], xs[released]] = -1
+
+        missing = drawn & (quad_ids < 0)
+        missing_count = int(np.count_nonzero(missing))
+        if missing_count > len(self._free_quads):
+            self._grow_quads(missing_count - len(self._free_quads))
+
+        if missing_count:
+            quad_ids[missing] = self._free_quads[-missing_count:]
+            del self._free_quads[-missing_count:]
+            self._quad_indexes[ys[missing], xs[missing]] = quad_ids[missing]
+
+        return quad_ids
+
+    def _grow_quads(self, count: int) -> None:
+        """
+        Adds at least count free quads to a sparse layer's geometry. The
+        capacity at least doubles so repeated edits grow it rarely
+        """
+
+        quad_count = max(self._quad_count + count, self._quad_count * 2)
+        self._vertex_data.set_num_rows(quad_count * 4)
+        self._triangles.modify_vertices().set_num_rows(quad_count * 6)
+
+        self._free_quads.extend(range(quad_count - 1, self._quad_count - 1, -1))
+        self._quad_count = quad_count
+
+    def _create_geom_node(self, mesh: p3d.Geom) -> p3d.GeomNode:
+        """
+        Creates the layer's GeomNode for a mesh with its texture
+        and shader applied
+        """
+
+        assert mesh.check_valid(), 'A meshing error occured and the geometry was invalid'
+        geom_node = p3d.GeomNode(self.name)
+        geom_node.add_geom(mesh)
+        geom_node.set_attrib(
+            p3d.TransparencyAttrib.make(p3d.TransparencyAttrib.MAlpha))
+        self._apply_render_state(geom_node)
+
+        return geom_node
+
+    def _apply_render_state(self, geom_node: p3d.GeomNode) -> None:
+        """
+        Applies the layer's texture array and shader to its GeomNode
+        """
+
+        node = p3d.NodePath(geom_node)
+        node.set_texture(self._get_layer_texture(), 0)
+        node.set_shader(load_tile_layer_shader())
+        node.set_shader_input('tileAnimations', self._get_animation_texture())
+        node.set_shader_input('layerDepth', FLATTEN_LAYER_DEPTH)
+
     def _draw_initial_geometry(self) -> None:
         """
         """
 
         self._mesh.add_primitive(self._triangles)
-
         p3d.Thread.consider_yield()
-        assert self._mesh.check_valid(), 'A meshing error occured and the geometry was invalid'
+
+        # Register every sheet the layer uses before its texture array is loaded
+        self._register_tiles(self.layer.data)
+        self._node = self.root.attach_new_node(self._create_geom_node(self._mesh))
+
+    def _handle_tiles_update(self, xs: np.ndarray, ys: np.ndarray) -> None:
+        """
+        Draws or clears each of the tiles at xs, ys in place
+        """
+
+        # Tiles from a sheet or animation the layer did not use yet need new textures
+        sheet_collection = self._sheet_collection
+        animation_texture = self._animation_texture
+        if self._register_tiles(self.layer.data[ys, xs]):
+            # Tiles drawn from the tile atlas are redrawn from their sheets
+            ys, xs = np.indices(self.layer.data.shape).reshape(2, -1)
+
+        gids = self.layer.data[ys, xs]
+        drawn = gids != 0
+        if self._quad_indexes is not None:
+            quad_ids = self._allocate_quads(xs, ys, drawn)
+        else:
+            quad_ids = ys * self.layer.width + xs
+
+        visuals = self._get_visuals(gids[drawn])
+        geometry = build_tile_geometry(
+            xs[drawn], ys[drawn], self.layer.width, visuals, self._get_sheet_columns(visuals), quad_ids[drawn],
+            self._get_animation_rows(gids[drawn]))
+
+        texture = self._get_layer_texture()
+        if self._node is not None and texture is not sheet_collection and not self._use_atlas:
+            self._node.set_texture(texture, 0)
+        if self._node is not None and self._get_animation_texture() is not animation_texture:
+            self._node.set_shader_input('tileAnimations', self._animation_texture)
+
+        # Cleared first, as a released sparse quad may be reused by a drawn tile
+        cleared = quad_ids[~drawn]
+        self._clear_quads(cleared[cleared >= 0])
+        self._write_quads(self._vertex_data, self._triangles, quad_ids[drawn], geometry)
+        if self._changed_quads is not None:
+            self._changed_quads.append(quad_ids[quad_ids >= 0])
+
+        # Edited tiles may lie outside of the mesh's current bounds
+        self._mesh.mark_bounds_stale()
+        if self._node is not None:
+            self._node.node().mark_bounds_stale()
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+# Number of GIDs per row pair of a data texture layer's tile visual texture
+TILE_VISUAL_COLUMNS = 256
+
+class TiledDataTextureLayerNode(TiledSheetLayerNode):
+    """
+    Draws a tile layer as a single quad. The layer's GIDs are uploaded as
+    an integer data texture and the fragment shader looks up each cell's
+    tile visual from a second texture holding one row pair per GID:
+    (tile_x, tile_y, count_x, count_y) followed by (sheet, 0, 0, 0).
+    Selected with the renderer layer property set to texture
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._data_texture = None
+        self._visual_texture = None
+        self._visual_gids = np.zeros(0, dtype=np.uint32)
+
+    @property
+    def data_texture(self) -> p3d.Texture:
+        """
+        Single channel unsigned integer texture of the layer's GIDs,
+        one texel per cell
+        """
+
+        return self._data_texture
+
+    @property
+    def visual_texture(self) -> p3d.Texture:
+        """
+        Float texture of the tile visuals of the layer's GIDs
+        """
+
+        return self._visual_texture
+
+    def setup(self) -> None:
+        """
+        Creates the layer's data textures and draws its quad
+        """
+
+        if self._built:
+            return
+
+        self._check_atlas(self.layer.data)
+        self._data_texture = self._make_data_texture()
+        self._visual_texture = self._make_visual_texture()
+        self._node = self.root.attach_new_node(self._create_geom_node())
+        self._finish_build()
+
+    def destroy(self) -> None:
+        """
+        """
+
+        self._root.remove_node()
+
+    def update_tiles(self, ys: np.ndarray, xs: np.ndarray) -> None:
+        """
+        Writes the requested cells of the current layer data into the data
+        texture. Panda3D uploads the texture once before the next frame is
+        drawn, so edits within a frame are coalesced
+        """
+
+        if not len(ys) or self._data_texture is None:
+            return
+
+        data_view = np.frombuffer(self._data_texture.modify_ram_image(), dtype=np.uint32)
+        data_view.reshape(self.layer.data.shape)[ys, xs] = self.layer.data[ys, xs]
+        del data_view
+
+        # GIDs the layer did not use yet need their tile visuals written
+        gids = self.layer.data[ys, xs]
+        sheet_collection = self._sheet_collection
+        if self._check_atlas(gids) or not np.isin(gids[gids != 0], self._visual_gids).all():
+            self._visual_texture = self._make_visual_texture()
+            self._node.set_shader_input('tileVisuals', self._visual_texture)
+
+        texture = self._get_layer_texture()
+        if texture is not sheet_collection and not self._use_atlas:
+            self._node.set_texture(texture, 0)
+
+    def _handle_atlas_disabled(self) -> None:
+        """
+        Marks the tile visuals of the layer's GIDs as stale, as they
+        were written for the tile atlas
+        """
+
+        self._visual_gids = np.zeros(0, dtype=np.uint32)
+
+    def _make_data_texture(self) -> p3d.Texture:
+        """
+        Creates the layer's GID data texture
+        """
+
+        data_texture = p3d.Texture('%s-data' % self.name)
+        data_texture.setup_2d_texture(self.layer.width, self.layer.height, p3d.Texture.T_unsigned_int, p3d.Texture.F_r32i)
+        data_texture.set_magfilter(p3d.Texture.FTNearest)
+        data_texture.set_minfilter(p3d.Texture.FTNearest)
+        data_texture.set_wrap_u(p3d.Texture.WMClamp)
+        data_texture.set_wrap_v(p3d.Texture.WMClamp)
+
+        # Texel row y holds layer row y, matching the tile layer quads
+        data_texture.set_ram_image(np.ascontiguousarray(self.layer.data, dtype=np.uint32).tobytes())
+
+        return data_texture
+
+    def _make_visual_texture(self) -> p3d.Texture:
+        """
+        Creates the tile visual texture of the GIDs the layer uses. Every
+        GID the layer's map knows about has a row pair
+        """
+
+        gids = np.unique(self.layer.data)
+        gids = gids[gids != 0]
+        visuals = self._get_visuals(gids)
+
+        gid_count = max(self.layer.parent.maxgid, int(gids.max()) + 1 if len(gids) else 1)
+        columns = min(gid_count, TILE_VISUAL_COLUMNS)
+        row_pairs = -(-gid_count // columns)
+
+        # Panda3D stores the channels of a ram image in BGRA order
+        texels = np.zeros((row_pairs, 2, columns, 4), dtype=np.float32)
+        rows, gid_columns = np.divmod(gids, columns)
+        texels[rows, 0, gid_columns] = np.stack(
+            (visuals['count_x'], visuals['tile_y'], visuals['tile_x'], visuals['count_y']), axis=-1)
+        texels[rows, 1, gid_columns, 2] = self._get_sheet_columns(visuals)
+        self._visual_gids = gids
+
+        visual_texture = p3d.Texture('%s-visuals' % self.name)
+        visual_texture.setup_2d_texture(columns, row_pairs * 2, p3d.Texture.T_float, p3d.Texture.F_rgba32)
+        visual_texture.set_magfilter(p3d.Texture.FTNearest)
+        visual_texture.set_minfilter(p3d.Texture.FTNearest)
+        visual_texture.set_ram_image(texels.tobytes())
+
+        return visual_texture
+
+    def _create_geom_node(self) -> p3d.GeomNode:
+        """
+        Creates the quad covering the layer, with its texcoords in cells
+        """
+
+        width, height = self.layer.width, self.layer.height
+        vertex_data = p3d.GeomVertexData(self.name, p3d.GeomVertexFormat.get_v3t2(), p3d.Geom.UH_static)
+        vertex_data.set_num_rows(4)
+
+        vertex_writer = p3d.GeomVertexWriter(vertex_data, 'vertex')
+        texcoord_writer = p3d.GeomVertexWriter(vertex_data, 'texcoord')
+        for x, y in ((width, height), (0, height), (0, 0), (width, 0)):
+            vertex_writer.add_data3(x, y, 0)
+            texcoord_writer.add_data2(x, y)
+
+        triangles = p3d.GeomTriangles(p3d.Geom.UH_static)
+        triangles.add_vertices(0, 1, 3)
+        triangles.add_vertices(1, 2, 3)
+
+        mesh = p3d.Geom(vertex_data)
+        mesh.add_primitive(triangles)
+
         geom_node = p3d.GeomNode(self.name)
-        geom_node.add_geom(self._mesh)
+        geom_node.add_geom(mesh)
         geom_node.set_attrib(
             p3d.TransparencyAttrib.make(p3d.TransparencyAttrib.MAlpha))
-        node = self.root.attach_new_node(geom_node)
-
-        sheet_collection = p3d.Texture()
-        sheet_collection.setup_2d_texture_array(len(self._sheets))
-        for sheet_index in range(len(self._sheets)):
-            sheet = self._sheets[sheet_index]
-            sheet_collection.load(sheet, z=sheet_index, n=0)
 
-        sheet_collection.set_magfilter(p3d.Texture.FTNearest)
-        sheet_collection.set_minfilter(p3d.Texture.FTNearest)
-        sheet_collection.set_wrap_u(p3d.Texture.WMClamp)
-        sheet_collection.set_wrap_v(p3d.Texture.WMClamp)
-        node.set_texture(sheet_collection, 0)
+        node = p3d.NodePath(geom_node)
+        node.set_texture(self._get_layer_texture(), 0)
+        node.set_shader_input('tileData', self._data_texture)
+        node.set_shader_input('tileVisuals', self._visual_texture)
 
         layer_shader = p3d.Shader.load(
             p3d.Shader.SL_GLSL,
-            vertex="shaders/tile_layer.vert.glsl", 
-            fragment="shaders/tile_layer.frag.glsl")
+            vertex="shaders/tile_data.vert.glsl",
+            fragment="shaders/tile_data.frag.glsl")
         node.set_shader(layer_shader)
 
-    def _handle_tile_draw(self, x: int, y: int, tile_vis_data: object) -> None:
+        return geom_node
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+class TiledFlattenedLayerGroup(core.QuestObject):
+    """
+    Draws the flatten marked tile layers of a chunk as a single Geom that
+    shares one texture binding and render state. The member layer nodes
+    keep their own geometry for tile edits. It is merged in layer order
+    once every member is built, with the members themselves stashed, and
+    the quads a member changed are copied into it after each frame
+    """
+
+    def __init__(self, name: str, layer_nodes: list):
+        super().__init__()
+
+        self._name = name
+        self._layer_nodes = list(layer_nodes)
+        self._root = p3d.NodePath(name)
+        self._node = None
+        self._scheduler = scheduler.get_build_scheduler()
+        self._merge_pending = False
+
+        # Merged geometry and the members' quad and animation row offsets in it
+        self._vertex_data = None
+        self._triangles = None
+        self._quad_counts = None
+        self._first_quads = None
+        self._first_animations = None
+
+        # Shared textures, kept until the members' sheets or animations change
+        self._sheet_key = None
+        self._texture = None
+        self._sheet_tables = None
+        self._animation_key = None
+        self._animation_texture = None
+
+    @property
+    def name(self) -> str:
         """
         """
-        
-        # Grab our memoryview handles
-        vertex_view        = memoryview(self._vertex_data.modify_array(0)).cast('B').cast('f')
-        normal_view        = memoryview(self._vertex_data.modify_array(1)).cast('B').cast('f')
-        texcoord_view      = memoryview(self._vertex_data.modify_array(2)).cast('B').cast('f')
-        tile_position_view = memoryview(self._vertex_data.modify_array(3)).cast('B').cast('f')
-        tile_count_view    = memoryview(self._vertex_data.modify_array(4)).cast('B').cast('f')
-        tile_sheet_view    = memoryview(self._vertex_data.modify_array(5)).cast('B').cast('f')
-        triangle_view      = memoryview(self._triangles.modify_vertices()).cast('B').cast('L')
-        p3d.Thread.consider_yield()
 
-        # Calculate our vertex positions from tile position
-        x1 = x + 1
-        y1 = y + 1
-        z1 = 0
-
-        x2 = x
-        y2 = y
-        z2 = 0
-
-        def build_normals() -> np.array:
-            """
-            """
-
-            inputs = [
-                [2 * x1 - 1, 2 * y1 - 1, 2 * z1 - 1],
-                [2 * x2 - 1, 2 * y1 - 1, 2 * z1 - 1],
-                [2 * x2 - 1, 2 * y2 - 1, 2 * z2 - 1],
-                [2 * x1 - 1, 2 * y2 - 1, 2 * z2 - 1],
-            ]
-
-            normalized = []
-            for vec_input in inputs:
-                norm_vec = p3d.LVector3(*vec_input)
-                norm_vec.normalize()
-
-                normalized.append(norm_vec.get_x())
-                normalized.append(norm_vec.get_y())
-                normalized.append(norm_vec.get_z())
-    
-            return np.array(normalized, dtype='f4')
-
-        # Store the tile's tile set image for later use
-        # and determine our list index
-        if tile_vis_data.sheet not in self._sheets:
-            self._sheets.append(tile_vis_data.sheet)
-            sheet_index = len(self._sheets)
-        else:
-            sheet_index = self._sheets.index(tile_vis_data.sheet)
-
-        # Caculate our cursor start positions
-        face_id = self._get_tile_index((x, y))
-        vertex_id = face_id * 12
-        texcoord_id = face_id * 8
-
-        # Assign our geometry data
-        tile_x, tile_y = tile_vis_data.tile_x, tile_vis_data.tile_y
-        tile_count_x, tile_count_y, = tile_vis_data.tile_count_x, tile_vis_data.tile_count_y
-
-        vertex_view[vertex_id:vertex_id + 12] = np.array([x1, y1, z1, x2, y1, z1, x2, y2, z2, x1, y2, z2], dtype='f4')
-        normal_view[vertex_id:vertex_id + 12] = build_normals()
-        texcoord_view[texcoord_id:texcoord_id + 8] = np.array([
-            0.0, 1.0,
-            0.0, 0.0,
-            1.0, 0.0,  
-            1.0, 1.0], dtype = "f4")
-        p3d.Thread.consider_yield()
+        return self._name
 
-        tile_position_view[texcoord_id:texcoord_id + 8] = np.array([tile_x, tile_y, tile_x, tile_y, tile_x, tile_y, tile_x, tile_y], dtype = "f4")
-        tile_count_view[texcoord_id:texcoord_id + 8] = np.array([tile_count_x, tile_count_y, tile_count_x, tile_count_y, tile_count_x, tile_count_y, tile_count_x, tile_count_y], dtype = "f4")
-        tile_sheet_view[int(texcoord_id/2)] = np.array([0], dtype = "f4")
-        p3d.Thread.consider_yield()
+    @property
+    def root(self) -> p3d.NodePath:
+        """
+        """
 
-        # Assign our triangle indexes
-        i1, i2 = 6 * face_id, 4 * face_id
-        indexes = np.array([i2, i2 + 1, i2 + 3, i2 + 1, i2 + 2, i2 + 3], dtype = "u4")
-        triangle_view[i1: i1 + 6] = indexes
-        p3d.Thread.consider_yield()
+        return self._root
+
+    @property
+    def layer_nodes(self) -> list:
+        """
+        Member layer nodes in draw order
+        """
+
+        return self._layer_nodes
+
+    def setup(self) -> None:
+        """
+        """
+
+        for layer_node in self._layer_nodes:
+            layer_node.add_update_callback(self._handle_layer_updated)
+            layer_node.add_build_callback(self._handle_layer_updated)
+
+    def destroy(self) -> None:
+        """
+        """
+
+        self._scheduler.cancel(self)
+        self._root.remove_node()
+
+    def _handle_layer_updated(self, layer_node: object) -> None:
+        """
+        Schedules a merge of the group once all of its members are built.
+        Member changes within a frame share a single merge
+        """
+
+        if self._merge_pending or not all(layer_node.built for layer_node in self._layer_nodes):
+            return
+
+        # Members share one texture array, so once any of them stopped
+        # using the tile atlas they are all drawn from their sheets
+        if not all(layer_node.uses_atlas for layer_node in self._layer_nodes):
+            for layer_node in self._layer_nodes:
+                layer_node.disable_atlas()
+
+        self._merge_pending = True
+        self._scheduler.schedule(self, [(self._merge_layers, ())])
+
+    def _get_group_texture(self) -> tuple:
+        """
+        Returns the texture array shared by the members and a table per
+        member mapping its sheet columns to the shared texture array
+        """
+
+        if all(layer_node.uses_atlas for layer_node in self._layer_nodes):
+            return self._layer_nodes[0]._visual_table.atlas.texture, [None] * len(self._layer_nodes)
+
+        sheets = []
+        sheet_tables = []
+        for layer_node in self._layer_nodes:
+            sheet_table = []
+            for sheet_image in layer_node._sheets:
+                if sheet_image not in sheets:
+                    sheets.append(sheet_image)
+                sheet_table.append(sheets.index(sheet_image))
+            sheet_tables.append(np.array(sheet_table, dtype=np.uint8))
+
+        return make_sheet_texture_array(sheets), sheet_tables
+
+    def _merge_animation_texels(self) -> np.ndarray:
+        """
+        Stacks the animation tables of the members into one table, with
+        their sheet columns mapped to the shared texture array
+        """
+
+        animation_texels = []
+        for layer_node, sheet_table in zip(self._layer_nodes, self._sheet_tables):
+            layer_texels = layer_node._get_animation_texels()
+            if sheet_table is not None and len(sheet_table):
+                layer_texels[:, 1:, 2] = sheet_table[layer_texels[:, 1:, 2].astype(np.intp)]
+            animation_texels.append(layer_texels)
+
+        columns = max((len(layer_texels[0]) for layer_texels in animation_texels if len(layer_texels)), default=1)
+        texels = np.zeros((sum(len(layer_texels) for layer_texels in animation_texels), columns, 4), dtype=np.float32)
+        row = 0
+        for layer_texels in animation_texels:
+            texels[row:row + len(layer_texels), :layer_texels.shape[1]] = layer_texels
+            row += len(layer_texels)
+
+        return texels
+
+    def _merge_layers(self) -> None:
+        """
+        Merges the geometry of the member layers into the group's GeomNode.
+        While the members keep their quad counts, sheets and animations
+        only their changed quads are copied into the merged geometry in
+        place. Otherwise the merged geometry is built again, reusing the
+        group's textures unless the members' sheets or animations changed
+        """
+
+        self._merge_pending = False
+        if self._root.is_empty():
+            return
+
+        changed_quads = [layer_node.pop_changed_quads() for layer_node in self._layer_nodes]
+        sheet_key = [(layer_node.uses_atlas, list(layer_node._sheets)) for layer_node in self._layer_nodes]
+        animation_key = [len(layer_node._animation_frames) for layer_node in self._layer_nodes]
+        quad_counts = [layer_node.quad_count for layer_node in self._layer_nodes]
+
+        if sheet_key != self._sheet_key:
+            self._texture, self._sheet_tables = self._get_group_texture()
+            self._sheet_key = sheet_key
+            self._animation_texture = None
+        if animation_key != self._animation_key:
+            self._animation_key = animation_key
+            self._animation_texture = None
+
+        if self._node is not None and self._animation_texture is not None and quad_counts == self._quad_counts and \
+            all(quad_ids is not None for quad_ids in changed_quads):
+            for order, quad_ids in enumerate(changed_quads):
+                self._copy_member_quads(order, quad_ids)
+
+            # Edited tiles may lie outside of the merged mesh's current bounds
+            self._node.node().modify_geom(0).mark_bounds_stale()
+            self._node.node().mark_bounds_stale()
+            return
+
+        if self._animation_texture is None:
+            self._animation_texture = make_animation_texture(self._merge_animation_texels())
+
+        self._quad_counts = quad_counts
+        self._first_quads = np.concatenate(([0], np.cumsum(quad_counts)[:-1])).tolist()
+        self._first_animations = np.concatenate(([0], np.cumsum(animation_key)[:-1])).tolist()
+
+        quad_count = sum(quad_counts)
+        self._vertex_data = p3d.GeomVertexData(self._name, self._layer_nodes[0]._vertex_format, p3d.Geom.UH_static)
+        self._vertex_data.set_num_rows(quad_count * 4)
+        self._triangles = p3d.GeomTriangles(p3d.Geom.UH_static)
+        self._triangles.set_index_type(p3d.Geom.NT_uint32)
+        self._triangles.modify_vertices().set_num_rows(quad_count * 6)
+
+        for order, layer_node in enumerate(self._layer_nodes):
+            self._copy_member_quads(order, np.arange(layer_node.quad_count))
+
+        mesh = p3d.Geom(self._vertex_data)
+        mesh.add_primitive(self._triangles)
+        geom_node = p3d.GeomNode(self._name)
+        geom_node.add_geom(mesh)
+        geom_node.set_attrib(
+            p3d.TransparencyAttrib.make(p3d.TransparencyAttrib.MAlpha))
+
+        node = self._root.attach_new_node(geom_node)
+        node.set_texture(self._texture, 0)
+        node.set_shader(load_tile_layer_shader())
+        node.set_shader_input('tileAnimations', self._animation_texture)
+        node.set_shader_input('layerDepth', FLATTEN_LAYER_DEPTH)
+        if self._node is not None:
+            self._node.remove_node()
+        self._node = node
+
+        for layer_node in self._layer_nodes:
+            if not layer_node.root.is_stashed():
+                layer_node.root.stash()
+
+    def _copy_member_quads(self, order: int, quad_ids: np.ndarray) -> None:
+        """
+        Copies the requested quads of a member layer into its range of
+        the merged vertex data and triangles
+        """
+
+        if not len(quad_ids):
+            return
+
+        layer_node = self._layer_nodes[order]
+        first_quad = self._first_quads[order]
+        sheet_table = self._sheet_tables[order]
+
+        source = np.frombuffer(memoryview(layer_node._vertex_data.get_array(0)), dtype=TILE_VERTEX_DTYPE)
+        quads = source.reshape(-1, 4)[quad_ids]
+        del source
+
+        # The shader offsets each layer's depth by its order
+        quads['order'] = order
+        if sheet_table is not None and len(sheet_table):
+            quads['sheet'] = sheet_table[quads['sheet']]
+
+        animations = quads['animation']
+        animations[animations > 0] += self._first_animations[order]
+
+        target = np.frombuffer(self._vertex_data.modify_array(0), dtype=TILE_VERTEX_DTYPE)
+        target.reshape(-1, 4)[first_quad + quad_ids] = quads
+        del target
 
-        del vertex_view
-        del normal_view
-        del texcoord_view
+        # Cleared quads keep their collapsed triangles
+        source = np.frombuffer(memoryview(layer_node._triangles.get_vertices()), dtype=np.uint32)
+        quads = source.reshape(-1, 6)[quad_ids]
+        del source
 
-        del tile_position_view
-        del tile_count_view
-        del tile_sheet_view
+        target = np.frombuffer(self._triangles.modify_vertices(), dtype=np.uint32)
+        target.reshape(-1, 6)[first_quad + quad_ids] = np.where(
+            quads.any(axis=1)[:, None], quads + np.uint32(first_quad * 4), 0)
+        del target
 
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,419 @@
+"""
+Compiled binary map format (.qmap) for Tiled TMX maps. A qmap file holds
+everything a TiledMap builds while parsing its TMX source so chunks can be
+loaded without touching any XML.
+
+File layout (all values little-endian):
+    header      magic (4s), version (H), flags (H), metadata offset (I), metadata size (I)
+    metadata    utf-8 JSON: map attributes, tilesets, layers, objects, gid tables and sources
+    arrays      raw uint32 layer GID arrays, each aligned to ARRAY_ALIGNMENT bytes
+
+On the OS filesystem the layer arrays are memory mapped copy-on-write so that
+every process on a host shares the same pages. Under the Panda3D VFS the
+file is loaded with a single bulk read.
+"""
+
+from panda3d import core as p3d
+
+from quest.engine import prc, vfs, logging
+from quest.world import tmx
+
+from collections import defaultdict
+from concurrent import futures
+import multiprocessing
+import numpy as np
+import struct
+import json
+import io
+import os
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+QMAP_MAGIC = b'QMAP'
+QMAP_VERSION = 2
+QMAP_EXTENSION = '.qmap'
+
+HEADER = struct.Struct('<4sHHII')
+ARRAY_ALIGNMENT = 64
+
+# TiledMap attributes that are rebuilt on load or are runtime options and
+# must not be written into the metadata block
+_MAP_EXCLUDED_ATTRIBUTES = (
+    'filename', 'image_loader', 'optional_gids', 'load_all_tiles', 'invert_y', 'streaming', 'images', 'tileset_loaders',
+    'layers', 'tilesets', 'layernames', 'objects_by_id', 'objects_by_name',
+    'gidmap', 'imagemap', 'tiledgidmap', 'tile_properties')
+
+_ELEMENT_TYPES = {cls.__name__: cls for cls in (
+    tmx.TiledTileset, tmx.TiledTileLayer, tmx.TiledImageLayer,
+    tmx.TiledObjectGroup, tmx.TiledObject)}
+
+_TUPLE_TYPES = {cls.__name__: cls for cls in (
+    tmx.TileFlags, tmx.AnimationFrame, tmx.Point)}
+
+_vfs = p3d.VirtualFileSystem.get_global_ptr()
+_qmap_notify = logging.get_notify_category('qmap')
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+class QMapError(Exception):
+    """
+    Raised when a qmap file is malformed or was written by an
+    unsupported compiler version
+    """
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+def get_qmap_path(tmx_filename: str) -> str:
+    """
+    Returns the compiled map path for the requested TMX file
+    """
+
+    return os.path.splitext(tmx_filename)[0] + QMAP_EXTENSION
+
+def _align(offset: int) -> int:
+    """
+    Rounds the offset up to the next array alignment boundary
+    """
+
+    return (offset + ARRAY_ALIGNMENT - 1) // ARRAY_ALIGNMENT * ARRAY_ALIGNMENT
+
+def _encode(value: object) -> object:
+    """
+    Converts a TiledMap value into its JSON safe representation
+    """
+
+    if isinstance(value, tmx.TiledElement):
+        attributes = {k: _encode(v) for k, v in vars(value).items() if k not in ('parent', 'data')}
+        record = {'__element__': value.__class__.__name__, 'attributes': attributes}
+        if isinstance(value, list):
+            record['items'] = [_encode(item) for item in value]
+
+        return record
+
+    if isinstance(value, tuple):
+        type_name = value.__class__.__name__ if value.__class__.__name__ in _TUPLE_TYPES else None
+        return {'__tuple__': type_name, 'items': [_encode(item) for item in value]}
+
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+
+    if isinstance(value, dict):
+        return {'__dict__': [[_encode(k), _encode(v)] for k, v in value.items()]}
+
+    if isinstance(value, np.generic):
+        return value.item()
+
+    return value
+
+def _decode(value: object, parent: object) -> object:
+    """
+    Converts a JSON value written by _encode back into its TiledMap
+    representation
+    """
+
+    if isinstance(value, list):
+        return [_decode(item, parent) for item in value]
+
+    if not isinstance(value, dict):
+        return value
+
+    if '__element__' in value:
+        cls = _ELEMENT_TYPES[value['__element__']]
+        element = cls.__new__(cls)
+        tmx.TiledElement.__init__(element)
+        element.__dict__.update({k: _decode(v, parent) for k, v in value['attributes'].items()})
+        element.parent = parent
+        if 'items' in value:
+            element.extend(_decode(item, parent) for item in value['items'])
+
+        return element
+
+    if '__tuple__' in value:
+        items = [_decode(item, parent) for item in value['items']]
+        cls = _TUPLE_TYPES.get(value['__tuple__'], None)
+        return cls(*items) if cls is not None else tuple(items)
+
+    return {_decode(k, parent): _decode(v, parent) for k, v in value['__dict__']}
+
+def get_map_sources(tiled_map: object) -> list:
+    """
+    Returns the source files the TiledMap was built from. The TMX file
+    and all external tilesets it references. Maps loaded from a qmap
+    file use the source list recorded in its metadata
+    """
+
+    sources = getattr(tiled_map, '_qmap_sources', None)
+    if sources is not None:
+        return list(sources)
+
+    sources = [tiled_map.filename]
+    dirname = os.path.dirname(tiled_map.filename)
+    for tileset in tiled_map.tilesets:
+        if tileset.tileset_source:
+            sources.append(vfs.fixed_join(dirname, tileset.tileset_source))
+
+    return sources
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+def compile_tiled_map(tiled_map: object) -> tuple:
+    """
+    Converts a parsed TiledMap into its compact qmap representation. A JSON
+    safe metadata dict and the list of uint32 layer arrays
+    """
+
+    arrays = []
+    layers = []
+    for layer in tiled_map.layers:
+        if isinstance(layer, tmx.TiledChunkedTileLayer):
+            raise QMapError('Failed to compile %s. Infinite maps are not supported' % tiled_map.filename)
+
+        record = _encode(layer)
+        if isinstance(layer, tmx.TiledTileLayer):
+            record['array'] = len(arrays)
+            arrays.append(np.ascontiguousarray(layer.data, dtype='<u4'))
+        layers.append(record)
+
+    metadata = {
+        'invert_y': tiled_map.invert_y,
+        'sources': [[source, vfs.get_file_date(source)] for source in get_map_sources(tiled_map)],
+        'map': {k: _encode(v) for k, v in vars(tiled_map).items()
+            if k not in _MAP_EXCLUDED_ATTRIBUTES and not k.startswith('_')},
+        'tilesets': [_encode(tileset) for tileset in tiled_map.tilesets],
+        'layers': layers,
+        'tile_properties': _encode(tiled_map.tile_properties),
+        'gidmap': _encode(dict(tiled_map.gidmap)),
+        'imagemap': _encode(tiled_map.imagemap),
+        'tiledgidmap': _encode(tiled_map.tiledgidmap),
+        'arrays': []
+    }
+
+    return metadata, arrays
+
+def write_qmap(tiled_map: object, filename: str = None) -> str:
+    """
+    Compiles a parsed TiledMap into a qmap file. Writing next to the
+    map's TMX file when no filename is provided. Returns the
+    written filename
+    """
+
+    if filename is None:
+        filename = get_qmap_path(tiled_map.filename)
+
+    metadata, arrays = compile_tiled_map(tiled_map)
+
+    # Sources are recorded relative to the qmap file
+    qmap_directory = os.path.dirname(filename)
+    metadata['sources'] = [[os.path.relpath(source, qmap_directory), date] for source, date in metadata['sources']]
+
+    # Lay out the tile layer arrays after the metadata block. The metadata
+    # records absolute offsets so its own size must be known first. The
+    # array table's size depends on the offsets it contains, so iterate
+    # until the metadata block size is stable
+    metadata_size = 0
+    while True:
+        offset = _align(HEADER.size + metadata_size)
+        metadata['arrays'] = []
+        for array in arrays:
+            metadata['arrays'].append([offset, list(array.shape)])
+            offset = _align(offset + array.nbytes)
+
+        metadata_bytes = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+        if len(metadata_bytes) == metadata_size:
+            break
+        metadata_size = len(metadata_bytes)
+
+    with io.open(filename, 'wb') as f:
+        f.write(HEADER.pack(QMAP_MAGIC, QMAP_VERSION, 0, HEADER.size, len(metadata_bytes)))
+        f.write(metadata_bytes)
+        for array, (array_offset, shape) in zip(arrays, metadata['arrays']):
+            f.write(b'\0' * (array_offset - f.tell()))
+            f.write(array.tobytes())
+
+    return filename
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+def _read_header(buffer: bytes) -> tuple:
+    """
+    Validates the qmap header and returns the metadata offset
+    and size
+    """
+
+    if len(buffer) < HEADER.size:
+        raise QMapError('qmap file is truncated')
+
+    magic, version, flags, metadata_offset, metadata_size = HEADER.unpack_from(buffer)
+    if magic != QMAP_MAGIC:
+        raise QMapError('File is not a qmap file')
+
+    if version != QMAP_VERSION:
+        raise QMapError('Unsupported qmap version %d. Expected %d' % (version, QMAP_VERSION))
+
+    return metadata_offset, metadata_size
+
+def read_qmap_metadata(filename: str) -> dict:
+    """
+    Reads the metadata block of a qmap file without
+    loading its layer arrays
+    """
+
+    if os.path.exists(filename):
+        with io.open(filename, 'rb') as f:
+            metadata_offset, metadata_size = _read_header(f.read(HEADER.size))
+            f.seek(metadata_offset)
+            return json.loads(f.read(metadata_size).decode('utf-8'))
+
+    buffer = _vfs.read_file(p3d.Filename(filename), True)
+    metadata_offset, metadata_size = _read_header(buffer)
+    return json.loads(buffer[metadata_offset:metadata_offset + metadata_size].decode('utf-8'))
+
+def read_qmap(filename: str) -> tuple:
+    """
+    Reads a qmap file's metadata and layer arrays. The arrays are memory
+    mapped copy-on-write when the file lives on the OS filesystem,
+    otherwise the whole file is read out of the VFS in one go
+    """
+
+    if os.path.exists(filename):
+        metadata = read_qmap_metadata(filename)
+        arrays = [np.memmap(filename, dtype='<u4', mode='c', offset=offset, shape=tuple(shape))
+            for offset, shape in metadata['arrays']]
+
+        return metadata, arrays
+
+    buffer = bytearray(_vfs.read_file(p3d.Filename(filename), True))
+    metadata_offset, metadata_size = _read_header(buffer)
+    metadata = json.loads(buffer[metadata_offset:metadata_offset + metadata_size].decode('utf-8'))
+    arrays = [np.frombuffer(buffer, dtype='<u4', count=int(np.prod(shape)), offset=offset).reshape(shape)
+        for offset, shape in metadata['arrays']]
+
+    return metadata, arrays
+
+def is_qmap_up_to_date(filename: str, metadata: dict = None) -> bool:
+    """
+    Returns true if the qmap file exists and none of its source
+    files have been modified since it was compiled
+    """
+
+    if not vfs.path_exists(filename):
+        return False
+
+    if metadata is None:
+        try:
+            metadata = read_qmap_metadata(filename)
+        except QMapError:
+            return False
+
+    qmap_directory = os.path.dirname(filename)
+    for source, date in metadata['sources']:
+        source = vfs.fixed_join(qmap_directory, source)
+        if not vfs.path_exists(source) or vfs.get_file_date(source) > date:
+            return False
+
+    return True
+
+def load_qmap(filename: str, tmx_filename: str = None, image_loader: object = tmx.default_image_loader, **kwargs) -> object:
+    """
+    Loads a TiledMap from a qmap file. The map's filename is set to its
+    TMX source so image paths resolve the same as a parsed map
+    """
+
+    if tmx_filename is None:
+        tmx_filename = os.path.splitext(filename)[0] + '.tmx'
+
+    metadata, arrays = read_qmap(filename)
+    qmap_directory = os.path.dirname(filename)
+    metadata['sources'] = [[vfs.fixed_join(qmap_directory, source), date] for source, date in metadata['sources']]
+
+    return build_tiled_map(metadata, arrays, tmx_filename, image_loader=image_loader, **kwargs)
+
+def build_tiled_map(metadata: dict, arrays: list, tmx_filename: str, image_loader: object = tmx.default_image_loader, **kwargs) -> object:
+    """
+    Rebuilds a TiledMap from its compact qmap representation, as
+    returned by read_qmap or compile_tiled_map. The map keeps the
+    metadata's source list for get_map_sources
+    """
+
+    tiled_map = tmx.TiledMap(None, image_loader=image_loader, **kwargs)
+    if tiled_map.invert_y != metadata['invert_y']:
+        raise QMapError('Map data for %s was compiled with invert_y=%s' % (tmx_filename, metadata['invert_y']))
+
+    tiled_map.filename = tmx_filename
+    tiled_map.__dict__.update({k: _decode(v, tiled_map) for k, v in metadata['map'].items()})
+
+    for record in metadata['tilesets']:
+        tiled_map.add_tileset(_decode(record, tiled_map))
+
+    for record in metadata['layers']:
+        layer = _decode(record, tiled_map)
+        if isinstance(layer, tmx.TiledTileLayer):
+            layer.data = arrays[record['array']]
+        tiled_map.add_layer(layer)
+
+        if isinstance(layer, tmx.TiledObjectGroup):
+            for obj in layer:
+                tiled_map.objects_by_id[obj.id] = obj
+                tiled_map.objects_by_name[obj.name] = obj
+
+    tiled_map.tile_properties = _decode(metadata['tile_properties'], tiled_map)
+    tiled_map.gidmap = defaultdict(list, _decode(metadata['gidmap'], tiled_map))
+    tiled_map.imagemap = _decode(metadata['imagemap'], tiled_map)
+    tiled_map.tiledgidmap = _decode(metadata['tiledgidmap'], tiled_map)
+    tiled_map._qmap_sources = [source for source, date in metadata['sources']]
+
+    tiled_map.reload_images()
+    return tiled_map
+
+def load_tiled_map(tmx_filename: str, **kwargs) -> object:
+    """
+    Loads the TiledMap for a TMX file. Using its compiled qmap in place
+    of the TMX source when one is present and up to date
+    """
+
+    qmap_filename = get_qmap_path(tmx_filename)
+    if prc.get_prc_bool('want-compiled-maps', True) and is_qmap_up_to_date(qmap_filename):
+        return load_qmap(qmap_filename, tmx_filename, **kwargs)
+
+    return tmx.TiledMap(tmx_filename, **kwargs)
+
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+def parse_tmx_map_data(tmx_filename: str) -> tuple:
+    """
+    Parses a TMX file and returns its compact qmap representation.
+    Runs inside the map loader worker processes so only metadata and
+    layer arrays cross the process boundary, never a TiledMap
+    """
+
+    return compile_tiled_map(tmx.TiledMap(tmx_filename))
+
+def parse_tmx_maps(tmx_filenames: list, max_workers: int = None) -> dict:
+    """
+    Parses the TMX files across a pool of worker processes. Returns a dict
+    of TMX filename to (metadata, arrays). Maps that fail to parse in a
+    worker, such as infinite maps, are logged and left out for the caller
+    to load
+    """
+
+    results = {}
+    if not tmx_filenames:
+        return results
+
+    # Workers are spawned rather than forked so they do not inherit the
+    # Panda3D state of the parent process
+    context = multiprocessing.get_context('spawn')
+    with futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        pending = {executor.submit(parse_tmx_map_data, filename): filename for filename in tmx_filenames}
+        for future in futures.as_completed(pending):
+            # Any failure, including malformed XML or a crashed worker,
+            # only leaves that map out of the results
+            try:
+                results[pending[future]] = future.result()
+            except Exception as e:
+                _qmap_notify.warning('Failed to parse %s in a map loader worker: %s' % (pending[future], e))
+
+    return results
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,257 @@
+"""
+Time budgeted scheduler for world build work. Tile layer nodes queue their
+geometry creation and tile row ranges as build jobs. Jobs are processed in
+the order they were scheduled, with as many steps run each frame as fit
+within the frame budget, so chunks stream in without frame time spikes.
+
+Work finished on a worker thread, such as a threaded tile layer build, is
+handed over to the main thread and applied at the start of the next frame.
+
+Events sent through the messenger:
+    worldBuildProgress [completed, total]  after each frame that ran build steps
+    worldBuildJobComplete [owner]          when all steps of a job have run
+    worldBuildComplete []                  when the queue has been drained
+
+The client's world loading stage shows the progress events and moves on
+to gameplay once the build is complete.
+"""
+
+from panda3d import core as p3d
+
+from quest.engine import core, prc, runtime
+from quest.framework import runnable
+
+from dataclasses import dataclass, field
+import collections
+import threading
+import time
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+@dataclass
+class BuildJob(object):
+    """
+    Ordered steps of a single owner's build work. Each step
+    is a (function, arguments) tuple
+    """
+
+    owner: object
+    steps: collections.deque = field(default_factory=collections.deque)
+
+class BuildScheduler(runnable.Runnable, core.QuestObject):
+    """
+    Processes queued build jobs in order within a per frame
+    millisecond budget
+    """
+
+    PROGRESS_EVENT = 'worldBuildProgress'
+    JOB_COMPLETE_EVENT = 'worldBuildJobComplete'
+    COMPLETE_EVENT = 'worldBuildComplete'
+
+    def __init__(self, budget: float, batch_size: int):
+        runnable.Runnable.__init__(self, collector='World:BuildScheduler')
+        core.QuestObject.__init__(self)
+
+        self._budget = budget
+        self._batch_size = batch_size
+        self._jobs = collections.deque()
+        self._handovers = collections.deque()
+        self._handover_lock = threading.Lock()
+        self._completed = 0
+        self._total = 0
+
+    @property
+    def budget(self) -> float:
+        """
+        Milliseconds of build work run per frame
+        """
+
+        return self._budget
+
+    @budget.setter
+    def budget(self, budget: float) -> None:
+        """
+        """
+
+        self._budget = budget
+
+    @property
+    def batch_size(self) -> int:
+        """
+        Number of tiles a single tile build step should cover
+        """
+
+        return self._batch_size
+
+    @property
+    def completed(self) -> int:
+        """
+        Number of steps run since the queue was last drained
+        """
+
+        return self._completed
+
+    @property
+    def total(self) -> int:
+        """
+        Number of steps scheduled since the queue was last drained
+        """
+
+        return self._total
+
+    @property
+    def progress(self) -> float:
+        """
+        Fraction of the scheduled steps that have been run
+        """
+
+        if not self._total:
+            return 1.0
+
+        return self._completed / self._total
+
+    @property
+    def pending(self) -> bool:
+        """
+        Returns true if build steps are waiting to run
+        """
+
+        return bool(self._jobs)
+
+    def schedule(self, owner: object, steps: list) -> BuildJob:
+        """
+        Queues the owner's build steps after all previously scheduled work
+        """
+
+        job = BuildJob(owner, collections.deque(steps))
+        if not job.steps:
+            return job
+
+        self._jobs.append(job)
+        self._total += len(job.steps)
+        self._start()
+
+        return job
+
+    def hand_over(self, owner: object, step_func: object, step_args: tuple) -> None:
+        """
+        Queues a step from a worker thread to run on the main thread at
+        the start of the next frame. Handed over steps ignore the budget
+        and complete the owner's job
+        """
+
+        # Activated under the lock so tick cannot miss the handed over step
+        with self._handover_lock:
+            self._handovers.append((owner, step_func, step_args))
+            self._start()
+
+    def _start(self) -> None:
+        """
+        Activates the scheduler's per frame updates. The updates stop
+        again once the queue has been drained
+        """
+
+        # Without a task manager the owner drives the scheduler with run
+        if runtime.has_task_mgr():
+            self.activate()
+
+    def cancel(self, owner: object) -> None:
+        """
+        Drops all queued build jobs of the owner
+        """
+
+        for job in [job for job in self._jobs if job.owner is owner]:
+            self._jobs.remove(job)
+            self._total -= len(job.steps)
+
+        with self._handover_lock:
+            self._handovers = collections.deque(
+                handover for handover in self._handovers if handover[0] is not owner)
+
+    def _send(self, event: str, args: list) -> None:
+        """
+        Sends a scheduler event when a messenger is available
+        """
+
+        if runtime.has_messenger():
+            runtime.messenger.send(event, args)
+
+    def run(self, budget: float = None) -> int:
+        """
+        Runs queued build steps in order until the budget, in milliseconds,
+        is spent. At least one step is always run. Returns the number of
+        steps that were run
+        """
+
+        if budget is None:
+            budget = self._budget
+
+        deadline = time.perf_counter() + budget / 1000.0
+        count = 0
+
+        with self._handover_lock:
+            handovers, self._handovers = self._handovers, collections.deque()
+
+        for owner, step_func, step_args in handovers:
+            step_func(*step_args)
+            self._total += 1
+            count += 1
+            self._send(self.JOB_COMPLETE_EVENT, [owner])
+
+        while self._jobs:
+            job = self._jobs[0]
+            step_func, step_args = job.steps.popleft()
+            step_func(*step_args)
+            count += 1
+
+            # The step may have cancelled its own job
+            if not job.steps and self._jobs and self._jobs[0] is job:
+                self._jobs.popleft()
+                self._send(self.JOB_COMPLETE_EVENT, [job.owner])
+
+            if time.perf_counter() >= deadline:
+                break
+
+            p3d.Thread.consider_yield()
+
+        if count:
+            self._completed += count
+            self._send(self.PROGRESS_EVENT, [self._completed, self._total])
+
+        if not self._jobs and self._total:
+            self._completed = self._total = 0
+            self._send(self.COMPLETE_EVENT, [])
+
+        return count
+
+    async def tick(self, dt: float) -> None:
+        """
+        Runs the build work of the current frame
+        """
+
+        self.run()
+
+        with self._handover_lock:
+            if not self._jobs and not self._handovers:
+                self.deactivate()
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+
+_build_scheduler = None
+
+def get_build_scheduler() -> BuildScheduler:
+    """
+    Returns the process wide build scheduler. The per frame budget is read
+    from the world-build-budget PRC option, in milliseconds, and the tiles
+    per build step from world-build-batch-size
+    """
+
+    global _build_scheduler
+    if _build_scheduler is None:
+        budget = prc.get_prc_double('world-build-budget', 4.0)
+        batch_size = prc.get_prc_int('world-build-batch-size', 1024)
+        _build_scheduler = BuildScheduler(budget, batch_size)
+
+    return _build_scheduler
+
+#----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
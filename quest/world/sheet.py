@@ -1,56 +1,533 @@
 from panda3d import core as p3d
 
-from quest.engine import runtime
+from quest.engine import runtime, prc, performance
 
 from dataclasses import dataclass
+import numpy as np
+import collections
+import weakref
+import bisect
+import os
 
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
 
-@dataclass
-class TileVisualData(object):
+# Row layout of the tile visual tables. tile_id is the local id of the tile
+# in its sheet and flags holds the Tiled flip bits shifted down by
+# tmx.GID_FLAGS_SHIFT: horizontal 4, vertical 2, diagonal 1
+TILE_VISUAL_DTYPE = np.dtype([
+    ('tile_x', 'f4'),
+    ('tile_y', 'f4'),
+    ('count_x', 'f4'),
+    ('count_y', 'f4'),
+    ('sheet', 'i4'),
+    ('tile_id', 'u4'),
+    ('flags', 'u1')])
+
+def get_flag_bits(flags: object) -> int:
+    """
+    Packs TileFlags into the flags column value of a tile visual row
+    """
+
+    if flags is None:
+        return 0
+
+    return (int(flags.flipped_horizontally) << 2) | (int(flags.flipped_vertically) << 1) | int(flags.flipped_diagonally)
+
+def build_tileset_visual_table(tileset: object, sheet_index: int) -> np.ndarray:
+    """
+    Builds the tile visual table of a tileset, one row per local tile
+    id. Computed from the tileset attributes, the sheet image is
+    never decoded
+    """
+
+    rects = np.array(tileset.tile_rects, dtype=np.float64).reshape(-1, 4)
+    table = np.zeros(len(rects), dtype=TILE_VISUAL_DTYPE)
+    if not len(rects):
+        return table
+
+    count_x = tileset.width / tileset.tilewidth
+    count_y = tileset.height / tileset.tileheight
+
+    table['tile_x'] = np.trunc(rects[:, 0] / rects[:, 2])
+    table['tile_y'] = np.trunc(np.abs(count_y - (np.trunc(rects[:, 1] / rects[:, 3]) + 1)))
+    table['count_x'] = count_x
+    table['count_y'] = count_y
+    table['sheet'] = sheet_index
+    table['tile_id'] = np.arange(len(table))
+
+    return table
+
+class TileVisualTable(object):
+    """
+    Tile visual rows of every tileset of a TiledMap, plus a table from the
+    map's GIDs to their row and flip flags. Attributes for a whole layer
+    are gathered with a single fancy index of its GID array
+    """
+
+    def __init__(self, tiled_map: object):
+        self._tiled_map = weakref.proxy(tiled_map)
+        self._sheets = []
+        self._atlas = None
+        self._sheet_rows = None
+        self._atlas_missing = None
+        self._sheet_images = {}
+        self._acquired = []
+        self._tilesets = {}
+        self._first_rows = {}
+        self._rect_ids = {}
+        self._image_rows = {}
+
+        rows = [np.zeros(1, dtype=TILE_VISUAL_DTYPE)]
+        row_count = 1
+        for tileset in tiled_map.tilesets:
+            if tileset.source is None:
+                continue
+
+            path = os.path.join(os.path.dirname(tiled_map.filename), tileset.source)
+            table = build_tileset_visual_table(tileset, self.add_sheet(path))
+            self._tilesets[tileset.firstgid] = table
+            self._first_rows[tileset.firstgid] = row_count
+            rows.append(table)
+            row_count += len(table)
+
+        self._rows = np.concatenate(rows)
+        self._gid_rows = np.zeros(0, dtype=np.uint32)
+        self._gid_flags = np.zeros(0, dtype=np.uint8)
+        self.update()
+
+        weakref.finalize(self, release_sheets, self._acquired)
+
+    @property
+    def sheets(self) -> list:
+        """
+        Sheet image filenames, indexed by the sheet column
+        """
+
+        return self._sheets
+
+    @property
+    def atlas(self) -> object:
+        """
+        Tile atlas the rows were remapped to, if any
+        """
+
+        return self._atlas
+
+    def set_atlas(self, tile_atlas: object) -> None:
+        """
+        Remaps the rows to the pages of a tile atlas. The sheet column
+        then holds the atlas page instead of the sheet index. The sheet
+        rows are kept for tiles the atlas does not hold
+        """
+
+        if self._atlas is not None:
+            raise ValueError('Tile visual table already uses an atlas')
+
+        self._atlas = tile_atlas
+        self._sheet_rows = self._rows.copy()
+        self._atlas_missing = tile_atlas.remap_rows(self._rows, self._sheets)
+
+    def in_atlas(self, gids: np.ndarray) -> np.ndarray:
+        """
+        Returns a mask of the map GIDs whose tiles can be drawn from the
+        tile atlas. Empty GIDs count as drawable
+        """
+
+        gids = np.asarray(gids)
+        if self._atlas is None:
+            return np.zeros(gids.shape, dtype=bool)
+
+        if gids.size and int(gids.max()) >= len(self._gid_rows):
+            self.update()
+
+        return ~self._atlas_missing[self._gid_rows[gids]]
+
+    @property
+    def rows(self) -> np.ndarray:
+        """
+        """
+
+        return self._rows
+
+    @property
+    def gid_rows(self) -> np.ndarray:
+        """
+        Row of each map GID, 0 being the empty row
+        """
+
+        return self._gid_rows
+
+    @property
+    def gid_flags(self) -> np.ndarray:
+        """
+        Flip flag bits of each map GID
+        """
+
+        return self._gid_flags
+
+    def get_tileset_table(self, tileset: object) -> np.ndarray:
+        """
+        Returns the tile visual table of a tileset, indexed by local tile id
+        """
+
+        return self._tilesets.get(tileset.firstgid, None)
+
+    def add_sheet(self, filename: str) -> int:
+        """
+        Returns the sheet column value of an image, adding it
+        to the table's sheets if needed
+        """
+
+        path = get_sheet_path(filename)
+        if path not in self._sheets:
+            self._sheets.append(path)
+
+        return self._sheets.index(path)
+
+    def get_sheet_image(self, sheet_index: int) -> p3d.PNMImage:
+        """
+        Returns the shared image of a sheet. The sheet is referenced
+        in the sheet cache for as long as the table is alive
+        """
+
+        image = self._sheet_images.get(sheet_index, None)
+        if image is None:
+            image = get_sheet_cache().acquire(self._sheets[sheet_index])
+            self._sheet_images[sheet_index] = image
+            self._acquired.append(self._sheets[sheet_index])
+
+        return image
+
+    def _add_image_row(self, filename: str) -> int:
+        """
+        Returns the row of a whole image tile, appending it the first
+        time the image is requested
+        """
+
+        path = get_sheet_path(filename)
+        if path in self._image_rows:
+            return self._image_rows[path]
+
+        row = np.zeros(1, dtype=TILE_VISUAL_DTYPE)
+        row['count_x'] = row['count_y'] = 1
+        row['sheet'] = self.add_sheet(filename)
+        if self._atlas is not None:
+            self._sheet_rows = np.concatenate((self._sheet_rows, row))
+            self._atlas_missing = np.concatenate((self._atlas_missing, self._atlas.remap_rows(row, self._sheets)))
+
+        self._rows = np.concatenate((self._rows, row))
+        self._image_rows[path] = len(self._rows) - 1
+
+        return self._image_rows[path]
+
+    def update(self) -> None:
+        """
+        Adds the GIDs the map registered since the table was last updated
+        """
+
+        tiled_map = self._tiled_map
+        first_gid = len(self._gid_rows)
+        if first_gid >= tiled_map.maxgid:
+            return
+
+        gid_rows = np.zeros(tiled_map.maxgid, dtype=np.uint32)
+        gid_flags = np.zeros(tiled_map.maxgid, dtype=np.uint8)
+        gid_rows[:first_gid] = self._gid_rows
+        gid_flags[:first_gid] = self._gid_flags
+
+        firstgids = sorted(self._first_rows)
+        flags_by_gid = {gid: flags for gids in tiled_map.gidmap.values() for gid, flags in gids}
+        dirname = os.path.dirname(tiled_map.filename or '')
+
+        for gid in range(max(first_gid, 1), tiled_map.maxgid):
+            tiled_gid = tiled_map.tiledgidmap.get(gid, None)
+            if tiled_gid is None:
+                continue
+
+            gid_flags[gid] = get_flag_bits(flags_by_gid.get(gid, None))
+            source = tiled_map.tile_properties.get(gid, {}).get('source', None)
+            if source:
+                gid_rows[gid] = self._add_image_row(os.path.join(dirname, source))
+                continue
+
+            index = bisect.bisect_right(firstgids, tiled_gid) - 1
+            if index < 0:
+                continue
+
+            firstgid = firstgids[index]
+            local_id = tiled_gid - firstgid
+            if local_id < len(self._tilesets[firstgid]):
+                gid_rows[gid] = self._first_rows[firstgid] + local_id
+
+        self._gid_rows = gid_rows
+        self._gid_flags = gid_flags
+
+    def get_visuals(self, gids: np.ndarray, use_atlas: bool = True) -> np.ndarray:
+        """
+        Gathers the tile visual rows of an array of map GIDs, with their
+        flip flags applied. With use_atlas unset the rows address the
+        tile sheets even when the table uses a tile atlas
+        """
+
+        gids = np.asarray(gids)
+        if gids.size and int(gids.max()) >= len(self._gid_rows):
+            self.update()
+
+        rows = self._rows if use_atlas or self._atlas is None else self._sheet_rows
+        visuals = rows[self._gid_rows[gids]]
+        visuals['flags'] = self._gid_flags[gids]
+        return visuals
+
+    def get_visual(self, tileset: object, rect: tuple, flags: object) -> np.void:
+        """
+        Returns the tile visual row of a tileset tile, identified by
+        its image rect, with the flip flags applied
+        """
+
+        rect_ids = self._rect_ids.get(tileset.firstgid, None)
+        if rect_ids is None:
+            rect_ids = {tuple(tile_rect): local_id for local_id, tile_rect in enumerate(tileset.tile_rects)}
+            self._rect_ids[tileset.firstgid] = rect_ids
+
+        visual = self._rows[self._first_rows[tileset.firstgid] + rect_ids[tuple(rect)]].copy()
+        visual['flags'] = get_flag_bits(flags)
+        return visual
+
+    def get_image_visual(self, filename: str) -> np.void:
+        """
+        Returns the tile visual row of a whole image tile
+        """
+
+        # The row is added before self._rows is read, as adding replaces it
+        row = self._add_image_row(filename)
+        return self._rows[row].copy()
+
+_visual_tables = weakref.WeakKeyDictionary()
+
+def get_tile_visual_table(tiled_map: object) -> TileVisualTable:
     """
+    Returns the tile visual table of a TiledMap, building it on first use
     """
 
-    tile_x: int
-    tile_y: int
+    table = _visual_tables.get(tiled_map, None)
+    if table is None:
+        table = TileVisualTable(tiled_map)
+        _visual_tables[tiled_map] = table
 
-    tile_count_x: int
-    tile_count_y: int
+    return table
 
-    sheet: object
+def release_sheets(paths: list) -> None:
+    """
+    Releases the sheet cache references held by a tile visual table
+    """
 
-    rect: object
-    flags: object
+    sheet_cache = get_sheet_cache()
+    for path in paths:
+        sheet_cache.release(path)
 
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
 
+@dataclass
+class SheetCacheEntry(object):
+    """
+    Shared image of a single tile sheet
+    """
+
+    image: p3d.PNMImage
+    references: int = 0
+    size: int = 0
+
+class SheetCache(object):
+    """
+    Process wide cache of decoded tile sheet images keyed by their resolved
+    path. Sheets are reference counted by the tile maps using them and
+    sheets that are no longer referenced are evicted least recently used
+    first once the resident size exceeds the byte budget
+    """
+
+    def __init__(self, budget: int):
+        self._budget = budget
+        self._entries = collections.OrderedDict()
+        self._resident_bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+        self._hits_collector = performance.get_collector('App:World:SheetCache:Hits')
+        self._misses_collector = performance.get_collector('App:World:SheetCache:Misses')
+        self._resident_collector = performance.get_collector('App:World:SheetCache:ResidentBytes')
+
+    @property
+    def budget(self) -> int:
+        """
+        Number of bytes unreferenced sheets may occupy before
+        they are evicted
+        """
+
+        return self._budget
+
+    @property
+    def hits(self) -> int:
+        """
+        """
+
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """
+        """
+
+        return self._misses
+
+    @property
+    def resident_bytes(self) -> int:
+        """
+        Number of bytes used by the cached images
+        """
+
+        return self._resident_bytes
+
+    def __contains__(self, filename: str) -> bool:
+        """
+        Returns true if the sheet is currently cached
+        """
+
+        return get_sheet_path(filename) in self._entries
+
+    def _update_collectors(self) -> None:
+        """
+        Reports the cache statistics to the performance module
+        """
+
+        self._hits_collector.set_level(self._hits)
+        self._misses_collector.set_level(self._misses)
+        self._resident_collector.set_level(self._resident_bytes)
+
+    def _get_entry(self, filename: str) -> SheetCacheEntry:
+        """
+        Returns the cache entry for the sheet, decoding the image on
+        a miss, and marks it as the most recently used
+        """
+
+        path = get_sheet_path(filename)
+        entry = self._entries.get(path, None)
+        if entry is not None:
+            self._hits += 1
+            self._entries.move_to_end(path)
+        else:
+            self._misses += 1
+            image = p3d.PNMImage(p3d.Filename.from_os_specific(path))
+            entry = SheetCacheEntry(image, size=get_image_size(image))
+            self._entries[path] = entry
+            self._resident_bytes += entry.size
+
+        self._update_collectors()
+        return entry
+
+    def acquire(self, filename: str) -> p3d.PNMImage:
+        """
+        Returns the shared image of the sheet and adds a reference to it.
+        Each call must be matched by a call to release
+        """
+
+        entry = self._get_entry(filename)
+        entry.references += 1
+        self.evict()
+
+        return entry.image
+
+    def release(self, filename: str) -> None:
+        """
+        Removes a reference from the sheet, allowing it to be
+        evicted once it is no longer referenced
+        """
+
+        entry = self._entries.get(get_sheet_path(filename), None)
+        if entry is None:
+            return
+
+        entry.references = max(entry.references - 1, 0)
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Evicts unreferenced sheets, least recently used first,
+        until the resident size is within budget
+        """
+
+        for path in list(self._entries):
+            if self._resident_bytes <= self._budget:
+                break
+
+            entry = self._entries[path]
+            if entry.references:
+                continue
+
+            del self._entries[path]
+            self._resident_bytes -= entry.size
+
+        self._update_collectors()
+
+    def clear(self) -> None:
+        """
+        Drops every cached sheet, referenced or not
+        """
+
+        self._entries.clear()
+        self._resident_bytes = 0
+        self._update_collectors()
+
+_sheet_cache = None
+
+def get_sheet_cache() -> SheetCache:
+    """
+    Returns the process wide sheet cache. The byte budget is read from
+    the sheet-cache-budget PRC option, in megabytes
+    """
+
+    global _sheet_cache
+    if _sheet_cache is None:
+        budget = prc.get_prc_int('sheet-cache-budget', 256) * 1024 * 1024
+        _sheet_cache = SheetCache(budget)
+
+    return _sheet_cache
+
+def get_sheet_path(filename: str) -> str:
+    """
+    Returns the resolved path used as the sheet cache key
+    """
+
+    filename = filename.replace(r'zones/devplanet\../../tsx\../', '')
+    return os.path.normpath(os.path.abspath(filename))
+
+def get_image_size(image: p3d.PNMImage) -> int:
+    """
+    Returns the number of bytes used by the image's pixel data
+    """
+
+    component_width = 2 if image.get_maxval() > 255 else 1
+    return image.get_x_size() * image.get_y_size() * image.get_num_channels() * component_width
+
 def load_tiled_image(filename: str, colorkey: object, **kwargs) -> object:
     """
+    Image loader for TiledMap. Tiles are loaded as rows of the map's tile
+    visual table rather than individual objects. The sheet image itself
+    is only decoded once the table's image is requested
     """   
     
-    filename = filename.replace('zones/devplanet\../../tsx\../', '')
-    image_buffer = p3d.PNMImage(filename)
+    tileset = kwargs.get('tileset', None)
+    tiled_map = tileset.parent if tileset is not None else kwargs.get('tiled_map')
 
-    def create_tile_visual_data(rect: object = None, flags: object = None) -> TileVisualData:
+    def create_tile_visual_data(rect: object = None, flags: object = None) -> np.void:
         """
         """
         
-        x, y, w, h = rect
-        tile_count_x = image_buffer.get_x_size() / w
-        tile_count_y = image_buffer.get_y_size() / h
+        table = get_tile_visual_table(tiled_map)
+        if tileset is None:
+            return table.get_image_visual(filename)
 
-        tile_x = get_tile_coord(x, w, tile_count_x)
-        tile_y = get_tile_coord(y, h, tile_count_y, invert=True)
+        return table.get_visual(tileset, rect, flags)
 
-        visual_data = TileVisualData(
-            tile_x, tile_y,
-            tile_count_x, tile_count_y,
-            image_buffer,
-            rect, 
-            flags)
-
-        return visual_data
-    
     return create_tile_visual_data
 
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
@@ -21,23 +21,33 @@ License along with pytmx.  If not, see <http://www.gnu.org/licenses/>.
 import logging
 import os
 from collections import defaultdict, namedtuple
-from io import BytesIO
+from collections.abc import Sequence
+from functools import lru_cache
 from itertools import chain, product
 from math import cos, radians, sin
-from operator import attrgetter
+from operator import attrgetter, itemgetter
+from types import MappingProxyType
 from xml.etree import ElementTree
 
+import numpy as np
+
 from panda3d.core import VirtualFileSystem, Filename
 _vfs = VirtualFileSystem.get_global_ptr()
 
+from quest.engine import vfs
+
 __all__ = (
     'TiledElement',
     'TiledMap',
     'TiledTileset',
     'TiledTileLayer',
+    'TiledChunkedTileLayer',
+    'TiledLayerChunk',
     'TiledObject',
     'TiledObjectGroup',
+    'TiledObjectIndex',
     'TiledImageLayer',
+    'TiledImageSequence',
     'TileFlags',
     'convert_to_bool',
     'parse_properties')
@@ -53,6 +63,12 @@ TRANS_ROT = 4
 GID_TRANS_FLIPX = 1 << 31
 GID_TRANS_FLIPY = 1 << 30
 GID_TRANS_ROT = 1 << 29
+GID_MASK = ~(GID_TRANS_FLIPX | GID_TRANS_FLIPY | GID_TRANS_ROT) & 0xFFFFFFFF
+GID_FLAGS_SHIFT = 29
+
+# TiledObject attributes that change the bounds of the object
+object_bounds_attributes = frozenset(
+    ('x', 'y', 'width', 'height', 'rotation', 'points'))
 
 # error message format strings go here
 duplicate_name_fmt = 'Cannot set user {} property on {} "{}"; Tiled property already exists.'
@@ -66,6 +82,11 @@ AnimationFrame = namedtuple('AnimationFrame', ['gid', 'duration'])
 Point = namedtuple("Point", ["x", "y"])
 TileFlags = namedtuple('TileFlags', flag_names)
 
+# TileFlags for each combination of the three Tiled flag bits, indexed by
+# (raw_gid >> GID_FLAGS_SHIFT)
+flag_table = tuple(
+    TileFlags(bool(i & 4), bool(i & 2), bool(i & 1)) for i in range(8))
+
 
 def default_image_loader(filename, flags, **kwargs):
     """ This default image loader just returns filename, rect, and any flags
@@ -94,6 +115,19 @@ def decode_gid(raw_gid):
     return gid, flags
 
 
+def decode_gid_array(raw_gids):
+    """ Decode an array of GIDs from TMX data
+
+    Vectorized version of decode_gid.  The flags are returned as the packed
+    3-bit value of the Tiled flag bits, use it to index flag_table.
+
+    :param raw_gids: array of 32-bit numbers from TMX layer data
+    :return: gids, flag bits (both uint32 arrays)
+    """
+    raw_gids = np.asarray(raw_gids, dtype=np.uint32)
+    return raw_gids & np.uint32(GID_MASK), raw_gids >> np.uint32(GID_FLAGS_SHIFT)
+
+
 def convert_to_bool(value):
     """ Convert a few common variations of "true" and "false" to boolean
 
@@ -217,6 +251,196 @@ def parse_properties(node):
     return d
 
 
+def read_layer_payload(node, encoding):
+    """ Read the still encoded tile data of a layer <data> or <chunk> node
+
+    Base64 text is turned into its (possibly compressed) bytes and CSV is
+    kept as text.  Unencoded tile elements are read straight into an array.
+
+    :param node: etree element holding the encoded tile data
+    :param encoding: encoding of the layer data
+    :return: bytes, str or uint32 array
+    """
+    if encoding == 'base64':
+        from base64 import b64decode
+
+        return b64decode(node.text.strip())
+
+    elif encoding == 'csv':
+        return node.text
+
+    elif encoding:
+        msg = 'TMX encoding type: {0} is not supported.'
+        logger.error(msg.format(encoding))
+        raise Exception(msg.format(encoding))
+
+    # no encoding, so we assume here that it is going to be a bunch
+    # of tile elements
+    return np.fromiter(
+        (int(child.get('gid', 0)) for child in node.findall('tile')),
+        dtype=np.uint32)
+
+
+def decode_layer_payload(payload, encoding, compression, count):
+    """ Decode a payload returned by read_layer_payload into raw GIDs
+
+    Base64 data is decompressed and viewed as little-endian uint32 without
+    copying, CSV data is split once and converted by numpy in a single
+    call.  Malformed CSV values and tile counts that do not match the
+    layer size raise an exception.
+
+    :param payload: encoded tile data
+    :param encoding: encoding of the layer data
+    :param compression: compression of the layer data
+    :param count: number of tiles expected in the data
+    :return: uint32 array of raw (undecoded) GIDs
+    """
+    if encoding == 'base64':
+        if compression == 'gzip':
+            import gzip
+
+            payload = gzip.decompress(payload)
+
+        elif compression == 'zlib':
+            import zlib
+
+            payload = zlib.decompress(payload)
+
+        elif compression:
+            msg = 'TMX compression type: {0} is not supported.'
+            logger.error(msg.format(compression))
+            raise Exception(msg.format(compression))
+
+        raw_gids = np.frombuffer(payload, dtype='<u4')
+
+    elif encoding == 'csv':
+        # Tiled ends every row but the last with a comma and a newline
+        text = ''.join((payload or '').split())
+        try:
+            raw_gids = np.array(text.split(',') if text else [], dtype=np.uint32)
+        except (ValueError, OverflowError) as e:
+            msg = 'layer data is not valid CSV: {0}'
+            logger.error(msg.format(e))
+            raise Exception(msg.format(e))
+
+    else:
+        raw_gids = np.asarray(payload, dtype=np.uint32)
+
+    if len(raw_gids) != count:
+        msg = 'layer data has {0} tiles, expected {1}'
+        logger.error(msg.format(len(raw_gids), count))
+        raise Exception(msg.format(len(raw_gids), count))
+
+    return raw_gids.astype(np.uint32, copy=False)
+
+
+def decode_layer_data(data_node, count):
+    """ Decode the raw GIDs of a layer <data> node
+
+    :param data_node: etree element holding the encoded tile data
+    :param count: number of tiles expected in the data
+    :return: uint32 array of raw (undecoded) GIDs
+    """
+    encoding = data_node.get('encoding', None)
+    compression = data_node.get('compression', None)
+    payload = read_layer_payload(data_node, encoding)
+    return decode_layer_payload(payload, encoding, compression, count)
+
+
+TilesetDescription = namedtuple(
+    'TilesetDescription', ['items', 'properties', 'tiles', 'offset', 'image'])
+TileDescription = namedtuple(
+    'TileDescription', ['id', 'properties', 'image', 'frames', 'colliders'])
+
+# process-wide cache of parsed external tilesets, see load_tileset_description
+_tileset_cache = dict()
+
+
+def parse_tileset_description(node):
+    """ Parse a tileset xml node into an immutable TilesetDescription
+
+    The description holds everything TiledTileset needs that does not depend
+    on the map using the tileset, so it can be shared between maps.
+
+    :param node: etree <tileset> element
+    :return: TilesetDescription
+    """
+    tiles = list()
+    for child in node.iter('tile'):
+        p = {k: types[k](v) for k, v in child.items()}
+        p.update(parse_properties(child))
+
+        image = child.find('image')
+        if image is not None:
+            image = (image.get('source'), image.get('trans', None),
+                     image.get('width'), image.get('height'))
+
+        anim = child.find('animation')
+        frames = tuple()
+        if anim is not None:
+            frames = tuple((int(frame.get('tileid')), int(frame.get('duration')))
+                           for frame in anim.findall('frame'))
+
+        tiles.append(TileDescription(
+            int(child.get('id')), MappingProxyType(p), image, frames,
+            tuple(child.findall('objectgroup'))))
+
+    offset = node.find('tileoffset')
+    if offset is not None:
+        offset = (offset.get('x', 0), offset.get('y', 0))
+
+    image = node.find('image')
+    if image is not None:
+        image = (image.get('source'), image.get('trans', None),
+                 int(image.get('width')), int(image.get('height')))
+
+    return TilesetDescription(
+        tuple(node.items()), MappingProxyType(parse_properties(node)),
+        tuple(tiles), offset, image)
+
+
+def load_tileset_description(path):
+    """ Return the TilesetDescription of an external tileset file
+
+    Descriptions are cached for the whole process, keyed by the resolved
+    path and invalidated when the file date changes.
+
+    :param path: path of the .tsx file
+    :return: TilesetDescription
+    """
+    path = os.path.normpath(path).replace('\\', '/')
+    date = vfs.get_file_date(path)
+
+    cached = _tileset_cache.get(path, None)
+    if cached is not None and cached[0] == date:
+        return cached[1]
+
+    description = parse_tileset_description(ElementTree.parse(path).getroot())
+    _tileset_cache[path] = (date, description)
+    return description
+
+
+def clear_tileset_cache():
+    """ Drop every cached TilesetDescription
+    """
+    _tileset_cache.clear()
+
+
+@lru_cache(maxsize=None)
+def get_tileset_rects(width, height, margin, spacing, tilewidth, tileheight):
+    """ Return the image rects of every tile in a tileset image
+
+    :rtype: tuple of (x, y, width, height) tuples in tile id order
+    """
+    p = product(range(margin,
+                      height + margin - tileheight + 1,
+                      tileheight + spacing),
+                range(margin,
+                      width + margin - tilewidth + 1,
+                      tilewidth + spacing))
+    return tuple((x, y, tilewidth, tileheight) for y, x in p)
+
+
 class TiledElement(object):
     """ Base class for all pytmx types
     """
@@ -273,8 +497,15 @@ class TiledElement(object):
         :param node: etree element
         :return: dict
         """
-        self._cast_and_set_attributes_from_node_items(node.items())
-        properties = parse_properties(node)
+        self._set_properties_from_items(node.items(), parse_properties(node))
+
+    def _set_properties_from_items(self, items, properties):
+        """ Set the Tiled object attributes and properties from parsed data
+
+        :param items: (name, value) pairs of the xml attributes
+        :param properties: dict of Tiled properties
+        """
+        self._cast_and_set_attributes_from_node_items(items)
         if (not self.allow_duplicate_names and
                 self._contains_invalid_property_name(properties.items())):
             self._log_property_error_message()
@@ -298,6 +529,124 @@ class TiledElement(object):
             return '<{}: "{}">'.format(self.__class__.__name__, self.name)
 
 
+class TiledImageSequence(Sequence):
+    """ Lazy sequence of the tile images of a TiledMap, indexed by GID
+
+    The image loader is only invoked the first time a GID is accessed, so
+    tiles that a map never draws do not allocate an image.  The number of
+    images the loader actually produced is kept in materialized_count.
+
+    Sequences compare equal when their GIDs are loaded from the same image
+    sources, without loading any image.
+    """
+
+    # _loaded values of images loaded through the map and images set directly
+    LOADED = 1
+    ASSIGNED = 2
+
+    def __init__(self, tiled_map, length=0):
+        self.tiled_map = tiled_map
+        self.materialized_count = 0
+        self._images = [None] * length
+        self._loaded = bytearray(length)
+
+    def __len__(self):
+        return len(self._images)
+
+    def __getitem__(self, gid):
+        if isinstance(gid, slice):
+            return [self[i] for i in range(*gid.indices(len(self)))]
+
+        if len(self._images) <= gid < self.tiled_map.maxgid:
+            self.resize(self.tiled_map.maxgid)
+
+        if not self._loaded[gid]:
+            self._loaded[gid] = self.LOADED
+            if gid:
+                self._images[gid] = self.load(gid)
+
+        return self._images[gid]
+
+    def __setitem__(self, gid, image):
+        self._images[gid] = image
+        self._loaded[gid] = self.ASSIGNED
+
+    def __eq__(self, other):
+        if isinstance(other, TiledImageSequence):
+            return self.get_sources() == other.get_sources()
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def load(self, gid):
+        """ Invoke the image loader of the parent map for a GID
+
+        :param gid: GID of image
+        :rtype: image returned by the loader, or None
+        """
+        try:
+            image = self.tiled_map.load_tile_image(gid)
+        except ValueError:
+            return None
+
+        if image is not None:
+            self.materialized_count += 1
+        return image
+
+    def get_source(self, gid):
+        """ Return what the image of a GID is loaded from, without loading it
+
+        :param gid: GID of image
+        :rtype: (path, rect, flags) tuple, the image itself if it was set
+                directly, or None
+        """
+        if gid < len(self._loaded) and self._loaded[gid] == self.ASSIGNED:
+            return self._images[gid]
+
+        if not gid:
+            return None
+
+        return self.tiled_map.get_tile_image_source(gid)
+
+    def get_sources(self):
+        """ Return the image source of every GID of the map
+
+        :rtype: list of image sources, see get_source
+        """
+        self.resize(self.tiled_map.maxgid)
+        return [self.get_source(gid) for gid in range(len(self))]
+
+    def is_loaded(self, gid):
+        """ Return True if the image of the GID has been materialized
+
+        :param gid: GID of image
+        :rtype: bool
+        """
+        return gid < len(self._loaded) and bool(self._loaded[gid])
+
+    def append(self, image):
+        """ Append an image that has already been loaded
+
+        :param image: image returned by a loader
+        :return: None
+        """
+        self._images.append(image)
+        self._loaded.append(self.ASSIGNED)
+
+    def resize(self, length):
+        """ Grow the sequence to length, leaving the new GIDs unloaded
+
+        :param length: new length of the sequence
+        :return: None
+        """
+        extra = length - len(self._images)
+        if extra > 0:
+            self._images.extend([None] * extra)
+            self._loaded.extend(bytes(extra))
+
+
 class TiledMap(TiledElement):
     """Contains the layers, objects, and images from a Tiled TMX map
 
@@ -311,13 +660,18 @@ class TiledMap(TiledElement):
         :param image_loader: function that will load images (see below)
         :param optional_gids: load specific tile image GID, even if never used
         :param invert_y: invert the y axis
-        :param load_all_tiles: load all tile images, even if never used
+        :param load_all_tiles: register all tile GIDs, even if never used.
+                               Their images are still only loaded on first
+                               access
         :param allow_duplicate_names: allow duplicates in objects' metatdata
+        :param streaming: parse the file with the streaming iterparse parser
 
         image_loader:
           this must be a reference to a function that will accept a tuple:
           (filename of image, bounding rect of tile in image, flags)
           the function must return a reference to to the tile.
+          tileset images are loaded with a tileset keyword argument, other
+          images with a tiled_map keyword argument.
         """
         TiledElement.__init__(self)
         self.filename = filename
@@ -327,6 +681,7 @@ class TiledMap(TiledElement):
         self.optional_gids = kwargs.get('optional_gids', set())
         self.load_all_tiles = kwargs.get('load_all', True)
         self.invert_y = kwargs.get('invert_y', True)
+        self.streaming = kwargs.get('streaming', False)
 
         # allow duplicate names to be parsed and loaded
         TiledElement.allow_duplicate_names = \
@@ -348,7 +703,10 @@ class TiledMap(TiledElement):
         self.maxgid = 1
 
         # should be filled in by a loader function
-        self.images = list()
+        self.images = TiledImageSequence(self)
+        self.tileset_loaders = dict()  # image loader of each tileset by firstgid
+        self._gid_index = None  # see gid_index
+        self._object_index = None  # see object_index
 
         # defaults from the TMX specification
         self.version = '0.0'
@@ -369,7 +727,10 @@ class TiledMap(TiledElement):
         self.imagemap[(0, 0)] = 0
 
         if filename:
-            self.parse_xml(ElementTree.parse(self.filename).getroot())
+            if self.streaming:
+                self.parse_xml_stream(self.filename)
+            else:
+                self.parse_xml(ElementTree.parse(self.filename).getroot())
 
     def __repr__(self):
         return '<{0}: "{1}">'.format(self.__class__.__name__, self.filename)
@@ -400,7 +761,7 @@ class TiledMap(TiledElement):
         # ***         do not change this load order!         *** #
         # ***    gid mapping errors will occur if changed    *** #
         for subnode in node.findall('layer'):
-            self.add_layer(TiledTileLayer(self, subnode))
+            self.add_layer(self._create_tile_layer(subnode, node.get('infinite') == '1'))
 
         for subnode in node.findall('imagelayer'):
             self.add_layer(TiledImageLayer(self, subnode))
@@ -416,6 +777,109 @@ class TiledMap(TiledElement):
         for subnode in node.findall('tileset'):
             self.add_tileset(TiledTileset(self, subnode))
 
+        self._load_tile_objects()
+        self.reload_images()
+        return self
+
+    def parse_xml_stream(self, source):
+        """ Parse a map from a file using ElementTree.iterparse
+
+        Produces the same map as parse_xml, but never holds the whole
+        document in memory.  Tile layers are decoded as their elements close
+        and every top-level element is cleared once it has been consumed.
+
+        The load order of parse_xml is kept: tile layers register their
+        GIDs as they close, tile object GIDs are registered once all tile
+        layers are loaded and tilesets (which Tiled writes first) are
+        processed last.
+
+        :param source: filename or file object of the TMX map
+        :return: self
+        """
+        tile_layers = list()
+        image_layers = list()
+        objectgroups = list()
+        tileset_nodes = list()
+        deferred = DeferredGidRegistry()
+
+        root = None
+        depth = 0
+        for event, node in ElementTree.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = node
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth != 1:
+                continue
+
+            # only top-level children of the map are handled here; the
+            # map properties are left in place for _set_properties
+            if node.tag == 'layer':
+                tile_layers.append(self._create_tile_layer(node, root.get('infinite') == '1'))
+            elif node.tag == 'imagelayer':
+                image_layers.append(TiledImageLayer(self, node))
+            elif node.tag == 'objectgroup':
+                objectgroups.append(TiledObjectGroup(deferred, node))
+            elif node.tag == 'tileset':
+                tileset_nodes.append(node)
+                continue
+            else:
+                continue
+
+            node.clear()
+            root.remove(node)
+
+        self._set_properties(root)
+        self.background_color = root.get('backgroundcolor',
+                                         self.background_color)
+
+        # ***         do not change this load order!         *** #
+        # ***    gid mapping errors will occur if changed    *** #
+        for layer in chain(tile_layers, image_layers):
+            self.add_layer(layer)
+
+        for objectgroup in objectgroups:
+            objectgroup.parent = self
+            self.add_layer(objectgroup)
+            for obj in objectgroup:
+                obj.parent = self
+                if obj.gid:
+                    obj.gid = self.register_gid(obj.gid)
+                self.objects_by_id[obj.id] = obj
+                self.objects_by_name[obj.name] = obj
+
+        for node in tileset_nodes:
+            self.add_tileset(TiledTileset(self, node))
+            node.clear()
+
+        root.clear()
+        self._load_tile_objects()
+        self.reload_images()
+        return self
+
+    def _create_tile_layer(self, node, infinite=False):
+        """ Create the tile layer type matching a <layer> node
+
+        Layers of infinite maps store their data in chunks and are loaded
+        as a TiledChunkedTileLayer, even when they have no chunks yet.
+
+        :param node: ElementTree xml node
+        :param infinite: True if the layer belongs to an infinite map
+        :return: TiledTileLayer
+        """
+        if infinite or node.find('data/chunk') is not None:
+            return TiledChunkedTileLayer(self, node)
+
+        return TiledTileLayer(self, node)
+
+    def _load_tile_objects(self):
+        """ Apply tileset data to the tile objects of the map
+
+        :return: None
+        """
         # "tile objects", objects with a GID, require their attributes to be
         # set after the tileset is loaded, so this step must be performed last
         # also, this step is performed for objects to load their tiles.
@@ -437,21 +901,21 @@ class TiledMap(TiledElement):
             if self.invert_y:
                 o.y -= o.height
 
-        self.reload_images()
-        return self
-
     def reload_images(self):
         """ Load the map images from disk
 
         This method will use the image loader passed in the constructor
         to do the loading or will use a generic default, in which case no
-        images will be loaded.
+        images will be loaded.  Tile images are loaded the first time they
+        are accessed, except for the GIDs in optional_gids.
 
         :return: None
         """
-        self.images = [None] * self.maxgid
+        self.images = TiledImageSequence(self, self.maxgid)
+        self.tileset_loaders = dict()
 
         # iterate through tilesets to get source images
+        optional = list()
         for ts in self.tilesets:
 
             # skip tilesets without a source
@@ -461,17 +925,10 @@ class TiledMap(TiledElement):
             path = os.path.join(os.path.dirname(self.filename), ts.source)
             colorkey = getattr(ts, 'trans', None)
             loader = self.image_loader(path, colorkey, tileset=ts)
-
-            p = product(range(ts.margin,
-                              ts.height + ts.margin - ts.tileheight + 1,
-                              ts.tileheight + ts.spacing),
-                        range(ts.margin,
-                              ts.width + ts.margin - ts.tilewidth + 1,
-                              ts.tilewidth + ts.spacing))
+            self.tileset_loaders[ts.firstgid] = loader
 
             # iterate through the tiles
-            for real_gid, (y, x) in enumerate(p, ts.firstgid):
-                rect = (x, y, ts.tilewidth, ts.tileheight)
+            for real_gid in range(ts.firstgid, ts.firstgid + len(ts.tile_rects)):
                 gids = self.map_gid(real_gid)
 
                 # gids is None if the tile is never used
@@ -481,13 +938,11 @@ class TiledMap(TiledElement):
                         # TODO: handle flags? - might never be an issue, though
                         gids = [self.register_gid(real_gid, flags=0)]
 
-                if gids:
-                    # flags might rotate/flip the image, so let the loader
-                    # handle that here
-                    for gid, flags in gids:
-                        self.images[gid] = loader(rect, flags)
+                if gids and real_gid in self.optional_gids:
+                    optional.extend(gid for gid, flags in gids)
 
         # load image layer images
+        self.images.resize(self.maxgid)
         for layer in (i for i in self.layers if isinstance(i, TiledImageLayer)):
             source = getattr(layer, 'source', None)
             if source:
@@ -496,21 +951,107 @@ class TiledMap(TiledElement):
                 gid = self.register_gid(real_gid)
                 layer.gid = gid
                 path = os.path.join(os.path.dirname(self.filename), source)
-                loader = self.image_loader(path, colorkey)
+                loader = self.image_loader(path, colorkey, tiled_map=self)
                 image = loader()
                 self.images.append(image)
 
-        # load images in tiles.
-        # instead of making a new gid, replace the reference to the tile that
-        # was loaded from the tileset
-        for real_gid, props in self.tile_properties.items():
-            source = props.get('source', None)
-            if source:
-                colorkey = props.get('trans', None)
-                path = os.path.join(os.path.dirname(self.filename), source)
-                loader = self.image_loader(path, colorkey)
-                image = loader()
-                self.images[real_gid] = image
+        # optional gids are loaded up front, the rest on first access
+        for gid in optional:
+            self.images[gid]
+
+    def load_late_gids(self, first_gid):
+        """ Load the tile properties of GIDs registered after the map
+        was loaded
+
+        Chunks of infinite maps register their GIDs when first decoded,
+        which is after reload_images has run.  Their images are loaded
+        on first access like any other GID.
+
+        :param first_gid: first GID registered since the map was loaded
+        :return: None
+        """
+        if not self.images or first_gid >= self.maxgid:
+            return
+
+        self.images.resize(self.maxgid)
+        for gid in range(first_gid, self.maxgid):
+            tiled_gid = self.tiledgidmap[gid]
+
+            # flipped variants share the properties of their tile
+            for other_gid, flags in self.gidmap[tiled_gid]:
+                if other_gid in self.tile_properties:
+                    self.set_tile_properties(gid, self.tile_properties[other_gid])
+                    break
+
+    def load_tile_image(self, gid):
+        """ Invoke the image loader for a single GID
+
+        :param gid: GID of image
+        :rtype: image returned by the loader, or None if the tileset
+                has no image
+        """
+        tiled_gid = self.tiledgidmap[gid]
+        props = self.tile_properties.get(gid, {})
+        source = props.get('source', None)
+        if source:
+            colorkey = props.get('trans', None)
+            path = os.path.join(os.path.dirname(self.filename), source)
+            return self.image_loader(path, colorkey, tiled_map=self)()
+
+        ts = self.get_tileset_from_gid(gid)
+        loader = self.tileset_loaders.get(ts.firstgid, None)
+        if loader is None:
+            return None
+
+        flags = next((f for g, f in self.gidmap[tiled_gid] if g == gid), None)
+        return loader(ts.get_tile_rect(tiled_gid - ts.firstgid), flags)
+
+    def get_tile_image_source(self, gid):
+        """ Return the image file, rect and flags the image of a GID is
+        loaded from, without invoking the image loader
+
+        :param gid: GID of image
+        :rtype: (path, rect, flags) tuple, rect and flags are None for
+                whole image tiles, or None if the tile has no image
+        """
+        tiled_gid = self.tiledgidmap.get(gid, None)
+        if tiled_gid is None:
+            return None
+
+        dirname = os.path.dirname(self.filename or '')
+        source = self.tile_properties.get(gid, {}).get('source', None)
+        if source:
+            return os.path.join(dirname, source), None, None
+
+        try:
+            ts = self.get_tileset_from_gid(gid)
+        except ValueError:
+            return None
+
+        if ts.source is None:
+            return None
+
+        flags = next((f for g, f in self.gidmap[tiled_gid] if g == gid), None)
+        return os.path.join(dirname, ts.source), tuple(ts.get_tile_rect(tiled_gid - ts.firstgid)), flags
+
+    def _get_layer_gid(self, x, y, layer):
+        """ Return the GID of a tile of a tile layer
+
+        Chunked layers of infinite maps resolve the tile through their
+        chunks and accept negative coordinates.
+
+        :param x: x coordinate
+        :param y: y coordinate
+        :param layer: TiledTileLayer or TiledChunkedTileLayer
+        :rtype: GID, IndexError if the tile is outside of a finite layer
+        """
+        if isinstance(layer, TiledChunkedTileLayer):
+            return layer.get_tile_gid(x, y)
+
+        if not (x >= 0 and y >= 0):
+            raise IndexError("Tile coordinates must be non-negative, were ({0}, {1})".format(x, y))
+
+        return int(layer.data[y][x])
 
     def get_tile_image(self, x, y, layer):
         """ Return the tile image for this location
@@ -520,18 +1061,17 @@ class TiledMap(TiledElement):
         :param layer: layer number
         :rtype: surface if found, otherwise 0
         """
-        if not (x >= 0 and y >= 0):
-            raise ValueError("Tile coordinates must be non-negative, were ({0}, {1})".format(x,y))
-
         try:
             layer = self.layers[layer]
         except IndexError:
             raise ValueError("Layer not found")
 
-        assert (isinstance(layer, TiledTileLayer))
+        assert (isinstance(layer, (TiledTileLayer, TiledChunkedTileLayer)))
+        if not isinstance(layer, TiledChunkedTileLayer) and not (x >= 0 and y >= 0):
+            raise ValueError("Tile coordinates must be non-negative, were ({0}, {1})".format(x,y))
 
         try:
-            gid = layer.data[y][x]
+            gid = self._get_layer_gid(x, y, layer)
         except (IndexError, ValueError):
             raise ValueError("GID not found")
         except TypeError:
@@ -568,11 +1108,11 @@ class TiledMap(TiledElement):
         :param layer: layer number
         :rtype: surface if found, otherwise ValueError
         """
-        if not (x >= 0 and y >= 0 and layer >= 0):
-            raise ValueError("Tile coordinates and layers must be non-negative, were ({0}, {1}), layer={2}".format(x,y, layer))
+        if not (layer >= 0):
+            raise ValueError("Layers must be non-negative, was {0}".format(layer))
 
         try:
-            return self.layers[int(layer)].data[int(y)][int(x)]
+            return self._get_layer_gid(int(x), int(y), self.layers[int(layer)])
         except (IndexError, ValueError):
             msg = "Coords: ({0},{1}) in layer {2} is invalid"
             logger.debug(msg.format(x, y, layer))
@@ -586,11 +1126,11 @@ class TiledMap(TiledElement):
         :param layer: layer number
         :rtype: python dict if found, otherwise None
         """
-        if not (x >= 0 and y >= 0 and layer >= 0):
-            raise ValueError("Tile coordinates and layers must be non-negative, were ({0}, {1}), layer={2}".format(x,y, layer))
+        if not (layer >= 0):
+            raise ValueError("Layers must be non-negative, was {0}".format(layer))
 
         try:
-            gid = self.layers[int(layer)].data[int(y)][int(x)]
+            gid = self._get_layer_gid(int(x), int(y), self.layers[int(layer)])
         except (IndexError, ValueError):
             msg = "Coords: ({0},{1}) in layer {2} is invalid."
             logger.debug(msg.format(x, y, layer))
@@ -617,9 +1157,89 @@ class TiledMap(TiledElement):
         :param gid: GID to be searched for
         :rtype: generator of tile locations
         """
-        for l in self.visible_tile_layers:
-            for x, y, _gid in [i for i in self.layers[l].iter_data() if i[2] == gid]:
-                yield x, y, l
+        for x, y, l in self.get_tile_coordinates_by_gid(gid).tolist():
+            yield x, y, l
+
+    def get_tile_coordinates_by_gid(self, gid):
+        """ Return the locations of a GID in the visible tile layers
+
+        Uses the map's GID index, so the cost is proportional to the
+        number of locations found.
+
+        :param gid: GID to be searched for
+        :rtype: (N, 3) int array of x, y, layer rows
+        """
+        return self.gid_index.get_coordinates(gid, self.visible_tile_layers)
+
+    def get_gids_by_property(self, name, value=None):
+        """ Return the GIDs that have a tile property
+
+        :param name: name of the tile property
+        :param value: if given, only return GIDs whose property equals value
+        :rtype: list of GIDs
+        """
+        return self.gid_index.get_gids_by_property(name, value)
+
+    def get_tile_coordinates_by_property(self, name, value=None):
+        """ Return the locations of tiles that have a tile property
+
+        :param name: name of the tile property
+        :param value: if given, only match tiles whose property equals value
+        :rtype: (N, 3) int array of x, y, layer rows
+        """
+        coordinates = [self.get_tile_coordinates_by_gid(gid)
+                       for gid in self.get_gids_by_property(name, value)]
+        if not coordinates:
+            return np.zeros((0, 3), dtype=np.int64)
+
+        return np.concatenate(coordinates)
+
+    @property
+    def gid_index(self):
+        """ Return the GID index of the map, creating it on first use
+
+        :rtype: TiledGidIndex
+        """
+        if self._gid_index is None:
+            self._gid_index = TiledGidIndex(self)
+        return self._gid_index
+
+    def set_tile_gid(self, x, y, layer, gid):
+        """ Change the GID of a tile at runtime
+
+        :param x: x coordinate
+        :param y: y coordinate
+        :param layer: layer number
+        :param gid: new GID of the tile
+        """
+        self.layers[int(layer)].set_tile_gid(x, y, gid)
+
+    def import_gids(self, other, data):
+        """ Translate a GID array of another map into the GIDs of this map
+
+        Both maps must use the same tilesets.  Tiles that this map has not
+        seen yet are registered, along with their tile properties.
+
+        :param other: TiledMap the data belongs to
+        :param data: array of GIDs of other
+        :rtype: array of GIDs of this map, same shape as data
+        """
+        flags_by_gid = {gid: flags for gids in other.gidmap.values()
+                        for gid, flags in gids}
+        values, inverse = np.unique(data, return_inverse=True)
+        lut = np.zeros(len(values), dtype=np.uint32)
+
+        first_gid = self.maxgid
+        for i, gid in enumerate(values.tolist()):
+            if not gid:
+                continue
+
+            lut[i] = self.register_gid(other.tiledgidmap[gid], flags_by_gid[gid])
+            if lut[i] >= first_gid and gid in other.tile_properties:
+                self.set_tile_properties(int(lut[i]), other.tile_properties[gid])
+
+        self.load_late_gids(first_gid)
+        return lut[inverse.ravel()].reshape(data.shape)
 
     def get_tile_properties_by_gid(self, gid):
         """ Get the tile properties of a tile GID
@@ -639,6 +1259,8 @@ class TiledMap(TiledElement):
         :param properties: python dict of properties for GID
         """
         self.tile_properties[gid] = properties
+        if self._gid_index is not None:
+            self._gid_index.invalidate_properties()
 
     def get_tile_properties_by_layer(self, layer):
         """ Get the tile properties of each GID in layer
@@ -654,8 +1276,10 @@ class TiledMap(TiledElement):
             logger.debug(msg.format(type(layer)))
             raise ValueError
 
-        p = product(range(self.width), range(self.height))
-        layergids = set(self.layers[layer].data[y][x] for x, y in p)
+        if isinstance(self.layers[layer], TiledChunkedTileLayer):
+            layergids = self.layers[layer].get_gids()
+        else:
+            layergids = self.gid_index.get_layer_gids(layer)
 
         for gid in layergids:
             try:
@@ -670,10 +1294,12 @@ class TiledMap(TiledElement):
         """
         assert (
             isinstance(layer,
-                       (TiledTileLayer, TiledImageLayer, TiledObjectGroup)))
+                       (TiledTileLayer, TiledChunkedTileLayer, TiledImageLayer, TiledObjectGroup)))
 
         self.layers.append(layer)
         self.layernames[layer.name] = layer
+        self._gid_index = None
+        self._object_index = None
 
     def add_tileset(self, tileset):
         """ Add a tileset to the map
@@ -696,6 +1322,49 @@ class TiledMap(TiledElement):
             logger.debug(msg.format(name))
             raise ValueError(msg.format(name))
 
+    @property
+    def object_index(self):
+        """ Return the spatial index of the map objects, creating it on
+        first use
+
+        :rtype: TiledObjectIndex
+        """
+        if self._object_index is None:
+            self._object_index = TiledObjectIndex(self)
+        return self._object_index
+
+    def add_object(self, obj, layer):
+        """ Add an object to an object group of the map
+
+        :param obj: TiledObject
+        :param layer: TiledObjectGroup or layer number
+        """
+        if isinstance(layer, int):
+            layer = self.layers[layer]
+
+        assert (isinstance(layer, TiledObjectGroup))
+        layer.append(obj)
+        self.objects_by_id[obj.id] = obj
+        self.objects_by_name[obj.name] = obj
+        if self._object_index is not None:
+            self._object_index.add(obj)
+
+    def remove_object(self, obj):
+        """ Remove an object from the map
+
+        :param obj: TiledObject
+        """
+        for layer in self.objectgroups:
+            if any(other is obj for other in layer):
+                layer[:] = [other for other in layer if other is not obj]
+
+        if self.objects_by_id.get(obj.id, None) is obj:
+            del self.objects_by_id[obj.id]
+        if self.objects_by_name.get(obj.name, None) is obj:
+            del self.objects_by_name[obj.name]
+        if self._object_index is not None:
+            self._object_index.remove(obj)
+
     def get_object_by_id(self, obj_id):
         """Find an object
 
@@ -806,6 +1475,41 @@ class TiledMap(TiledElement):
         else:
             return 0
 
+    def register_gids(self, raw_gids):
+        """ Register every GID of an array of raw TMX data at once
+
+        Only the unique values of the array are registered, in the order
+        they first appear, so the resulting pytmx GIDs are identical to
+        calling register_gid(*decode_gid(raw)) on each value in turn.
+
+        :param raw_gids: array of 32-bit numbers from TMX layer data
+        :rtype: uint32 array of pytmx GIDs with the same shape as raw_gids
+        """
+        raw_gids = np.asarray(raw_gids, dtype=np.uint32)
+        unique, first, inverse = np.unique(
+            raw_gids, return_index=True, return_inverse=True)
+        gids, flags = decode_gid_array(unique)
+
+        lut = np.zeros(len(unique), dtype=np.uint32)
+        for i in np.argsort(first, kind='stable').tolist():
+            lut[i] = self.register_gid(int(gids[i]), flag_table[flags[i]])
+
+        return lut[inverse.ravel()].reshape(raw_gids.shape)
+
+    def register_late_gids(self, raw_gids):
+        """ Register raw TMX GIDs after the map was loaded
+
+        Tiles that this map has not seen yet are registered and given the
+        tile properties of their flipped variants.
+
+        :param raw_gids: array of 32-bit numbers as found in TMX layer data
+        :rtype: uint32 array of pytmx GIDs with the same shape as raw_gids
+        """
+        first_gid = self.maxgid
+        gids = self.register_gids(raw_gids)
+        self.load_late_gids(first_gid)
+        return gids
+
     def map_gid(self, tiled_gid):
         """ Used to lookup a GID read from a TMX file's data
 
@@ -837,6 +1541,310 @@ class TiledMap(TiledElement):
             return [(gid, None)]
 
 
+class TiledGidIndex(object):
+    """ Inverted index from GID to tile locations of a TiledMap
+
+    Each tile layer is indexed on first query with a single argsort of its
+    data.  Changed tiles are moved from the locations of their old GID to
+    those of their new GID, so the layer is never scanned again.  The
+    property index maps property names to the GIDs that carry them.
+    """
+
+    def __init__(self, tiled_map):
+        self.tiled_map = tiled_map
+        self._layers = dict()  # layer number -> {gid: sorted flat indices}
+        self._properties = None  # property name -> list of gids
+
+    def _get_layer_number(self, layer):
+        """ Return the number of a layer of the map, or None for layers
+        the map does not hold, such as the chunk layers of infinite maps
+        """
+        if isinstance(layer, int):
+            return layer
+
+        for number, map_layer in enumerate(self.tiled_map.layers):
+            if map_layer is layer:
+                return number
+
+        return None
+
+    def _get_layer_index(self, layer):
+        index = self._layers.get(layer, None)
+        if index is None:
+            data = self.tiled_map.layers[layer].data.ravel()
+            order = np.argsort(data, kind='stable')
+            gids, starts = np.unique(data[order], return_index=True)
+            index = dict(zip(gids.tolist(), np.split(order, starts[1:])))
+            self._layers[layer] = index
+
+        return index
+
+    def get_layer_gids(self, layer):
+        """ Return the GIDs used by a tile layer
+
+        :param layer: layer number
+        :rtype: list of GIDs
+        """
+        return [gid for gid in list(self._get_layer_index(layer))
+                if len(self.get_flat_indices(gid, layer))]
+
+    def get_flat_indices(self, gid, layer):
+        """ Return the flat (y * width + x) indices of a GID in a layer
+
+        :param gid: GID to be searched for
+        :param layer: layer number
+        :rtype: int array
+        """
+        return self._get_layer_index(layer).get(gid, np.zeros(0, dtype=np.intp))
+
+    def get_coordinates(self, gid, layers):
+        """ Return the locations of a GID in the requested layers
+
+        :param gid: GID to be searched for
+        :param layers: iterable of layer numbers
+        :rtype: (N, 3) int array of x, y, layer rows
+        """
+        coordinates = list()
+        for layer in layers:
+            indices = self.get_flat_indices(gid, layer)
+            if len(indices):
+                ys, xs = np.divmod(indices, self.tiled_map.layers[layer].width)
+                coordinates.append(np.column_stack(
+                    (xs, ys, np.full(len(indices), layer))))
+
+        if not coordinates:
+            return np.zeros((0, 3), dtype=np.int64)
+
+        return np.concatenate(coordinates).astype(np.int64, copy=False)
+
+    def get_gids_by_property(self, name, value=None):
+        """ Return the GIDs that have a tile property
+
+        :param name: name of the tile property
+        :param value: if given, only return GIDs whose property equals value
+        :rtype: list of GIDs
+        """
+        if self._properties is None:
+            self._properties = defaultdict(list)
+            for gid, props in self.tiled_map.tile_properties.items():
+                for key in props:
+                    self._properties[key].append(gid)
+
+        gids = self._properties.get(name, list())
+        if value is None:
+            return list(gids)
+
+        properties = self.tiled_map.tile_properties
+        return [gid for gid in gids if properties[gid][name] == value]
+
+    def update(self, layer, indices, old_gids, new_gids):
+        """ Move changed tiles of a layer from the locations of their old
+        GIDs to the locations of their new GIDs
+
+        :param layer: TiledTileLayer or layer number
+        :param indices: flat (y * width + x) indices of the changed tiles
+        :param old_gids: GIDs of the tiles before the change
+        :param new_gids: GIDs of the tiles after the change
+        """
+        index = self._layers.get(self._get_layer_number(layer), None)
+        if index is None:
+            return
+
+        indices = np.asarray(indices, dtype=np.intp)
+        old_gids = np.asarray(old_gids)
+        new_gids = np.asarray(new_gids)
+        for gid in np.unique(old_gids).tolist():
+            remaining = np.setdiff1d(index[gid], indices[old_gids == gid], assume_unique=True)
+            if len(remaining):
+                index[gid] = remaining
+            else:
+                del index[gid]
+
+        for gid in np.unique(new_gids).tolist():
+            index[gid] = np.union1d(index.get(gid, np.zeros(0, dtype=np.intp)), indices[new_gids == gid])
+
+    def invalidate_layer(self, layer):
+        """ Drop the index of a layer, it is rebuilt on the next query
+
+        :param layer: TiledTileLayer or layer number
+        """
+        self._layers.pop(self._get_layer_number(layer), None)
+
+    def invalidate_properties(self):
+        """ Drop the property index, it is rebuilt on the next query
+        """
+        self._properties = None
+
+
+class TiledObjectIndex(object):
+    """ Uniform grid index over the bounds of the objects of a TiledMap
+
+    Every object is stored in each grid cell its axis aligned bounds
+    overlap; polygon and polyline objects use the bounds of their points.
+    Objects keep the index up to date when their position or size changes.
+    Objects added to a map after it was loaded must go through
+    TiledMap.add_object.
+    """
+
+    def __init__(self, tiled_map, cell_size=None):
+        if cell_size is None:
+            cell_size = max(tiled_map.tilewidth, tiled_map.tileheight, 1) * 4
+
+        self.tiled_map = tiled_map
+        self.cell_size = cell_size
+        self._cells = defaultdict(dict)  # (cx, cy) -> {id(obj): obj}
+        self._entries = dict()  # id(obj) -> (order, bounds, cells)
+        self._order = 0
+
+        for obj in tiled_map.objects:
+            self.add(obj)
+
+    @staticmethod
+    def get_object_bounds(obj):
+        """ Return the axis aligned bounds of an object
+
+        :param obj: TiledObject
+        :rtype: (left, top, right, bottom) tuple
+        """
+        if obj.rotation:
+            points = obj.apply_transformations()
+        elif hasattr(obj, 'points'):
+            points = obj.points
+        else:
+            return obj.x, obj.y, obj.x + obj.width, obj.y + obj.height
+
+        xs = [point[0] for point in points]
+        ys = [point[1] for point in points]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def _get_cells(self, left, top, right, bottom):
+        size = self.cell_size
+        return [(cx, cy)
+                for cy in range(int(top // size), int(bottom // size) + 1)
+                for cx in range(int(left // size), int(right // size) + 1)]
+
+    def add(self, obj):
+        """ Add an object to the index
+
+        :param obj: TiledObject
+        """
+        if id(obj) in self._entries:
+            return self.update(obj)
+
+        bounds = self.get_object_bounds(obj)
+        cells = self._get_cells(*bounds)
+        for cell in cells:
+            self._cells[cell][id(obj)] = obj
+
+        self._entries[id(obj)] = (self._order, bounds, cells)
+        self._order += 1
+
+    def remove(self, obj):
+        """ Remove an object from the index
+
+        :param obj: TiledObject
+        """
+        entry = self._entries.pop(id(obj), None)
+        if entry is None:
+            return
+
+        for cell in entry[2]:
+            objects = self._cells[cell]
+            del objects[id(obj)]
+            if not objects:
+                del self._cells[cell]
+
+    def update(self, obj):
+        """ Re-index an object after its position or size has changed
+
+        Objects that are not in the index are ignored.
+
+        :param obj: TiledObject
+        """
+        entry = self._entries.get(id(obj), None)
+        if entry is None:
+            return
+
+        order, old_bounds, old_cells = entry
+        bounds = self.get_object_bounds(obj)
+        cells = self._get_cells(*bounds)
+        if cells != old_cells:
+            for cell in old_cells:
+                objects = self._cells[cell]
+                del objects[id(obj)]
+                if not objects:
+                    del self._cells[cell]
+            for cell in cells:
+                self._cells[cell][id(obj)] = obj
+
+        self._entries[id(obj)] = (order, bounds, cells)
+
+    def _query(self, left, top, right, bottom, predicate):
+        found = dict()
+        for cell in self._get_cells(left, top, right, bottom):
+            objects = self._cells.get(cell, None)
+            if objects:
+                found.update(objects)
+
+        entries = self._entries
+        result = [(entries[key][0], obj) for key, obj in found.items()
+                  if predicate(entries[key][1])]
+        result.sort(key=itemgetter(0))
+        return [obj for order, obj in result]
+
+    def query_rect(self, x, y, width, height):
+        """ Return the objects whose bounds overlap a rectangle
+
+        :param x: left of the rectangle in pixels
+        :param y: top of the rectangle in pixels
+        :param width: width of the rectangle in pixels
+        :param height: height of the rectangle in pixels
+        :rtype: list of TiledObjects in map order
+        """
+        right, bottom = x + width, y + height
+        return self._query(x, y, right, bottom, lambda b: (
+            b[0] <= right and b[2] >= x and b[1] <= bottom and b[3] >= y))
+
+    def query_radius(self, x, y, radius):
+        """ Return the objects whose bounds are within radius of a point
+
+        :param x: x coordinate in pixels
+        :param y: y coordinate in pixels
+        :param radius: radius in pixels
+        :rtype: list of TiledObjects in map order
+        """
+        def predicate(b):
+            dx = max(b[0] - x, 0, x - b[2])
+            dy = max(b[1] - y, 0, y - b[3])
+            return dx * dx + dy * dy <= radius * radius
+
+        return self._query(x - radius, y - radius, x + radius, y + radius, predicate)
+
+    def query_point(self, x, y):
+        """ Return the objects whose bounds contain a point
+
+        :param x: x coordinate in pixels
+        :param y: y coordinate in pixels
+        :rtype: list of TiledObjects in map order
+        """
+        return self._query(x, y, x, y, lambda b: (
+            b[0] <= x <= b[2] and b[1] <= y <= b[3]))
+
+
+class DeferredGidRegistry(object):
+    """ Stand-in parent for objects parsed before the map is ready to
+    register their GIDs
+
+    Used by the streaming parser, which may see object groups before all
+    tile layers have been loaded.  The raw GID is kept on the object and is
+    registered with the real map afterwards, in the parse_xml load order.
+    """
+
+    @staticmethod
+    def register_gid(tiled_gid, flags=None):
+        return tiled_gid
+
+
 class TiledTileset(TiledElement):
     """ Represents a Tiled Tileset
 
@@ -852,6 +1860,7 @@ class TiledTileset(TiledElement):
         # defaults from the specification
         self.firstgid = 0
         self.source = None
+        self.tileset_source = None  # external TSX file, relative to the map
         self.name = None
         self.tilewidth = 0
         self.tileheight = 0
@@ -867,17 +1876,42 @@ class TiledTileset(TiledElement):
 
         self.parse_xml(node)
 
+    @property
+    def tile_rects(self):
+        """ Return the image rects of every tile in the tileset
+
+        :rtype: tuple of (x, y, width, height) tuples in tile id order
+        """
+        return get_tileset_rects(self.width, self.height, self.margin,
+                                 self.spacing, self.tilewidth, self.tileheight)
+
+    def get_tile_rect(self, tile_id):
+        """ Return the image rect of a tile in this tileset
+
+        Matches the tile order used by TiledMap.reload_images.
+
+        :param tile_id: local id of the tile in the tileset
+        :rtype: (x, y, width, height) tuple
+        """
+        columns = len(range(self.margin,
+                            self.width + self.margin - self.tilewidth + 1,
+                            self.tilewidth + self.spacing))
+        row, column = divmod(tile_id, max(columns, 1))
+        return (self.margin + column * (self.tilewidth + self.spacing),
+                self.margin + row * (self.tileheight + self.spacing),
+                self.tilewidth,
+                self.tileheight)
+
     def parse_xml(self, node):
         """ Parse a Tileset from ElementTree xml element
 
         A bit of mangling is done here so that tilesets that have external
-        TSX files appear the same as those that don't
+        TSX files appear the same as those that don't.  External tilesets
+        are parsed once per process, see load_tileset_description.
 
         :param node: ElementTree element
         :return: self
         """
-        import os
-
         # if true, then node references an external tileset
         source = node.get('source', None)
         if source:
@@ -885,6 +1919,7 @@ class TiledTileset(TiledElement):
 
                 # external tilesets don't save this, store it for later
                 self.firstgid = int(node.get('firstgid'))
+                self.tileset_source = source
 
                 # we need to mangle the path - tiled stores relative paths
                 dirname = os.path.dirname(self.parent.filename)
@@ -894,7 +1929,7 @@ class TiledTileset(TiledElement):
                     raise Exception("Cannot find tileset file {0} from {1}, should be at {2}".format(source, self.parent.filename, path))
                 
                 try:
-                    node = ElementTree.parse(path).getroot()
+                    description = load_tileset_description(path)
                 except IOError as io:
                     msg = "Error loading external tileset: {0}"
                     logger.error(msg.format(path))
@@ -903,72 +1938,73 @@ class TiledTileset(TiledElement):
                 msg = "Found external tileset, but cannot handle type: {0}"
                 logger.error(msg.format(self.source))
                 raise Exception(msg.format(self.source))
+        else:
+            description = parse_tileset_description(node)
 
-        self._set_properties(node)
+        return self.apply_description(description, source)
+
+    def apply_description(self, description, source=None):
+        """ Set up the tileset from a TilesetDescription
+
+        Registers the GIDs and tile properties of the tileset with the
+        parent map, using this tileset's firstgid.
+
+        :param description: TilesetDescription
+        :param source: path of the external tileset relative to the map
+        :return: self
+        """
+        self._set_properties_from_items(
+            description.items, dict(description.properties))
 
         # since tile objects [probably] don't have a lot of metadata,
         # we store it separately in the parent (a TiledMap instance)
         register_gid = self.parent.register_gid
-        for child in node.iter('tile'):
-            tiled_gid = int(child.get("id"))
-
-            p = {k: types[k](v) for k, v in child.items()}
-            p.update(parse_properties(child))
+        for tile in description.tiles:
+            p = dict(tile.properties)
             
             # images are listed as relative to the .tsx file, not the .tmx file:
             if source and "path" in p:
                 p["path"] = os.path.join(os.path.dirname(source), p["path"])
 
             # handle tiles that have their own image
-            image = child.find('image')
-            if image is None:
+            if tile.image is None:
                 p['width'] = self.tilewidth
                 p['height'] = self.tileheight
             else:
-                tile_source = image.get('source')
+                tile_source, trans, width, height = tile.image
                 # images are listed as relative to the .tsx file, not the .tmx file:
                 if source and tile_source:
                     tile_source = os.path.join(os.path.dirname(source), tile_source)
                 p['source'] = tile_source
-                p['trans'] = image.get('trans', None)
-                p['width'] = image.get('width')
-                p['height'] = image.get('height')
+                p['trans'] = trans
+                p['width'] = width
+                p['height'] = height
 
             # handle tiles with animations
-            anim = child.find('animation')
             frames = list()
             p['frames'] = frames
-            if anim is not None:
-                for frame in anim.findall("frame"):
-                    duration = int(frame.get('duration'))
-                    gid = register_gid(int(frame.get('tileid')) + self.firstgid)
-                    frames.append(AnimationFrame(gid, duration))
+            for tileid, duration in tile.frames:
+                gid = register_gid(tileid + self.firstgid)
+                frames.append(AnimationFrame(gid, duration))
 
-            for objgrp_node in child.findall("objectgroup"):
+            for objgrp_node in tile.colliders:
                 objectgroup = TiledObjectGroup(self.parent, objgrp_node)
                 p["colliders"] = objectgroup
 
-            for gid, flags in self.parent.map_gid2(tiled_gid + self.firstgid):
+            for gid, flags in self.parent.map_gid2(tile.id + self.firstgid):
                 self.parent.set_tile_properties(gid, p)
 
         # handle the optional 'tileoffset' node
-        self.offset = node.find('tileoffset')
+        self.offset = description.offset
         if self.offset is None:
             self.offset = (0, 0)
-        else:
-            self.offset = (self.offset.get('x', 0), self.offset.get('y', 0))
 
-        image_node = node.find('image')
-        if image_node is not None:
-            self.source = image_node.get('source')
+        if description.image is not None:
+            self.source, self.trans, self.width, self.height = description.image
             
             # When loading from tsx, tileset image path is relative to the tsx file, not the tmx:
             if source:
                 self.source = os.path.join(os.path.dirname(source), self.source)
-            
-            self.trans = image_node.get('trans', None)
-            self.width = int(image_node.get('width'))
-            self.height = int(image_node.get('height'))
 
         return self
 
@@ -979,10 +2015,10 @@ class TiledTileLayer(TiledElement):
     To just get the tile images, use TiledTileLayer.tiles()
     """
 
-    def __init__(self, parent, node):
+    def __init__(self, parent, node=None):
         TiledElement.__init__(self)
         self.parent = parent
-        self.data = list()
+        self.data = np.zeros((0, 0), dtype=np.uint32)
 
         # defaults from the specification
         self.name = None
@@ -993,7 +2029,8 @@ class TiledTileLayer(TiledElement):
         self.offsetx = 0
         self.offsety = 0
 
-        self.parse_xml(node)
+        if node is not None:
+            self.parse_xml(node)
 
     def __iter__(self):
         return self.iter_data()
@@ -1005,7 +2042,7 @@ class TiledTileLayer(TiledElement):
 
         :return: Generator
         """
-        for y, row in enumerate(self.data):
+        for y, row in enumerate(self.data.tolist()):
             for x, gid in enumerate(row):
                 yield x, y, gid
 
@@ -1019,9 +2056,60 @@ class TiledTileLayer(TiledElement):
         :return: (x, y, image) tuples
         """
         images = self.parent.images
-        for x, y, gid in [i for i in self.iter_data() if i[2]]:
+        ys, xs = np.nonzero(self.data)
+        gids = self.data[ys, xs]
+        for x, y, gid in zip(xs.tolist(), ys.tolist(), gids.tolist()):
             yield x, y, images[gid]
 
+    def set_tile_gid(self, x, y, gid):
+        """ Change the GID of a tile at runtime
+
+        Keeps the map's GID index up to date.
+
+        :param x: x coordinate
+        :param y: y coordinate
+        :param gid: new GID of the tile
+        """
+        old_gid = int(self.data[y, x])
+        self.data[y, x] = gid
+        self.parent.gid_index.update(self, (y * self.width + x,), (old_gid,), (gid,))
+
+    def set_data(self, data):
+        """ Replace the GIDs of the layer, writing only the changed tiles
+
+        Keeps the map's GID index up to date.
+
+        :param data: (height, width) array of GIDs of the parent map
+        :rtype: (ys, xs) arrays of the coordinates of the changed tiles
+        """
+        return self.set_tiles(0, 0, data)
+
+    def set_tiles(self, x, y, data):
+        """ Replace the GIDs of a region of the layer, writing only the
+        changed tiles
+
+        Keeps the map's GID index up to date.
+
+        :param x: column of the region's top left tile
+        :param y: row of the region's top left tile
+        :param data: (height, width) array of GIDs of the parent map
+        :rtype: (ys, xs) arrays of the layer coordinates of the changed tiles
+        """
+        height, width = data.shape
+        region = self.data[y:y + height, x:x + width]
+        if region.shape != data.shape:
+            raise ValueError('Region ({}, {}, {}, {}) is outside of layer {}'.format(
+                x, y, width, height, self.name))
+
+        changed = region != data
+        ys, xs = np.nonzero(changed)
+        if len(ys):
+            old_gids = region[changed]
+            region[changed] = data[changed]
+            self.parent.gid_index.update(self, (ys + y) * self.width + xs + x, old_gids, data[changed])
+
+        return ys + y, xs + x
+
     def _set_properties(self, node):
         TiledElement._set_properties(self, node)
 
@@ -1037,78 +2125,290 @@ class TiledTileLayer(TiledElement):
         :param node: ElementTree xml node
         :return: self
         """
-        import struct
-        import array
-
         self._set_properties(node)
-        data = None
-        next_gid = None
         data_node = node.find('data')
         chunk_nodes = data_node.findall('chunk')
         if chunk_nodes:
-            msg = 'TMX map size: infinite is not supported.'
+            msg = 'TMX map size: infinite is only supported by TiledChunkedTileLayer.'
             logger.error(msg)
-            raise Exception
+            raise Exception(msg)
 
-        encoding = data_node.get('encoding', None)
-        if encoding == 'base64':
-            from base64 import b64decode
+        # decode and register the whole layer at once; only the unique
+        # raw values are passed through register_gid
+        raw_gids = decode_layer_data(data_node, self.width * self.height)
+        self.data = self.parent.register_gids(raw_gids).reshape(
+            self.height, self.width)
 
-            data = b64decode(data_node.text.strip())
+        return self
 
-        elif encoding == 'csv':
-            next_gid = map(int, "".join(
-                line.strip() for line in data_node.text.strip()).split(","))
 
-        elif encoding:
-            msg = 'TMX encoding type: {0} is not supported.'
-            logger.error(msg.format(encoding))
-            raise Exception(msg.format(encoding))
+class TiledLayerChunk(object):
+    """ Represents a chunk of an infinite map tile layer
 
-        compression = data_node.get('compression', None)
-        if compression == 'gzip':
-            import gzip
+    The chunk keeps its encoded (and compressed) payload until its data is
+    first accessed.  GIDs are registered with the map when the chunk is
+    decoded, so they are numbered in the order chunks are accessed.
+    """
 
-            with gzip.GzipFile(fileobj=BytesIO(data)) as fh:
-                data = fh.read()
+    def __init__(self, layer, node, encoding, compression):
+        self.layer = layer
+        self.x = int(node.get('x'))
+        self.y = int(node.get('y'))
+        self.width = int(node.get('width'))
+        self.height = int(node.get('height'))
 
-        elif compression == 'zlib':
-            import zlib
+        self._encoding = encoding
+        self._compression = compression
+        self._payload = read_layer_payload(node, encoding)
+        self._data = None
 
-            data = zlib.decompress(data)
+    def __repr__(self):
+        return '<{0}: "{1}" ({2}, {3})>'.format(
+            self.__class__.__name__, self.layer.name, self.x, self.y)
 
-        elif compression:
-            msg = 'TMX compression type: {0} is not supported.'
-            logger.error(msg.format(compression))
-            raise Exception(msg.format(compression))
+    @property
+    def name(self):
+        """ Return the name of the chunk, unique within its map
+        """
+        return '{0}@{1},{2}'.format(self.layer.name, self.x, self.y)
 
-        # if data is None, then it was not decoded or decompressed, so
-        # we assume here that it is going to be a bunch of tile elements
-        # TODO: this will/should raise an exception if there are no tiles
-        if encoding == next_gid is None:
-            def get_children(parent):
-                for child in parent.findall('tile'):
-                    yield int(child.get('gid'))
-
-            next_gid = get_children(data_node)
-
-        elif data:
-            if type(data) == bytes:
-                fmt = struct.Struct('<L')
-                iterator = (data[i:i + 4] for i in range(0, len(data), 4))
-                next_gid = (fmt.unpack(i)[0] for i in iterator)
-            else:
-                msg = 'layer data not in expected format ({})'
-                logger.error(msg.format(type(data)))
-                raise Exception(msg.format(type(data)))
+    @property
+    def bounds(self):
+        """ Return the tile bounds of the chunk
+
+        :rtype: (min_x, min_y, max_x, max_y) tuple, max is exclusive
+        """
+        return self.x, self.y, self.x + self.width, self.y + self.height
+
+    @property
+    def decoded(self):
+        """ Return True if the chunk data has been decoded
+        """
+        return self._data is not None
+
+    @property
+    def data(self):
+        """ Return the 2D uint32 GID array of the chunk, decoding it
+        on first access
+        """
+        if self._data is None:
+            raw_gids = decode_layer_payload(
+                self._payload, self._encoding, self._compression,
+                self.width * self.height)
+
+            tiled_map = self.layer.parent
+            first_gid = tiled_map.maxgid
+            self._data = tiled_map.register_gids(raw_gids).reshape(
+                self.height, self.width)
+            self._payload = None
+            tiled_map.load_late_gids(first_gid)
+
+        return self._data
+
+
+class TiledChunkedTileLayer(TiledElement):
+    """ Represents a TileLayer of an infinite map
+
+    The layer data is split into TiledLayerChunk objects keyed by the tile
+    coordinates of their origin.  Chunks are decoded on first access, so
+    memory scales with the area that has been requested.
+
+    The layer has no single data array, so it is not a TiledTileLayer and
+    is not part of the map's GID index.  Tiles are resolved through the
+    chunks, using map tile coordinates that may be negative.
+    """
+
+    def __init__(self, parent, node):
+        TiledElement.__init__(self)
+        self.parent = parent
+        self.chunks = dict()
+        self.chunk_width = 0
+        self.chunk_height = 0
+
+        # defaults from the specification
+        self.name = None
+        self.width = 0
+        self.height = 0
+        self.opacity = 1.0
+        self.visible = True
+        self.offsetx = 0
+        self.offsety = 0
+
+        self.parse_xml(node)
+
+    def __iter__(self):
+        return self.iter_data()
+
+    def iter_data(self):
+        """ Iterate over layer data of every chunk
+
+        Yields X, Y, GID tuples for each tile in the layer, decoding all
+        chunks.  Coordinates are map tile coordinates.
 
-        init = lambda: [0] * self.width
-        reg = self.parent.register_gid
+        :return: Generator
+        """
+        for chunk in self.chunks.values():
+            for y, row in enumerate(chunk.data.tolist(), chunk.y):
+                for x, gid in enumerate(row, chunk.x):
+                    yield x, y, gid
+
+    def tiles(self):
+        """ Iterate over tile images of every chunk
+
+        :rtype: Generator
+        :return: (x, y, image) tuples
+        """
+        images = self.parent.images
+        for chunk in self.chunks.values():
+            ys, xs = np.nonzero(chunk.data)
+            gids = chunk.data[ys, xs]
+            for x, y, gid in zip((xs + chunk.x).tolist(), (ys + chunk.y).tolist(), gids.tolist()):
+                yield x, y, images[gid]
+
+    @property
+    def bounds(self):
+        """ Return the tile bounds of all chunks in the layer
+
+        :rtype: (min_x, min_y, max_x, max_y) tuple, max is exclusive
+        """
+        if not self.chunks:
+            return 0, 0, 0, 0
+
+        bounds = [chunk.bounds for chunk in self.chunks.values()]
+        return (min(b[0] for b in bounds), min(b[1] for b in bounds),
+                max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+    @property
+    def decoded_chunk_count(self):
+        """ Return the number of chunks that have been decoded
+        """
+        return sum(1 for chunk in self.chunks.values() if chunk.decoded)
+
+    def get_tile_gid(self, x, y):
+        """ Return the GID of a tile, decoding its chunk
+
+        :param x: x tile coordinate
+        :param y: y tile coordinate
+        :rtype: GID of the tile, 0 outside of the layer's chunks
+        """
+        chunk = self.get_chunk(x, y)
+        if chunk is None:
+            return 0
+
+        return int(chunk.data[y - chunk.y, x - chunk.x])
+
+    def set_tile_gid(self, x, y, gid):
+        """ Change the GID of a tile at runtime, decoding its chunk
+
+        :param x: x tile coordinate
+        :param y: y tile coordinate
+        :param gid: new GID of the tile
+        """
+        chunk = self.get_chunk(x, y)
+        if chunk is None:
+            raise ValueError('Tile ({}, {}) is outside of the chunks of layer {}'.format(
+                x, y, self.name))
+
+        chunk.data[y - chunk.y, x - chunk.x] = gid
+
+    def get_gids(self):
+        """ Return the GIDs used by the layer, decoding every chunk
+
+        :rtype: sorted list of GIDs, without 0
+        """
+        gids = set()
+        for chunk in self.chunks.values():
+            gids.update(np.unique(chunk.data).tolist())
+        gids.discard(0)
+
+        return sorted(gids)
+
+    def get_chunk(self, x, y):
+        """ Return the chunk containing a tile
 
-        # H (16-bit) may be a limitation for very detailed maps
-        self.data = tuple(array.array('H', init()) for i in range(self.height))
-        for (y, x) in product(range(self.height), range(self.width)):
-            self.data[y][x] = reg(*decode_gid(next(next_gid)))
+        :param x: x tile coordinate
+        :param y: y tile coordinate
+        :rtype: TiledLayerChunk if found, otherwise None
+        """
+        # A layer without chunks has no chunk size
+        if not self.chunks:
+            return None
+
+        key = (x - x % self.chunk_width, y - y % self.chunk_height)
+        return self.chunks.get(key, None)
+
+    def get_chunks_in_rect(self, x, y, width, height):
+        """ Return the chunks overlapping a rectangle of tiles
+
+        Only chunk keys inside the rectangle are looked up, so the cost does
+        not depend on the size of the map.
+
+        :param x: x tile coordinate of the rectangle
+        :param y: y tile coordinate of the rectangle
+        :param width: width of the rectangle in tiles
+        :param height: height of the rectangle in tiles
+        :rtype: list of TiledLayerChunk
+        """
+        if not self.chunks or width <= 0 or height <= 0:
+            return list()
+
+        x1 = x - x % self.chunk_width
+        y1 = y - y % self.chunk_height
+        found = list()
+        for chunk_y in range(y1, y + height, self.chunk_height):
+            for chunk_x in range(x1, x + width, self.chunk_width):
+                chunk = self.chunks.get((chunk_x, chunk_y), None)
+                if chunk is not None:
+                    found.append(chunk)
+
+        return found
+
+    def get_chunk_layer(self, chunk):
+        """ Return a TiledTileLayer covering a single chunk
+
+        The returned layer shares the chunk's data array and uses chunk
+        local tile coordinates.
+
+        :param chunk: TiledLayerChunk of this layer
+        :rtype: TiledTileLayer
+        """
+        layer = TiledTileLayer(self.parent)
+        layer.name = chunk.name
+        layer.width = chunk.width
+        layer.height = chunk.height
+        layer.opacity = self.opacity
+        layer.visible = self.visible
+        layer.offsetx = self.offsetx
+        layer.offsety = self.offsety
+        layer.properties = self.properties
+        layer.data = chunk.data
+        return layer
+
+    def _set_properties(self, node):
+        TiledElement._set_properties(self, node)
+        self.height = int(self.height)
+        self.width = int(self.width)
+
+    def parse_xml(self, node):
+        """ Parse an infinite map Tile Layer from ElementTree xml node
+
+        :param node: ElementTree xml node
+        :return: self
+        """
+        self._set_properties(node)
+        data_node = node.find('data')
+        encoding = data_node.get('encoding', None)
+        compression = data_node.get('compression', None)
+
+        for chunk_node in data_node.findall('chunk'):
+            chunk = TiledLayerChunk(self, chunk_node, encoding, compression)
+            self.chunks[(chunk.x, chunk.y)] = chunk
+
+        # Tiled writes every chunk of a map with the same size
+        if self.chunks:
+            first = next(iter(self.chunks.values()))
+            self.chunk_width = first.width
+            self.chunk_height = first.height
 
         return self
 
@@ -1173,6 +2473,22 @@ class TiledObject(TiledElement):
 
         self.parse_xml(node)
 
+    def __setattr__(self, name, value):
+        # polygon and polyline points are in map coordinates, so they
+        # are moved along with the object
+        if name in ('x', 'y') and 'points' in self.__dict__ and name in self.__dict__:
+            dx, dy = (value - self.x, 0) if name == 'x' else (0, value - self.y)
+            self.__dict__['points'] = tuple(
+                Point(point[0] + dx, point[1] + dy) for point in self.points)
+
+        TiledElement.__setattr__(self, name, value)
+
+        # keep the spatial index of the map in step with the object bounds
+        if name in object_bounds_attributes:
+            index = getattr(self.__dict__.get('parent', None), '_object_index', None)
+            if index is not None:
+                index.update(self)
+
     @property
     def image(self):
         if self.gid:
@@ -5,7 +5,9 @@ from quest.engine import runtime, vfs
 from quest.framework import singleton, configurable
 from quest.framework import runnable
 from quest.world import tmx, entity, layer
-from quest.world import builder, sheet
+from quest.world import builder, sheet, qmap
+from quest.world import collision, atlas, bamcache
+from quest.world import scheduler
 from quest.distributed import objects
 
 from dataclasses import dataclass
@@ -19,7 +21,7 @@ class GameWorldChunk(core.QuestObject):
     """
     """
 
-    def __init__(self, world: object, data: dict):
+    def __init__(self, world: object, data: dict, map_data: tuple = None):
         super().__init__()
 
         self._world = world
@@ -28,10 +30,24 @@ class GameWorldChunk(core.QuestObject):
         self._root = p3d.NodePath('Chunk-%s' % self._filename.replace('.tmx', ''))
 
         tiled_path = os.path.join(self._world.world_directory, self._filename)
-        self._tiled_map = tmx.TiledMap(
-            tiled_path, image_loader=sheet.load_tiled_image)
+        if map_data is not None:
+            metadata, arrays = map_data
+            self._tiled_map = qmap.build_tiled_map(
+                metadata, arrays, tiled_path, image_loader=sheet.load_tiled_image)
+        else:
+            self._tiled_map = qmap.load_tiled_map(
+                tiled_path, image_loader=sheet.load_tiled_image)
+        self._use_atlas(self._tiled_map)
+        self._source_dates = self._get_source_dates(self._tiled_map)
         self._builder = builder.WorldChunkBuilder(self)
+        self._cache_key = None
+        self._collision = None
         self._layers = {}
+        self._layer_groups = []
+        self._streamed_layers = [layer for layer in self._tiled_map.visible_layers
+            if isinstance(layer, tmx.TiledChunkedTileLayer)]
+        self._scheduler = scheduler.get_build_scheduler()
+        self._requested_chunks = set()
 
     @property
     def root(self) -> p3d.NodePath:
@@ -40,6 +56,42 @@ class GameWorldChunk(core.QuestObject):
 
         return self._root
 
+    @property
+    def collision(self) -> collision.CollisionGeometry:
+        """
+        Merged collision rectangles of the chunk's tile layers. Built
+        on first use and cached for the lifetime of the chunk
+        """
+
+        if self._collision is None:
+            self._collision = collision.CollisionGeometry(self._tiled_map)
+
+        return self._collision
+
+    @property
+    def filename(self) -> str:
+        """
+        TMX file name of the chunk, relative to the world directory
+        """
+
+        return self._filename
+
+    def _use_atlas(self, tiled_map: object) -> None:
+        """
+        Remaps the map's tile visuals to the world's tile atlas, if it has one
+        """
+
+        if self._world.atlas is not None:
+            sheet.get_tile_visual_table(tiled_map).set_atlas(self._world.atlas)
+
+    def _get_source_dates(self, tiled_map: object) -> dict:
+        """
+        Returns the date of each external tileset the map was built from
+        """
+
+        # The first source is the chunk's TMX file itself
+        return {source: vfs.get_file_date(source) for source in qmap.get_map_sources(tiled_map)[1:]}
+
     def get_layer_by_name(self, layer_name: str) -> object:
         """
         """
@@ -60,11 +112,22 @@ class GameWorldChunk(core.QuestObject):
         layer_inst.root.reparent_to(self._root)
         self._layers[layer_name] = layer_inst
 
+    def add_layer_group(self, group: object) -> None:
+        """
+        Registers a group drawing several of the chunk's layers at once
+        """
+
+        group.setup()
+        group.root.reparent_to(self._root)
+        self._layer_groups.append(group)
+
     def setup(self) -> None:
         """
         """
 
-        self._builder.generate(self._tiled_map)      
+        self._generate()
+        self.notify.debug('Materialized %d of %d tile visuals for %s' % (
+            self._tiled_map.images.materialized_count, len(self._tiled_map.images), self._filename))
 
         tile_width = self._tiled_map.tilewidth
         tile_height = self._tiled_map.tileheight
@@ -78,10 +141,214 @@ class GameWorldChunk(core.QuestObject):
         self._root.set_two_sided(True)
         self._root.set_hpr(0, 180, 0)    
 
+    def _generate(self) -> None:
+        """
+        Generates the chunk's layers, loading their geometry from the
+        geometry cache when it holds an up to date copy. Freshly built
+        geometry is written to the cache once every layer is built
+        """
+
+        self._cache_key = None
+        cached_root = None
+
+        # Streamed layers of infinite maps are never cached
+        if not self._streamed_layers and prc.get_prc_bool('want-geometry-cache', True):
+            geometry_cache = bamcache.get_geometry_cache()
+            key = geometry_cache.get_key(self._tiled_map, self._world.atlas)
+            cached_root = geometry_cache.load(key)
+            if cached_root is None:
+                self._cache_key = key
+            else:
+                self.notify.debug('Loaded cached geometry for chunk %s' % self._filename)
+
+        self._builder.generate(self._tiled_map, cached_root)
+        if self._cache_key is not None:
+            for layer_inst in list(self._layers.values()):
+                layer_inst.add_build_callback(self._handle_layer_built)
+
+    def _handle_layer_built(self, layer_inst: object) -> None:
+        """
+        Writes the chunk's geometry to the geometry cache
+        once all of its layers are built
+        """
+
+        if self._cache_key is None or not all(layer.built for layer in self._layers.values()):
+            return
+
+        cache_root = p3d.NodePath('Chunk-%s' % self._filename)
+        for layer_name, layer in self._layers.items():
+            cache_node = layer.create_cache_node()
+            if cache_node is not None:
+                cache_root.attach_new_node(cache_node)
+
+        bamcache.get_geometry_cache().store(self._cache_key, cache_root)
+        self._cache_key = None
+
+    def stream_chunks(self, viewer: p3d.NodePath, radius: int) -> None:
+        """
+        Requests the layer chunks of infinite maps that are within radius
+        tiles of the viewer. Only the chunk lookup runs here, as this is
+        called from the world culling task chain. The chunks are decoded
+        and their layer nodes created on the main thread
+        """
+
+        if not self._streamed_layers:
+            return
+
+        position = viewer.get_pos(self._root)
+        tile_x, tile_y = int(position.x), int(position.y)
+        size = radius * 2 + 1
+
+        for layer in self._streamed_layers:
+            for chunk in layer.get_chunks_in_rect(tile_x - radius, tile_y - radius, size, size):
+                if chunk.name in self._layers or chunk.name in self._requested_chunks:
+                    continue
+
+                self._requested_chunks.add(chunk.name)
+                self._scheduler.hand_over(self, self._generate_chunk_layer, (layer, chunk))
+
+    def _generate_chunk_layer(self, layer: object, chunk: object) -> None:
+        """
+        Decodes a requested layer chunk and creates its layer node
+        """
+
+        self._requested_chunks.discard(chunk.name)
+        if chunk.name in self._layers:
+            return
+
+        layer_inst = self._builder.generate_layer(layer.get_chunk_layer(chunk))
+        if layer_inst is not None:
+            layer_inst.root.set_pos(chunk.x, chunk.y, 0)
+
+    def set_tile(self, layer_name: str, x: int, y: int, gid: int) -> None:
+        """
+        Sets a single tile of a tile layer from a Tiled GID. See set_tiles
+        """
+
+        self.set_tiles(layer_name, (x, y, 1, 1), [gid])
+
+    def set_tiles(self, layer_name: str, region: tuple, gids: object) -> None:
+        """
+        Sets the tiles of an (x, y, width, height) region of a tile layer
+        from Tiled GIDs given row by row. The layer's node redraws only the
+        changed tiles. Layers without a node only have their data updated
+        """
+
+        tiled_layer = self._tiled_map.get_layer_by_name(layer_name)
+        if not isinstance(tiled_layer, tmx.TiledTileLayer):
+            raise ValueError('Layer %s of chunk %s is not a finite tile layer' % (layer_name, self._filename))
+
+        # The edited geometry no longer matches the chunk's files
+        self._cache_key = None
+
+        layer_inst = self._layers.get(layer_name, None)
+        if layer_inst is not None:
+            layer_inst.set_tiles(region, gids)
+        else:
+            x, y, width, height = region
+            raw_gids = np.asarray(gids, dtype=np.uint32).reshape(height, width)
+            tiled_layer.set_tiles(x, y, self._tiled_map.register_late_gids(raw_gids))
+
+        if self._collision is not None:
+            self._collision.invalidate(tiled_layer)
+
+    def reload(self) -> bool:
+        """
+        Re-parses the chunk's TMX file and patches the changed tiles into
+        the existing layer nodes. Falls back to rebuilding the chunk when
+        its tilesets, their source files or its layer layout changed.
+        Returns true if the chunk was patched in place
+        """
+
+        # Patched tiles are drawn through the loaded map's tile visuals,
+        # so the re-parsed map only gets its own when it is rebuilt
+        tiled_path = os.path.join(self._world.world_directory, self._filename)
+        tiled_map = tmx.TiledMap(tiled_path, image_loader=sheet.load_tiled_image)
+
+        if not self._can_patch(tiled_map):
+            self.notify.info('Rebuilding chunk %s. Its tilesets or layers changed' % self._filename)
+            self.rebuild(tiled_map)
+            return False
+
+        changed_count = 0
+        for layer_index, old_layer in enumerate(self._tiled_map.layers):
+            if not isinstance(old_layer, tmx.TiledTileLayer):
+                continue
+
+            new_layer = tiled_map.layers[layer_index]
+            data = self._tiled_map.import_gids(tiled_map, new_layer.data)
+            ys, xs = old_layer.set_data(data)
+            if not len(ys):
+                continue
+
+            changed_count += len(ys)
+            if self._collision is not None:
+                self._collision.invalidate(old_layer)
+
+            layer_inst = self._layers.get(old_layer.name, None)
+            if layer_inst is not None:
+                layer_inst.update_tiles(ys, xs)
+
+        self.notify.debug('Patched %d tiles of chunk %s' % (changed_count, self._filename))
+        return True
+
+    def _can_patch(self, tiled_map: object) -> bool:
+        """
+        Returns true if the map uses the same tilesets and tile
+        layer layout as the loaded map. Edited tileset files may have
+        changed tile properties or animations, so they are compared by
+        their dates
+        """
+
+        def get_tilesets(source_map: object) -> list:
+            return [(tileset.firstgid, tileset.source, tileset.name) for tileset in source_map.tilesets]
+
+        def get_layers(source_map: object) -> list:
+            return [(layer.__class__, layer.name, getattr(layer, 'width', None), getattr(layer, 'height', None))
+                for layer in source_map.layers]
+
+        if get_tilesets(tiled_map) != get_tilesets(self._tiled_map):
+            return False
+
+        if self._get_source_dates(tiled_map) != self._source_dates:
+            return False
+
+        if get_layers(tiled_map) != get_layers(self._tiled_map):
+            return False
+
+        return not any(isinstance(layer, tmx.TiledChunkedTileLayer) for layer in tiled_map.layers)
+
+    def rebuild(self, tiled_map: object) -> None:
+        """
+        Replaces the chunk's map and rebuilds all of its layers
+        """
+
+        self._use_atlas(tiled_map)
+        self._source_dates = self._get_source_dates(tiled_map)
+
+        for layer_inst in self._layers.values():
+            layer_inst.destroy()
+
+        for group in self._layer_groups:
+            group.destroy()
+
+        # Chunks requested from the replaced map are no longer valid
+        self._scheduler.cancel(self)
+        self._requested_chunks.clear()
+
+        self._layers = {}
+        self._layer_groups = []
+        self._collision = None
+        self._tiled_map = tiled_map
+        self._streamed_layers = [layer for layer in self._tiled_map.visible_layers
+            if isinstance(layer, tmx.TiledChunkedTileLayer)]
+        self._generate()
+
     def destroy(self) -> None:
         """
         """
 
+        self._scheduler.cancel(self)
         self._root.remove_node()
 
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
@@ -101,6 +368,8 @@ class GameWorld(configurable.Configurable, runnable.Runnable, core.QuestObject):
         self._world_directory = os.path.dirname(self._world_file)
         self._root = p3d.NodePath('World-%d' % world_id)
         self._root.set_scale(self.pop('world_scale', 5))
+        self._stream_radius = self.pop('stream_radius', 48)
+        self._atlas = None
 
     @property
     def world_directory(self) -> str:
@@ -109,6 +378,15 @@ class GameWorld(configurable.Configurable, runnable.Runnable, core.QuestObject):
 
         return self._world_directory
 
+    @property
+    def atlas(self) -> atlas.TileAtlas:
+        """
+        Tile atlas shared by the world's chunks. None when the world
+        has no up to date atlas or want-tile-atlas is disabled
+        """
+
+        return self._atlas
+
     def setup(self) -> None:
         """
         """
@@ -123,19 +401,54 @@ class GameWorld(configurable.Configurable, runnable.Runnable, core.QuestObject):
 
         world_type = world_data.get('type', None)
         assert world_type == 'world', '%s is not a valid world file' % self._world_file
-        
+
+        if prc.get_prc_bool('want-tile-atlas', True):
+            self._atlas = atlas.load_atlas(self._world_file)
+            if self._atlas is None:
+                self.notify.debug('World %d has no up to date tile atlas. Using its tile sheets' % self._world_id)
+
         maps = world_data.get('maps', [])
+        maps_data = self.parse_chunk_maps(maps)
         for chunk_data in maps:
             chunk_x = chunk_data.get('x', 0)
             chunk_y = chunk_data.get('y', 0)
 
-            self._chunks[(chunk_x, chunk_y)] = GameWorldChunk(self, chunk_data)
+            map_data = maps_data.get(chunk_data.get('fileName'), None)
+            self._chunks[(chunk_x, chunk_y)] = GameWorldChunk(self, chunk_data, map_data)
             self._chunks[(chunk_x, chunk_y)].setup()
             self._chunks[(chunk_x, chunk_y)].root.reparent_to(self._root)
 
         self.activate()
         self._root.reparent_to(runtime.render)
 
+    def parse_chunk_maps(self, maps: list) -> dict:
+        """
+        Parses the TMX files of the world's chunks across a pool of worker
+        processes when want-parallel-world-loading is enabled. Returns a dict
+        of chunk file name to the map data GameWorldChunk builds its map from
+        """
+
+        if not prc.get_prc_bool('want-parallel-world-loading', False):
+            return {}
+
+        # Maps with an up to date qmap are memory mapped by the main process
+        # and maps that only exist in the VFS cannot be read by the workers
+        want_compiled_maps = prc.get_prc_bool('want-compiled-maps', True)
+        filenames = {}
+        for chunk_data in maps:
+            tiled_path = os.path.join(self._world_directory, chunk_data['fileName'])
+            if want_compiled_maps and qmap.is_qmap_up_to_date(qmap.get_qmap_path(tiled_path)):
+                continue
+
+            if os.path.exists(tiled_path):
+                filenames[tiled_path] = chunk_data['fileName']
+
+        max_workers = prc.get_prc_int('world-loader-workers', 0) or None
+        results = qmap.parse_tmx_maps(list(filenames), max_workers)
+        self.notify.debug('Parsed %d of %d chunk maps in worker processes' % (len(results), len(maps)))
+
+        return {filenames[tiled_path]: map_data for tiled_path, map_data in results.items()}
+
     def destroy(self) -> None:
         """
         """
@@ -145,16 +458,43 @@ class GameWorld(configurable.Configurable, runnable.Runnable, core.QuestObject):
             chunk_inst.destroy()
         self._chunks = {}
 
+    def reload_chunk(self, filename: str) -> bool:
+        """
+        Reloads a single chunk of the world from its TMX file, patching
+        only the tiles that changed. Returns false if no chunk of the
+        world uses the file
+        """
+
+        filename = os.path.normpath(filename)
+        for chunk_inst in self._chunks.values():
+            if os.path.normpath(chunk_inst.filename) == filename or \
+                os.path.normpath(os.path.join(self._world_directory, chunk_inst.filename)) == filename:
+                chunk_inst.reload()
+                return True
+
+        self.notify.warning('Failed to reload chunk %s. It is not part of world %d' % (filename, self._world_id))
+        return False
+
     async def tick(self, dt: float) -> None:
         """
         Performs the tick operation for the runnable object. 
         Shows/Hides chunks as they come into view.
         """
 
+        if not runtime.has_base():
+            return
+
+        viewer = runtime.base.camera
+        for chunk_inst in self._chunks.values():
+            chunk_inst.stream_chunks(viewer, self._stream_radius)
+
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------#
 
-class ConfigurableWorldCollection(configurable.Configurable, core.QuestObject):
+class ConfigurableWorldCollection(configurable.Configurable, singleton.Singleton, core.QuestObject):
     """
+    Holds the known worlds of the [Worlds] configuration section and the
+    active game world. No world is loaded until load_world is called,
+    which the client's world loading stage does
     """
 
     def __init__(self, config_path: str):
@@ -165,8 +505,6 @@ class ConfigurableWorldCollection(configurable.Configurable, core.QuestObject):
         core.QuestObject.__init__(self)
         runtime.world_mgr = self
 
-        self.load_world(1)
-
     def load_worlds_data(self, data: dict) -> None:
         """
         Loads the [Worlds] data section from the configuration
@@ -175,6 +513,16 @@ class ConfigurableWorldCollection(configurable.Configurable, core.QuestObject):
 
         self._world_data = data
     
+    def reload_chunk(self, filename: str) -> bool:
+        """
+        Hot reloads a chunk TMX file of the active world
+        """
+
+        if self._active_world is None:
+            return False
+
+        return self._active_world.reload_chunk(filename)
+
     def load_world(self, world_id: int) -> bool:
         """
         """
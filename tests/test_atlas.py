@@ -0,0 +1,165 @@
+"""
+Test cases for the atlas module found in Quest/World
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+import os
+import json
+import numpy as np
+
+from panda3d import core as p3d
+
+from quest.world import atlas, layer, scheduler, sheet, tmx
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+# Root directory of the game assets used for PyTest
+assets_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets')
+
+# Test TMX map data using three of the four tiles of a 2x2 tile sheet used for PyTest
+test_map = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.4" orientation="orthogonal" renderorder="right-down" width="3" height="1" tilewidth="8" tileheight="8">
+ <tileset firstgid="1" name="tiles" tilewidth="8" tileheight="8" tilecount="4" columns="2">
+  <image source="tiles.png" width="16" height="16"/>
+ </tileset>
+ <layer id="1" name="Ground" width="3" height="1">
+  <data encoding="csv">1,4,4</data>
+ </layer>
+</map>
+"""
+
+# Test world file listing the test map used for PyTest
+test_world = {
+    'type': 'world',
+    'maps': [{'fileName': 'tiles.tmx', 'x': 0, 'y': 0, 'width': 24, 'height': 8}]
+}
+
+# Fill colors of the tiles of the test sheet, in local tile id order
+tile_colors = [(1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0)]
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def write_test_world(path: object) -> str:
+    """
+    Writes the test sheet, map and world files and returns the world filename
+    """
+
+    image = p3d.PNMImage(16, 16, 4)
+    image.alpha_fill(1.0)
+    for local_id, color in enumerate(tile_colors):
+        x, y = (local_id % 2) * 8, (local_id // 2) * 8
+        for py in range(y, y + 8):
+            for px in range(x, x + 8):
+                image.set_xel(px, py, *color)
+
+    image.write(p3d.Filename.from_os_specific(str(path / 'tiles.png')))
+    (path / 'tiles.tmx').write_text(test_map)
+    (path / 'test.world').write_text(json.dumps(test_world))
+
+    return str(path / 'test.world')
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def test_pack_atlas_used_tiles(tmp_path: object) -> None:
+    """
+    Verifies only the used tiles are packed, that their padding is
+    extruded from the tile edges and that the remap coordinates
+    address the packed tile
+    """
+
+    write_test_world(tmp_path)
+    tiled_map = tmx.TiledMap(str(tmp_path / 'tiles.tmx'))
+    tiles = atlas.collect_used_tiles(tiled_map)
+    sheet_path = sheet.get_sheet_path(str(tmp_path / 'tiles.png'))
+    assert sorted(tiles) == [(sheet_path, 0), (sheet_path, 3)]
+    assert tiles[(sheet_path, 3)] == (8, 8, 8, 8)
+
+    pages, remap = atlas.pack_atlas(tiles, page_size=32, padding=2)
+    assert len(pages) == 1
+    page = pages[0]
+
+    # Cells are 12px, so the second tile starts at x 14 of the first row
+    page_index, tile_x, tile_y, count_x, count_y = remap[(sheet_path, 3)]
+    assert page_index == 0
+    assert (tile_x * 8, 32 - (tile_y * 8 + 8)) == (14, 2)
+    assert (count_x, count_y) == (4, 4)
+
+    for px, py in ((14, 2), (21, 9), (12, 0), (23, 11)):
+        assert tuple(page.get_xel(px, py)) == tile_colors[3]
+    assert tuple(page.get_xel(0, 0)) == tile_colors[0]
+    assert page.get_alpha(30, 30) == 0
+
+def test_tile_visual_table_uses_atlas(tmp_path: object) -> None:
+    """
+    Builds and loads the atlas of a world and verifies the tile
+    visual table rows are remapped to the atlas page
+    """
+
+    world_file = write_test_world(tmp_path)
+    atlas_filename = atlas.write_atlas(world_file, page_size=32, padding=2)
+    assert atlas.is_atlas_up_to_date(atlas_filename)
+
+    tile_atlas = atlas.load_atlas(world_file)
+    assert tile_atlas.page_count == 1
+
+    tiled_map = tmx.TiledMap(str(tmp_path / 'tiles.tmx'))
+    table = sheet.get_tile_visual_table(tiled_map)
+    table.set_atlas(tile_atlas)
+    assert table.atlas is tile_atlas
+
+    visuals = table.get_visuals(tiled_map.layers[0].data[0])
+    assert visuals['count_x'].tolist() == [4, 4, 4]
+    assert visuals['tile_x'].tolist() == [0.25, 1.75, 1.75]
+    assert (visuals['sheet'] == 0).all()
+
+    texture = tile_atlas.texture
+    assert texture.get_texture_type() == p3d.Texture.TT_2d_texture_array
+    assert texture.get_z_size() == 1
+
+def test_layer_falls_back_from_atlas(tmp_path: object) -> None:
+    """
+    Sets a tile the atlas build did not see and verifies the layer
+    redraws every tile from its tile sheet instead of the atlas
+    """
+
+    world_file = write_test_world(tmp_path)
+    atlas.write_atlas(world_file, page_size=32, padding=2)
+
+    tiled_map = tmx.TiledMap(str(tmp_path / 'tiles.tmx'), image_loader=sheet.load_tiled_image)
+    table = sheet.get_tile_visual_table(tiled_map)
+    table.set_atlas(atlas.load_atlas(world_file))
+    assert table.in_atlas(tiled_map.layers[0].data[0]).all()
+
+    node = layer.TiledTileLayerNode(tiled_map.layers[0])
+    node._scheduler = scheduler.BuildScheduler(budget=0, batch_size=64)
+
+    # The layer shader is loaded from the assets directory
+    model_path = p3d.get_model_path()
+    model_path.prepend_directory(p3d.Filename.from_os_specific(assets_directory))
+    try:
+        for step_func, step_args in node.get_build_steps(batch_size=64):
+            step_func(*step_args)
+        assert node.uses_atlas
+        assert node.root.find('Ground').get_texture() == table.atlas.texture
+
+        node.set_tile(1, 0, 2)
+        assert not table.in_atlas(tiled_map.layers[0].data[0, 1:2]).any()
+        node._scheduler.run()
+    finally:
+        model_path.clear_local_value()
+
+    assert not node.uses_atlas
+    texture = node.root.find('Ground').get_texture()
+    assert texture != table.atlas.texture
+    assert texture.get_x_size() == 16
+
+    # Every tile now addresses the 2x2 tile sheet
+    vertex_bytes = bytes(node._vertex_data.get_array(0).get_handle().get_data())
+    vertices = np.frombuffer(vertex_bytes, dtype=layer.TILE_VERTEX_DTYPE).reshape(-1, 4)
+    visuals = table.get_visuals(tiled_map.layers[0].data[0], use_atlas=False)
+    rects = np.stack((visuals['tile_x'] / 2, visuals['tile_y'] / 2, [0.5] * 3, [0.5] * 3), axis=-1)
+    assert (vertices[:, 0]['rect'] == np.rint(rects * layer.TILE_RECT_SCALE)).all()
+    assert (vertices['sheet'] == 0).all()
+
+#----------------------------------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,140 @@
+"""
+Test cases for the bamcache module found in Quest/World
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+import os
+import sys
+import numpy as np
+
+from panda3d import core as p3d
+
+from quest.world import bamcache, layer, sheet, tmx
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+# Root directory of the game assets used for PyTest
+assets_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets')
+
+# Test TMX map data using a 2x2 tile sheet used for PyTest
+test_map = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.4" orientation="orthogonal" renderorder="right-down" width="4" height="2" tilewidth="8" tileheight="8">
+ <tileset firstgid="1" name="tiles" tilewidth="8" tileheight="8" tilecount="4" columns="2">
+  <image source="tiles.png" width="16" height="16"/>
+ </tileset>
+ <layer id="1" name="Ground" width="4" height="2">
+  <data encoding="csv">%s</data>
+ </layer>
+</map>
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def build_layer_node(tiled_map: object) -> object:
+    """
+    Builds the first layer of the map through its build steps
+    """
+
+    node = layer.TiledTileLayerNode(tiled_map.layers[0])
+    for step_func, step_args in node.get_build_steps(batch_size=64):
+        step_func(*step_args)
+
+    return node
+
+def get_buffers(node: object) -> list:
+    """
+    Returns copies of the layer node's vertex arrays and triangle indexes
+    """
+
+    buffers = [bytes(node._vertex_data.get_array(index).get_handle().get_data()) for index in range(node._vertex_data.get_num_arrays())]
+    buffers.append(bytes(node._triangles.get_vertices().get_handle().get_data()))
+
+    return buffers
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def test_geometry_cache_round_trip(tmp_path: object) -> None:
+    """
+    Stores a built layer in the geometry cache and verifies a new layer
+    node adopts the cached geometry, texture array and shader
+    """
+
+    p3d.PNMImage(16, 16, 4).write(p3d.Filename.from_os_specific(str(tmp_path / 'tiles.png')))
+    tmx_filename = tmp_path / 'tiles.tmx'
+    tmx_filename.write_text(test_map % '1,2,3,4,0,0,4,3')
+    geometry_cache = bamcache.GeometryCache(str(tmp_path / 'cache'), budget=1024 * 1024)
+
+    # The layer shader is loaded from the assets directory
+    model_path = p3d.get_model_path()
+    model_path.prepend_directory(p3d.Filename.from_os_specific(assets_directory))
+    try:
+        tiled_map = tmx.TiledMap(str(tmx_filename), image_loader=sheet.load_tiled_image)
+        key = geometry_cache.get_key(tiled_map)
+        assert geometry_cache.load(key) is None
+
+        node = build_layer_node(tiled_map)
+        cache_root = p3d.NodePath('Chunk')
+        cache_root.attach_new_node(node.create_cache_node())
+        assert geometry_cache.store(key, cache_root)
+        assert key in geometry_cache
+
+        cached_node = geometry_cache.load(key).find('Ground').node()
+        assert not cached_node.has_attrib(p3d.ShaderAttrib)
+
+        cached_layer = layer.TiledTileLayerNode(tiled_map.layers[0])
+        cached_layer.adopt_geometry(cached_node)
+        cached_layer.setup()
+    finally:
+        model_path.clear_local_value()
+
+    assert cached_layer.built
+    assert get_buffers(cached_layer) == get_buffers(node)
+    assert cached_node.has_attrib(p3d.ShaderAttrib)
+    assert p3d.NodePath(cached_node).get_texture().get_z_size() == 1
+
+    p3d.PNMImage(32, 16, 4).write(p3d.Filename.from_os_specific(str(tmp_path / 'tiles.png')))
+    assert geometry_cache.get_key(tiled_map) != key
+    key = geometry_cache.get_key(tiled_map)
+    assert geometry_cache.get_key(tiled_map) == key
+
+    # Keys use the file dates, so the edit is dated after the cached map
+    tmx_filename.write_text(test_map % '1,1,1,1,0,0,0,0')
+    os.utime(tmx_filename, (tmx_filename.stat().st_atime, tmx_filename.stat().st_mtime + 10))
+    assert geometry_cache.get_key(tmx.TiledMap(str(tmx_filename))) != key
+
+def test_geometry_cache_evicts_by_size(tmp_path: object) -> None:
+    """
+    Verifies the least recently used entries are evicted once the
+    cache exceeds its byte budget
+    """
+
+    unlimited_cache = bamcache.GeometryCache(str(tmp_path), budget=1024 * 1024)
+    for index, key in enumerate(['a', 'b', 'c']):
+        unlimited_cache.store(key, p3d.NodePath(p3d.GeomNode(key)))
+        os.utime(unlimited_cache.get_path(key), (index, index))
+
+    geometry_cache = bamcache.GeometryCache(str(tmp_path), budget=os.path.getsize(unlimited_cache.get_path('a')) * 2)
+    geometry_cache.load('a')
+    geometry_cache.evict()
+    assert 'a' in geometry_cache and 'c' in geometry_cache
+    assert 'b' not in geometry_cache
+
+    geometry_cache.clear()
+    assert not os.listdir(str(tmp_path))
+
+def test_geometry_cache_uses_user_cache_directory(tmp_path: object, monkeypatch: object) -> None:
+    """
+    Verifies the process wide geometry cache is stored in the per user
+    cache directory rather than the working directory
+    """
+
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    monkeypatch.setattr(sys, 'platform', 'linux')
+    monkeypatch.setattr(bamcache, '_geometry_cache', None)
+
+    directory = bamcache.get_geometry_cache().directory
+    assert os.path.isabs(directory)
+    assert directory == os.path.join(str(tmp_path), 'Quest', 'geometry')
+
+#----------------------------------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,32 @@
+"""
+Test cases for the builder module found in Quest/World
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+from panda3d import core as p3d
+
+from quest.world import builder
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def test_cached_nodes_match_exact_layer_names() -> None:
+    """
+    Verifies cached layer geometry is found by its exact layer name,
+    including names with NodePath search pattern characters
+    """
+
+    cached_root = p3d.NodePath('Chunk')
+    for name in ('Ground1', 'Ground[1]', 'Detail-x', 'Ground@0,0', 'Roof/Top'):
+        cached_root.attach_new_node(p3d.GeomNode(name))
+
+    chunk_builder = builder.WorldChunkBuilder(None)
+    for name in ('Ground[1]', 'Ground@0,0', 'Roof/Top'):
+        cached_node = chunk_builder.get_cached_node(cached_root, name)
+        assert cached_node is not None and cached_node.get_name() == name
+
+    assert chunk_builder.get_cached_node(cached_root, 'Detail*') is None
+    assert chunk_builder.get_cached_node(cached_root, 'Ground?') is None
+    assert chunk_builder.get_cached_node(None, 'Ground1') is None
+
+#----------------------------------------------------------------------------------------------------------------------------------#
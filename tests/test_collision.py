@@ -0,0 +1,92 @@
+"""
+Test cases for the collision module found in Quest/World
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+import numpy as np
+
+from quest.world import tmx, collision
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+# Test TMX map data with a full tile collider and a half tile collider used for PyTest
+collider_map = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.4" orientation="orthogonal" renderorder="right-down" width="5" height="4" tilewidth="32" tileheight="32">
+ <tileset firstgid="1" name="test" tilewidth="32" tileheight="32" tilecount="4" columns="2">
+  <image source="test.png" width="64" height="64"/>
+  <tile id="0">
+   <objectgroup draworder="index">
+    <object id="1" x="0" y="0" width="32" height="32"/>
+   </objectgroup>
+  </tile>
+  <tile id="1">
+   <objectgroup draworder="index">
+    <object id="1" x="0" y="16" width="32" height="16"/>
+   </objectgroup>
+  </tile>
+ </tileset>
+ <layer id="1" name="Walls" width="5" height="4">
+  <data encoding="csv">
+1,1,1,1,1,
+1,3,3,3,1,
+1,3,3,3,1,
+2,2,1073741826,3,1
+  </data>
+ </layer>
+</map>
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def test_merge_rectangles_covers_mask() -> None:
+    """
+    Verifies the merged rectangles cover every solid cell of a
+    mask exactly once and never cover an empty cell
+    """
+
+    rng = np.random.default_rng(7)
+    mask = rng.random((24, 32)) < 0.6
+    mask[4:12, 8:20] = True
+
+    coverage = np.zeros(mask.shape, dtype=np.int32)
+    rects = collision.merge_rectangles(mask)
+    for x, y, width, height in rects.tolist():
+        coverage[y:y + height, x:x + width] += 1
+
+    assert np.array_equal(coverage, mask.astype(np.int32))
+    assert len(rects) < np.count_nonzero(mask)
+
+def test_collision_geometry_from_tile_colliders(tmp_path: object) -> None:
+    """
+    Rasterises tile colliders into a solid mask and verifies the
+    merged rectangles, including flipped half tile colliders
+    """
+
+    tmx_filename = tmp_path / 'colliders.tmx'
+    tmx_filename.write_text(collider_map)
+
+    tiled_map = tmx.TiledMap(str(tmx_filename))
+    geometry = collision.CollisionGeometry(tiled_map, subdivisions=2)
+
+    mask = geometry.get_solid_mask('Walls')
+    assert mask.shape == (8, 10)
+    assert mask[6:8, 0:4].tolist() == [[False] * 4, [True] * 4]
+    assert mask[6:8, 4:6].tolist() == [[True, True], [False, False]]
+
+    rects = geometry.get_layer_rects('Walls')
+    assert rects.dtype == np.float32
+    assert rects.tolist() == [
+        [0, 0, 5, 1], [0, 1, 1, 2], [4, 1, 1, 3], [2, 3, 1, 0.5], [0, 3.5, 2, 0.5]]
+    assert geometry.get_layer_rects('Walls') is rects
+
+    assert geometry.is_solid(0.5, 0.5)
+    assert not geometry.is_solid(2.5, 2.5)
+    assert not geometry.is_solid(0.5, 3.25)
+    assert geometry.is_solid(0.5, 3.75)
+    assert len(geometry.get_rects_in_rect(1.5, 1.5, 2, 1)) == 0
+
+    collision_node = geometry.create_collision_node('Walls')
+    assert collision_node.get_num_solids() == len(rects)
+
+#----------------------------------------------------------------------------------------------------------------------------------#
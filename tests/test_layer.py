@@ -0,0 +1,481 @@
+"""
+Test cases for the layer module found in Quest/World
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+import os
+import struct
+import asyncio
+import threading
+import numpy as np
+
+from panda3d import core as p3d
+
+from quest.engine import prc
+from quest.world import layer, scheduler, sheet, tmx
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+# Root directory of the game assets used for PyTest
+assets_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets')
+
+# Test TMX map data using a 2x2 tile sheet used for PyTest. The layer data is filled in per test
+test_map = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.4" orientation="orthogonal" renderorder="right-down" width="%(size)d" height="%(size)d" tilewidth="8" tileheight="8">
+ <tileset firstgid="1" name="tiles" tilewidth="8" tileheight="8" tilecount="4" columns="2">
+  <image source="tiles.png" width="16" height="16"/>
+ </tileset>
+ <layer id="1" name="Ground" width="%(size)d" height="%(size)d">
+  <data encoding="csv">%(data)s</data>
+ </layer>
+</map>
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def load_test_layer(path: object, data: np.ndarray) -> object:
+    """
+    Writes the test sheet and a square map with the requested layer
+    data and returns its tile layer
+    """
+
+    p3d.PNMImage(16, 16, 4).write(p3d.Filename.from_os_specific(str(path / 'tiles.png')))
+    tmx_filename = path / 'tiles.tmx'
+    tmx_filename.write_text(test_map % {'size': len(data), 'data': ','.join(map(str, data.ravel().tolist()))})
+
+    tiled_map = tmx.TiledMap(str(tmx_filename), image_loader=sheet.load_tiled_image)
+    return tiled_map, tiled_map.layers[0]
+
+def get_vertices(node: object) -> np.ndarray:
+    """
+    Returns a copy of the layer node's vertex records, four per quad
+    """
+
+    vertex_bytes = bytes(node._vertex_data.get_array(0).get_handle().get_data())
+    return np.frombuffer(vertex_bytes, dtype=layer.TILE_VERTEX_DTYPE).reshape(-1, 4)
+
+def get_triangles(node: object) -> np.ndarray:
+    """
+    Returns a copy of the layer node's triangle indexes
+    """
+
+    return np.frombuffer(bytes(node._triangles.get_vertices().get_handle().get_data()), dtype=np.uint32)
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def test_build_layer_geometry_matches_tiles(tmp_path: object) -> None:
+    """
+    Builds a whole 100x100 layer at once and verifies a sample of the
+    tile quads against the per tile vertex layout
+    """
+
+    rng = np.random.default_rng(3)
+    data = rng.integers(0, 5, size=(100, 100))
+    tiled_map, tile_layer = load_test_layer(tmp_path, data)
+
+    node = layer.TiledTileLayerNode(tile_layer)
+    node._build_layer_geometry()
+
+    vertices = get_vertices(node)
+    triangles = get_triangles(node).reshape(-1, 6)
+
+    visuals = node._visual_table.get_visuals(tile_layer.data)
+    for y, x in ((0, 0), (17, 42), (99, 99), (50, 3)):
+        face_id = y * 100 + x
+        if not data[y, x]:
+            assert not triangles[face_id].any()
+            continue
+
+        assert vertices[face_id]['position'].tolist() == [[x + 1, y + 1], [x, y + 1], [x, y], [x + 1, y]]
+
+        visual = visuals[y, x]
+        rect = [visual['tile_x'] / visual['count_x'], visual['tile_y'] / visual['count_y'],
+            1 / visual['count_x'], 1 / visual['count_y']]
+        assert (vertices[face_id]['rect'] == np.rint(np.array(rect) * layer.TILE_RECT_SCALE)).all()
+        assert triangles[face_id].tolist() == [4 * face_id + i for i in (0, 1, 3, 1, 2, 3)]
+
+    assert np.count_nonzero(triangles.any(axis=1)) == np.count_nonzero(data)
+
+
+def test_compact_vertex_buffer(tmp_path: object) -> None:
+    """
+    Compares the generated interleaved vertex buffer of a small layer
+    against the expected bytes and the size of the former six float
+    array layout
+    """
+
+    data = np.array([[0, 2], [3, 0]])
+    tiled_map, tile_layer = load_test_layer(tmp_path, data)
+
+    node = layer.TiledTileLayerNode(tile_layer)
+    node._build_layer_geometry()
+
+    array_format = node._vertex_data.get_format().get_array(0)
+    assert node._vertex_data.get_num_arrays() == 1
+    assert array_format.get_stride() == 16
+
+    # Vertex, normal, texcoord, tile position, tile count and tile sheet
+    float_layout_stride = (3 + 3 + 2 + 2 + 2 + 1) * 4
+    assert float_layout_stride / array_format.get_stride() >= 3
+
+    # Tiles 2 and 3 of the 2x2 sheet are (1, 1) and (0, 0) in tile units
+    expected = bytearray(16 * 4 * 4)
+    for face_id, x, y, tile_x, tile_y in ((1, 1, 0, 1, 1), (2, 0, 1, 0, 0)):
+        for corner, (corner_x, corner_y) in enumerate(((1, 1), (0, 1), (0, 0), (1, 0))):
+            struct.pack_into('<hhHHHHBBH', expected, (face_id * 4 + corner) * 16,
+                x + corner_x, y + corner_y, tile_x * 16384, tile_y * 16384, 16384, 16384, 0, 0, 0)
+
+    assert bytes(node._vertex_data.get_array(0).get_handle().get_data()) == bytes(expected)
+
+def test_build_steps_cover_layer_in_row_batches(tmp_path: object) -> None:
+    """
+    Verifies the layer's build steps create the geometry first and
+    build the same buffers as a whole layer build
+    """
+
+    data = np.random.default_rng(5).integers(0, 5, size=(10, 10))
+    tiled_map, tile_layer = load_test_layer(tmp_path, data)
+
+    node = layer.TiledTileLayerNode(tile_layer)
+    steps = node.get_build_steps(batch_size=25)
+    assert steps[0][0] == node._draw_initial_geometry
+    assert [args for func, args in steps[1:-1]] == [(0, 2), (2, 4), (4, 6), (6, 8), (8, 10)]
+    assert steps[-1][0] == node._finish_build
+
+    for step_func, step_args in steps[1:]:
+        step_func(*step_args)
+    assert node.built
+
+    whole_node = layer.TiledTileLayerNode(tile_layer)
+    whole_node._build_layer_geometry()
+    assert np.array_equal(get_vertices(node), get_vertices(whole_node))
+    assert np.array_equal(get_triangles(node), get_triangles(whole_node))
+
+def test_handle_tiles_update_patches_in_place(tmp_path: object) -> None:
+    """
+    Verifies updated tiles are redrawn or cleared without
+    touching the rest of the layer's geometry
+    """
+
+    data = np.array([[1, 2], [3, 4]])
+    tiled_map, tile_layer = load_test_layer(tmp_path, data)
+
+    node = layer.TiledTileLayerNode(tile_layer)
+    node._build_layer_geometry()
+    rects = get_vertices(node)['rect'].copy()
+
+    gids = tile_layer.data.copy()
+    tile_layer.data[0, 0] = gids[1, 1]
+    tile_layer.data[1, 0] = 0
+    node._handle_tiles_update(np.array([0, 0]), np.array([0, 1]))
+
+    updated = get_vertices(node)['rect']
+    assert updated[0].tolist() == rects[3].tolist()
+    assert updated[1].tolist() == rects[1].tolist()
+
+    triangles = get_triangles(node).reshape(-1, 6)
+    assert not triangles[2].any()
+    assert triangles[0].tolist() == [0, 1, 3, 1, 2, 3]
+
+def test_set_tiles_coalesces_edits(tmp_path: object) -> None:
+    """
+    Verifies tile edits update the layer data immediately and are redrawn
+    by a single build step that matches a full rebuild of the layer
+    """
+
+    data = np.random.default_rng(5).integers(0, 5, size=(16, 16))
+    tiled_map, tile_layer = load_test_layer(tmp_path, data)
+
+    node = layer.TiledTileLayerNode(tile_layer)
+    node._scheduler = scheduler.BuildScheduler(budget=0, batch_size=64)
+    node._build_layer_geometry()
+
+    node.set_tile(3, 4, 1)
+    node.set_tile(3, 4, 2 | tmx.GID_TRANS_FLIPX)
+    node.set_tiles((8, 8, 3, 2), [[0, 1, 2], [3, 4, 0]])
+    assert node._scheduler.total == 1
+
+    assert tiled_map.tiledgidmap[tile_layer.data[4, 3]] == 2
+    assert dict(tiled_map.gidmap[2])[tile_layer.data[4, 3]].flipped_horizontally
+    assert tile_layer.data[8:10, 8:11].astype(bool).tolist() == [[False, True, True], [True, True, False]]
+
+    node._scheduler.run()
+    assert not node._scheduler.pending
+
+    whole_node = layer.TiledTileLayerNode(tile_layer)
+    whole_node._build_layer_geometry()
+    assert np.array_equal(get_vertices(node), get_vertices(whole_node))
+    assert np.array_equal(get_triangles(node), get_triangles(whole_node))
+
+def test_sparse_layer_allocates_filled_cells(tmp_path: object) -> None:
+    """
+    Builds a mostly empty layer with quads for its filled cells only and
+    verifies them against a dense build, then grows it with tile edits
+    """
+
+    data = np.zeros((16, 16), dtype=np.uint32)
+    data[2, 3], data[7, 0], data[7, 9], data[15, 15] = 1, 2, 3, 4
+    tiled_map, tile_layer = load_test_layer(tmp_path, data)
+
+    node = layer.TiledTileLayerNode(tile_layer)
+    node._scheduler = scheduler.BuildScheduler(budget=0, batch_size=64)
+    assert node.sparse
+    assert node.quad_count == 4
+
+    steps = node.get_build_steps(batch_size=2)
+    assert [args for func, args in steps[1:-1]] == [(0, 7), (7, 15), (15, 16)]
+    for step_func, step_args in steps[1:]:
+        step_func(*step_args)
+
+    prc.set_prc_double('sparse-tilemap-density', 0.0)
+    try:
+        dense_node = layer.TiledTileLayerNode(tile_layer)
+    finally:
+        prc.set_prc_double('sparse-tilemap-density', 0.5)
+
+    assert not dense_node.sparse
+    dense_node._build_layer_geometry()
+    face_ids = [2 * 16 + 3, 7 * 16, 7 * 16 + 9, 15 * 16 + 15]
+    assert np.array_equal(get_vertices(node), get_vertices(dense_node)[face_ids])
+    assert np.array_equal(get_triangles(node).reshape(4, 6), (np.arange(4) * 4)[:, None] + layer.TILE_INDEXES)
+
+    node.set_tile(3, 2, 0)
+    node.set_tiles((0, 0, 3, 1), [1, 2, 3])
+    node._scheduler.run()
+    assert node.quad_count == 8
+
+    triangles = get_triangles(node).reshape(-1, 6)
+    vertices = get_vertices(node)
+    assert np.count_nonzero(triangles.any(axis=1)) == 6
+    for y, x in zip(*np.nonzero(tile_layer.data)):
+        quad_id = node._quad_indexes[y, x]
+        assert triangles[quad_id].tolist() == (quad_id * 4 + layer.TILE_INDEXES).tolist()
+        assert vertices[quad_id, 0]['position'].tolist() == [x + 1, y + 1]
+
+def test_threaded_build_swaps_detached_geometry(tmp_path: object) -> None:
+    """
+    Builds a layer's geometry on a worker thread and verifies the drawn
+    geometry is only replaced once the build is handed over
+    """
+
+    data = np.random.default_rng(9).integers(0, 5, size=(32, 32))
+    tiled_map, tile_layer = load_test_layer(tmp_path, data)
+
+    node = layer.TiledTileLayerNode(tile_layer)
+    node._scheduler = scheduler.BuildScheduler(budget=0, batch_size=64)
+    live_vertex_data = node._vertex_data
+
+    # The layer shader is loaded from the assets directory
+    model_path = p3d.get_model_path()
+    model_path.prepend_directory(p3d.Filename.from_os_specific(assets_directory))
+    try:
+        node._request_build()
+        worker = threading.Thread(target=lambda: asyncio.run(node.tick(0)))
+        worker.start()
+        worker.join()
+
+        # The worker leaves the texture arrays and shader to the main thread
+        assert node._vertex_data is live_vertex_data
+        assert not get_triangles(node).any()
+        assert node.root.get_num_children() == 0
+        assert node._animation_texture is None
+
+        node._scheduler.run()
+    finally:
+        model_path.clear_local_value()
+
+    assert node._vertex_data is not live_vertex_data
+    assert node.root.get_num_children() == 1
+    assert node._animation_texture is not None
+    assert node._node.get_shader() is not None
+
+    whole_node = layer.TiledTileLayerNode(tile_layer)
+    whole_node._build_layer_geometry()
+    assert np.array_equal(get_vertices(node), get_vertices(whole_node))
+    assert np.array_equal(get_triangles(node), get_triangles(whole_node))
+
+
+def test_data_texture_layer_textures(tmp_path: object) -> None:
+    """
+    Verifies the data texture layer uploads its GIDs and their tile
+    visuals, and writes tile edits into its data texture
+    """
+
+    data = np.array([[1, 0, 2], [3, 4, 0], [0, 0, 1]])
+    tiled_map, tile_layer = load_test_layer(tmp_path, data)
+
+    node = layer.TiledDataTextureLayerNode(tile_layer)
+    model_path = p3d.get_model_path()
+    model_path.prepend_directory(p3d.Filename.from_os_specific(assets_directory))
+    try:
+        node.setup()
+    finally:
+        model_path.clear_local_value()
+
+    assert node.built
+    assert node.root.get_num_children() == 1
+
+    def get_texture_gids() -> np.ndarray:
+        ram_image = bytes(node.data_texture.get_ram_image())
+        return np.frombuffer(ram_image, dtype=np.uint32).reshape(tile_layer.data.shape)
+
+    assert node.data_texture.get_format() == p3d.Texture.F_r32i
+    assert np.array_equal(get_texture_gids(), tile_layer.data)
+
+    visual_table = sheet.get_tile_visual_table(tiled_map)
+    peeker = node.visual_texture.peek()
+    columns = node.visual_texture.get_x_size()
+    for gid in np.unique(tile_layer.data[tile_layer.data != 0]).tolist():
+        visual = visual_table.get_visuals(np.array([gid]))[0]
+        row, column = divmod(gid, columns)
+
+        texel = p3d.LColor()
+        peeker.fetch_pixel(texel, column, row * 2)
+        assert list(texel) == [visual['tile_x'], visual['tile_y'], visual['count_x'], visual['count_y']]
+        peeker.fetch_pixel(texel, column, row * 2 + 1)
+        assert texel[0] == 0
+
+    node.set_tile(1, 0, 3)
+    node.set_tiles((0, 2, 2, 1), [0, 2])
+    assert np.array_equal(get_texture_gids(), tile_layer.data)
+    assert tile_layer.data[0, 1] == tile_layer.data[1, 0]
+
+
+def test_flattened_group_merges_layers(tmp_path: object) -> None:
+    """
+    Merges two built layers into a single Geom and verifies the layers
+    are stacked in order, merged again after a tile edit that grew a
+    layer and patched in place after one that did not
+    """
+
+    p3d.PNMImage(16, 16, 4).write(p3d.Filename.from_os_specific(str(tmp_path / 'tiles.png')))
+    layers_xml = test_map % {'size': 2, 'data': '1,0,3,4'}
+    layers_xml = layers_xml.replace('</map>', """ <layer id="2" name="Overlay" width="2" height="2">
+  <data encoding="csv">0,2,0,0</data>
+ </layer>
+</map>""")
+    tmx_filename = tmp_path / 'tiles.tmx'
+    tmx_filename.write_text(layers_xml)
+    tiled_map = tmx.TiledMap(str(tmx_filename), image_loader=sheet.load_tiled_image)
+
+    build_scheduler = scheduler.BuildScheduler(budget=0, batch_size=64)
+    layer_nodes = []
+    for tile_layer in tiled_map.layers:
+        layer_node = layer.TiledTileLayerNode(tile_layer)
+        layer_node._scheduler = build_scheduler
+        layer_nodes.append(layer_node)
+
+    group = layer.TiledFlattenedLayerGroup('Flattened', layer_nodes)
+    group._scheduler = build_scheduler
+
+    model_path = p3d.get_model_path()
+    model_path.prepend_directory(p3d.Filename.from_os_specific(assets_directory))
+    try:
+        for layer_node in layer_nodes:
+            layer_node.root.reparent_to(group.root)
+            layer_node.setup()
+        group.setup()
+
+        while build_scheduler.pending:
+            build_scheduler.run()
+
+        def get_merged() -> tuple:
+            mesh = group._node.node().get_geom(0)
+            vertices = np.frombuffer(memoryview(mesh.get_vertex_data().get_array(0)), dtype=layer.TILE_VERTEX_DTYPE)
+            triangles = np.frombuffer(memoryview(mesh.get_primitive(0).get_vertices()), dtype=np.uint32)
+            return vertices.reshape(-1, 4), triangles.reshape(-1, 6)
+
+        assert group.root.get_num_children() == 1
+        assert group.root.get_stashed_children().get_num_paths() == 2
+        assert all(layer_node.root.is_stashed() for layer_node in layer_nodes)
+        assert group._node.node().get_num_geoms() == 1
+
+        # The mostly empty overlay is sparse and only has a quad for its tile
+        vertices, triangles = get_merged()
+        assert [layer_node.quad_count for layer_node in layer_nodes] == [4, 1]
+        assert len(vertices) == 5
+        assert (vertices[:4]['order'] == 0).all()
+        assert (vertices[4:]['order'] == 1).all()
+        assert np.count_nonzero(triangles.any(axis=1)) == 4
+        assert triangles[4].tolist() == (4 * 4 + layer.TILE_INDEXES).tolist()
+
+        layer_nodes[1].set_tile(0, 1, 1)
+        build_scheduler.run()
+        build_scheduler.run()
+        vertices, triangles = get_merged()
+        assert len(vertices) == 6
+        assert np.count_nonzero(triangles.any(axis=1)) == 5
+        assert triangles[5].tolist() == (5 * 4 + layer.TILE_INDEXES).tolist()
+
+        # Edits that keep the quad counts, sheets and animations are patched in place
+        node, texture, animation_texture = group._node, group._texture, group._animation_texture
+        layer_nodes[0].set_tile(0, 0, 2)
+        layer_nodes[1].set_tile(1, 0, 0)
+        while build_scheduler.pending:
+            build_scheduler.run()
+        vertices, triangles = get_merged()
+        assert group._node == node
+        assert group._texture == texture
+        assert group._animation_texture == animation_texture
+        assert np.array_equal(vertices[0]['rect'], get_vertices(layer_nodes[0])[0]['rect'])
+        assert (vertices[4:]['order'] == 1).all()
+        assert np.count_nonzero(triangles.any(axis=1)) == 4
+    finally:
+        model_path.clear_local_value()
+
+
+def test_animated_tiles_use_frame_table(tmp_path: object) -> None:
+    """
+    Verifies animated tiles are tagged with their row of the layer's
+    animation texture and that the texture holds their frame table
+    """
+
+    p3d.PNMImage(16, 16, 4).write(p3d.Filename.from_os_specific(str(tmp_path / 'tiles.png')))
+    animated_map = test_map % {'size': 2, 'data': '1,2,0,1'}
+    animated_map = animated_map.replace(' </tileset>', """  <tile id="0">
+   <animation>
+    <frame tileid="0" duration="100"/>
+    <frame tileid="3" duration="300"/>
+   </animation>
+  </tile>
+ </tileset>""")
+    tmx_filename = tmp_path / 'tiles.tmx'
+    tmx_filename.write_text(animated_map)
+    tiled_map = tmx.TiledMap(str(tmx_filename), image_loader=sheet.load_tiled_image)
+    tile_layer = tiled_map.layers[0]
+
+    node = layer.TiledTileLayerNode(tile_layer)
+    model_path = p3d.get_model_path()
+    model_path.prepend_directory(p3d.Filename.from_os_specific(assets_directory))
+    try:
+        for step_func, step_args in node.get_build_steps(batch_size=64):
+            step_func(*step_args)
+    finally:
+        model_path.clear_local_value()
+
+    animations = get_vertices(node)['animation']
+    assert animations[:, 0].tolist() == [1, 0, 0, 1]
+    assert (animations == animations[:, :1]).all()
+
+    visuals = sheet.get_tile_visual_table(tiled_map).get_visuals(tile_layer.data.ravel())
+    frame_visuals = sheet.get_tile_visual_table(tiled_map).get_visuals(
+        np.array([frame.gid for frame in tiled_map.tile_properties[tile_layer.data[0, 0]]['frames']]))
+
+    animation_texture = node._node.get_shader_input('tileAnimations').get_texture()
+    assert (animation_texture.get_x_size(), animation_texture.get_y_size()) == (3, 1)
+
+    texel = p3d.LColor()
+    peeker = animation_texture.peek()
+    peeker.fetch_pixel(texel, 0, 0)
+    assert np.allclose(list(texel), [2, 0.4, 0, 0])
+    for column, end_time in ((1, 0.1), (2, 0.4)):
+        peeker.fetch_pixel(texel, column, 0)
+        frame = frame_visuals[column - 1]
+        assert np.allclose(list(texel), [frame['tile_x'], frame['tile_y'], 0, end_time])
+
+    # The static tile attributes hold the visual of the tile itself
+    rect = get_vertices(node)['rect'][0, 0] / layer.TILE_RECT_SCALE
+    assert rect[:2].tolist() == [visuals[0]['tile_x'] / visuals[0]['count_x'], visuals[0]['tile_y'] / visuals[0]['count_y']]
+
+#----------------------------------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,171 @@
+"""
+Test cases for the qmap module found in Quest/World
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+import numpy as np
+
+from quest.world import tmx, qmap
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+# Test TMX map data used for PyTest
+test_map = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.4" orientation="orthogonal" renderorder="right-down" width="4" height="3" tilewidth="32" tileheight="32">
+ <properties>
+  <property name="flatten" type="bool" value="true"/>
+ </properties>
+ <tileset firstgid="1" name="test" tilewidth="32" tileheight="32" tilecount="4" columns="2">
+  <image source="test.png" width="64" height="64"/>
+  <tile id="1">
+   <properties>
+    <property name="water" type="bool" value="true"/>
+   </properties>
+  </tile>
+ </tileset>
+ <layer id="1" name="Ground" width="4" height="3">
+  <data encoding="csv">
+1,2,2,1,
+3,0,2147483650,4,
+1,1,1,1
+  </data>
+ </layer>
+ <objectgroup id="2" name="Spawns">
+  <object id="1" name="spawn" x="16" y="32" width="8" height="8"/>
+  <object id="2" name="path" x="0" y="0">
+   <polyline points="0,0 10,5 20,0"/>
+  </object>
+ </objectgroup>
+</map>
+"""
+
+# Test TMX map data using an external tileset used for PyTest
+external_map = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.4" orientation="orthogonal" renderorder="right-down" width="2" height="1" tilewidth="32" tileheight="32">
+ <tileset firstgid="1" source="tsx/test.tsx"/>
+ <layer id="1" name="Ground" width="2" height="1">
+  <data encoding="csv">1,2</data>
+ </layer>
+</map>
+"""
+
+# Test external tileset data used for PyTest
+external_tileset = """<?xml version="1.0" encoding="UTF-8"?>
+<tileset version="1.4" name="test" tilewidth="32" tileheight="32" tilecount="4" columns="2">
+ <image source="test.png" width="64" height="64"/>
+</tileset>
+"""
+
+# Test infinite TMX map data, which cannot be compiled, used for PyTest
+infinite_map = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.4" orientation="orthogonal" renderorder="right-down" width="2" height="2" tilewidth="32" tileheight="32" infinite="1">
+ <layer id="1" name="Ground" width="2" height="2">
+  <data encoding="csv">
+   <chunk x="0" y="0" width="2" height="2">0,0,0,0</chunk>
+  </data>
+ </layer>
+</map>
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def test_qmap_round_trip(tmp_path: object) -> None:
+    """
+    Compiles a TMX map into a qmap file and verifies the loaded
+    map matches the parsed TMX map
+    """
+
+    tmx_filename = tmp_path / 'test.tmx'
+    tmx_filename.write_text(test_map)
+    expected = tmx.TiledMap(str(tmx_filename))
+
+    qmap_filename = qmap.write_qmap(expected)
+    assert qmap.is_qmap_up_to_date(qmap_filename)
+
+    result = qmap.load_qmap(qmap_filename)
+    assert np.array_equal(result.layers[0].data, expected.layers[0].data)
+    assert result.gidmap == expected.gidmap
+    assert result.imagemap == expected.imagemap
+    assert result.tiledgidmap == expected.tiledgidmap
+    assert result.tile_properties == expected.tile_properties
+    assert result.images == expected.images
+    assert result.properties == expected.properties
+
+    assert result.get_object_by_name('spawn').as_points == expected.get_object_by_name('spawn').as_points
+    assert result.get_object_by_name('path').points == expected.get_object_by_name('path').points
+    assert result.get_layer_by_name('Spawns').parent is result
+
+def test_parse_tmx_maps_in_workers(tmp_path: object) -> None:
+    """
+    Parses TMX maps in worker processes and verifies the maps built
+    from the returned data match maps parsed in process
+    """
+
+    filenames = []
+    for name in ('first', 'second'):
+        tmx_filename = tmp_path / ('%s.tmx' % name)
+        tmx_filename.write_text(test_map)
+        filenames.append(str(tmx_filename))
+
+    results = qmap.parse_tmx_maps(filenames, max_workers=2)
+    assert sorted(results) == sorted(filenames)
+
+    for filename in filenames:
+        expected = tmx.TiledMap(filename)
+        metadata, arrays = results[filename]
+        assert all(isinstance(array, np.ndarray) for array in arrays)
+
+        result = qmap.build_tiled_map(metadata, arrays, filename)
+        assert np.array_equal(result.layers[0].data, expected.layers[0].data)
+        assert result.gidmap == expected.gidmap
+        assert result.tile_properties == expected.tile_properties
+        assert result.images == expected.images
+
+def test_parse_tmx_maps_logs_failures(tmp_path: object, capfd: object) -> None:
+    """
+    Verifies maps that fail to parse in a worker process are left out
+    of the results and logged with their filename and error
+    """
+
+    tmx_filename = tmp_path / 'finite.tmx'
+    tmx_filename.write_text(test_map)
+    infinite_filename = tmp_path / 'infinite.tmx'
+    infinite_filename.write_text(infinite_map)
+    malformed_filename = tmp_path / 'malformed.tmx'
+    malformed_filename.write_text('<?xml version="1.0" encoding="UTF-8"?>\n<map')
+
+    results = qmap.parse_tmx_maps([str(tmx_filename), str(infinite_filename), str(malformed_filename)], max_workers=1)
+    assert list(results) == [str(tmx_filename)]
+
+    output = capfd.readouterr().err
+    assert 'Failed to parse %s' % infinite_filename in output
+    assert 'Infinite maps are not supported' in output
+    assert 'Failed to parse %s' % malformed_filename in output
+
+def test_map_sources_read_from_qmap(tmp_path: object, monkeypatch: object) -> None:
+    """
+    Verifies the sources of a map are found from its tilesets, recorded
+    with their dates in the qmap metadata and read back from there
+    """
+
+    (tmp_path / 'tsx').mkdir()
+    (tmp_path / 'tsx' / 'test.tsx').write_text(external_tileset)
+    tmx_filename = tmp_path / 'external.tmx'
+    tmx_filename.write_text(external_map)
+
+    tiled_map = tmx.TiledMap(str(tmx_filename))
+    expected = [str(tmx_filename), str(tmp_path / 'tsx' / 'test.tsx')]
+    assert qmap.get_map_sources(tiled_map) == expected
+
+    qmap_filename = qmap.write_qmap(tiled_map)
+    metadata = qmap.read_qmap_metadata(qmap_filename)
+    assert [source for source, date in metadata['sources']] == ['external.tmx', 'tsx/test.tsx']
+    assert all(date > 0 for source, date in metadata['sources'])
+
+    # The loaded map's sources come from the metadata, not its tilesets
+    result = qmap.load_qmap(qmap_filename)
+    monkeypatch.setattr(result.tilesets[0], 'tileset_source', None)
+    assert qmap.get_map_sources(result) == expected
+
+#----------------------------------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,92 @@
+"""
+Test cases for the scheduler module found in Quest/World
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+import builtins
+
+from panda3d import core as p3d
+from direct.showbase.DirectObject import DirectObject
+from direct.showbase.MessengerGlobal import messenger
+from direct.task.Task import TaskManager
+
+from quest.world import scheduler
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def test_build_scheduler_runs_jobs_in_order(monkeypatch: object) -> None:
+    """
+    Verifies build steps run in the order they were scheduled, that a
+    spent budget still runs one step per frame and that progress and
+    completion events are sent
+    """
+
+    monkeypatch.setattr(builtins, 'messenger', messenger, raising=False)
+    events = []
+    listener = DirectObject()
+    listener.accept(scheduler.BuildScheduler.PROGRESS_EVENT, lambda *args: events.append(('progress',) + args))
+    listener.accept(scheduler.BuildScheduler.JOB_COMPLETE_EVENT, lambda *args: events.append(('job',) + args))
+    listener.accept(scheduler.BuildScheduler.COMPLETE_EVENT, lambda *args: events.append(('complete',) + args))
+
+    calls = []
+    build_scheduler = scheduler.BuildScheduler(budget=0, batch_size=64)
+    build_scheduler.schedule('first', [(calls.append, (1,)), (calls.append, (2,))])
+    build_scheduler.schedule('second', [(calls.append, (3,))])
+    build_scheduler.schedule('cancelled', [(calls.append, (4,))])
+    assert build_scheduler.total == 4
+
+    assert build_scheduler.run() == 1
+    assert calls == [1]
+    assert build_scheduler.progress == 0.25
+
+    build_scheduler.cancel('cancelled')
+    assert build_scheduler.run(budget=1000) == 2
+    assert calls == [1, 2, 3]
+    assert not build_scheduler.pending
+    assert build_scheduler.progress == 1.0
+
+    listener.ignore_all()
+    assert events == [
+        ('progress', 1, 4),
+        ('job', 'first'),
+        ('job', 'second'),
+        ('progress', 3, 3),
+        ('complete',)]
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def test_build_scheduler_stops_when_drained(monkeypatch: object) -> None:
+    """
+    Verifies the scheduler's task only runs while build work is queued
+    and is started again by scheduled and handed over work
+    """
+
+    task_mgr = TaskManager()
+    monkeypatch.setattr(builtins, 'task_mgr', task_mgr, raising=False)
+    monkeypatch.setattr(builtins, 'globalClock', p3d.ClockObject.get_global_clock(), raising=False)
+
+    calls = []
+    build_scheduler = scheduler.BuildScheduler(budget=0, batch_size=64)
+    assert not build_scheduler.activated
+
+    build_scheduler.schedule('first', [(calls.append, (1,)), (calls.append, (2,))])
+    assert build_scheduler.activated
+
+    task_mgr.step()
+    assert calls == [1]
+    assert build_scheduler.activated
+
+    task_mgr.step()
+    assert calls == [1, 2]
+    assert not build_scheduler.activated
+
+    build_scheduler.hand_over('second', calls.append, (3,))
+    assert build_scheduler.activated
+
+    task_mgr.step()
+    assert calls == [1, 2, 3]
+    assert not build_scheduler.activated
+    task_mgr.destroy()
+
+#----------------------------------------------------------------------------------------------------------------------------------#
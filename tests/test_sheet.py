@@ -0,0 +1,131 @@
+"""
+Test cases for the sheet module found in Quest/World
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+import gc
+
+from panda3d import core as p3d
+
+from quest.world import sheet, tmx
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+# Test TMX map data using a 2x2 tile sheet used for PyTest
+test_map = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.4" orientation="orthogonal" renderorder="right-down" width="4" height="1" tilewidth="32" tileheight="32">
+ <tileset firstgid="1" name="tiles" tilewidth="32" tileheight="32" tilecount="4" columns="2">
+  <image source="tiles.png" width="64" height="64"/>
+ </tileset>
+ <layer id="1" name="Ground" width="4" height="1">
+  <data encoding="csv">1,2,3,2147483652</data>
+ </layer>
+</map>
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def write_test_image(path: object, size: int) -> str:
+    """
+    Writes a square RGBA test image and returns its filename
+    """
+
+    image = p3d.PNMImage(size, size, 4)
+    image.fill(0.5, 0.25, 1.0)
+    image.write(p3d.Filename.from_os_specific(str(path)))
+
+    return str(path)
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def test_sheet_cache_shares_and_evicts(tmp_path: object) -> None:
+    """
+    Verifies sheets are decoded once, shared between users and only
+    evicted once unreferenced and over the byte budget
+    """
+
+    first = write_test_image(tmp_path / 'first.png', 16)
+    second = write_test_image(tmp_path / 'second.png', 16)
+    sheet_cache = sheet.SheetCache(budget=16 * 16 * 4)
+
+    image = sheet_cache.acquire(first)
+    assert sheet_cache.acquire(first) is image
+    assert (sheet_cache.hits, sheet_cache.misses) == (1, 1)
+    assert sheet_cache.resident_bytes == 16 * 16 * 4
+
+    sheet_cache.acquire(second)
+    assert first in sheet_cache and second in sheet_cache
+    assert sheet_cache.resident_bytes == 2 * 16 * 16 * 4
+
+    sheet_cache.release(first)
+    assert first in sheet_cache
+    sheet_cache.release(first)
+    assert first not in sheet_cache
+    assert second in sheet_cache
+    assert sheet_cache.resident_bytes == 16 * 16 * 4
+
+def test_tile_visual_table_gathers_layer(tmp_path: object) -> None:
+    """
+    Verifies the tile visual table rows match the per tile coordinates,
+    gathers a whole layer in one index and references its sheet image
+    only while the table is alive
+    """
+
+    write_test_image(tmp_path / 'tiles.png', 64)
+    tmx_filename = tmp_path / 'tiles.tmx'
+    tmx_filename.write_text(test_map)
+
+    tiled_map = tmx.TiledMap(str(tmx_filename), image_loader=sheet.load_tiled_image)
+    table = sheet.get_tile_visual_table(tiled_map)
+    assert sheet.get_tile_visual_table(tiled_map) is table
+
+    tileset_table = table.get_tileset_table(tiled_map.tilesets[0])
+    assert tileset_table.dtype == sheet.TILE_VISUAL_DTYPE
+    for local_id, (x, y, width, height) in enumerate(tiled_map.tilesets[0].tile_rects):
+        assert tileset_table[local_id]['tile_x'] == sheet.get_tile_coord(x, width, 2)
+        assert tileset_table[local_id]['tile_y'] == sheet.get_tile_coord(y, height, 2, invert=True)
+
+    layer = tiled_map.layers[0]
+    visuals = table.get_visuals(layer.data)
+    assert visuals.shape == layer.data.shape
+    assert visuals[0]['tile_x'].tolist() == [0, 1, 0, 1]
+    assert visuals[0]['tile_y'].tolist() == [1, 1, 0, 0]
+    assert visuals[0]['flags'].tolist() == [0, 0, 0, 4]
+    assert (visuals['count_x'] == 2).all() and (visuals['sheet'] == 0).all()
+
+    image = tiled_map.images[layer.data[0][3]]
+    assert (image['tile_x'], image['tile_y'], image['flags']) == (1, 0, 4)
+
+    sheet_cache = sheet.get_sheet_cache()
+    assert table.get_sheet_image(0).get_x_size() == 64
+    entry = sheet_cache._entries[table.sheets[0]]
+    assert entry.references == 1
+
+    del tiled_map, table, layer, image
+    gc.collect()
+    assert entry.references == 0
+
+
+def test_tile_visual_table_reuses_image_rows(tmp_path: object) -> None:
+    """
+    Verifies a whole image tile is given a single row, however often
+    its visual is looked up
+    """
+
+    write_test_image(tmp_path / 'tiles.png', 64)
+    image_filename = write_test_image(tmp_path / 'image.png', 32)
+    tmx_filename = tmp_path / 'tiles.tmx'
+    tmx_filename.write_text(test_map)
+
+    tiled_map = tmx.TiledMap(str(tmx_filename), image_loader=sheet.load_tiled_image)
+    table = sheet.get_tile_visual_table(tiled_map)
+    row_count = len(table._rows)
+
+    visual = table.get_image_visual(image_filename)
+    assert table.get_image_visual(image_filename) == visual
+    assert (visual['count_x'], visual['count_y'], visual['sheet']) == (1, 1, 1)
+    assert len(table._rows) == row_count + 1
+    assert table.sheets[1] == sheet.get_sheet_path(image_filename)
+
+#----------------------------------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,410 @@
+"""
+Test cases for the tmx module found in Quest/World
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+import os
+import zlib
+import base64
+import pytest
+import numpy as np
+
+from xml.etree import ElementTree
+
+from quest.world import tmx
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+# Root directory of the game assets used for PyTest
+assets_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets')
+
+# Test TMX map data with an object group between two tile layers used for PyTest
+interleaved_map = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.4" orientation="orthogonal" renderorder="right-down" width="3" height="2" tilewidth="32" tileheight="32">
+ <tileset firstgid="1" name="test" tilewidth="32" tileheight="32" tilecount="8" columns="4">
+  <image source="test.png" width="128" height="64"/>
+  <tile id="6">
+   <animation>
+    <frame tileid="6" duration="100"/>
+    <frame tileid="7" duration="100"/>
+   </animation>
+  </tile>
+ </tileset>
+ <layer id="1" name="Ground" width="3" height="2">
+  <data encoding="csv">1,2,3,3,2,1</data>
+ </layer>
+ <objectgroup id="2" name="Props">
+  <object id="1" name="chest" gid="6" x="32" y="64" width="32" height="32"/>
+ </objectgroup>
+ <layer id="3" name="Detail" width="3" height="2">
+  <data encoding="csv">0,5,0,4,0,2147483653</data>
+ </layer>
+</map>
+"""
+
+# Test infinite TMX map data with 2x2 chunks used for PyTest
+infinite_map = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.4" orientation="orthogonal" renderorder="right-down" width="4" height="4" tilewidth="32" tileheight="32" infinite="1">
+ <tileset firstgid="1" name="test" tilewidth="32" tileheight="32" tilecount="4" columns="2">
+  <image source="test.png" width="64" height="64"/>
+ </tileset>
+ <layer id="1" name="Ground" width="4" height="4">
+  <data encoding="csv">
+   <chunk x="-2" y="0" width="2" height="2">1,2,3,4</chunk>
+   <chunk x="0" y="0" width="2" height="2">4,0,0,2147483649</chunk>
+   <chunk x="0" y="2" width="2" height="2">2,2,2,2</chunk>
+  </data>
+ </layer>
+</map>
+"""
+
+# Test TMX map data with box, point and polyline objects used for PyTest
+objects_map = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.4" orientation="orthogonal" renderorder="right-down" width="16" height="16" tilewidth="32" tileheight="32">
+ <objectgroup id="1" name="Triggers">
+  <object id="1" name="door" x="32" y="32" width="64" height="32"/>
+  <object id="2" name="spawn" x="300" y="300">
+   <point/>
+  </object>
+  <object id="3" name="path" x="200" y="0">
+   <polyline points="0,0 100,50 200,0"/>
+  </object>
+ </objectgroup>
+</map>
+"""
+
+def get_asset_path(path: str) -> str:
+    """
+    Returns the absolute path to the requested asset
+    """
+
+    return os.path.join(assets_directory, path)
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def test_layer_data_is_uint32_array() -> None:
+    """
+    Loads a devplanet chunk and verifies the tile layer data is stored
+    as a 2D uint32 array that still supports the row/column accessors
+    """
+
+    tiled_map = tmx.TiledMap(get_asset_path('zones/devplanet/001-1-1.tmx'))
+    layer = tiled_map.layers[0]
+
+    assert layer.data.dtype == np.uint32
+    assert layer.data.shape == (layer.height, layer.width)
+    assert tiled_map.get_tile_gid(0, 0, 0) == layer.data[0][0]
+    assert len(list(layer.iter_data())) == layer.width * layer.height
+
+def test_register_gids_matches_register_gid() -> None:
+    """
+    Verifies the vectorized GID registration assigns the same GIDs,
+    in the same order, as registering each raw value one at a time
+    """
+
+    raw_gids = [
+        0, 5, 5 | tmx.GID_TRANS_FLIPX, 3, 5,
+        3 | tmx.GID_TRANS_ROT | tmx.GID_TRANS_FLIPY, 0, 70000]
+
+    expected_map = tmx.TiledMap()
+    expected = [expected_map.register_gid(*tmx.decode_gid(raw)) for raw in raw_gids]
+
+    tiled_map = tmx.TiledMap()
+    result = tiled_map.register_gids(np.array(raw_gids, dtype=np.uint32))
+
+    assert result.tolist() == expected
+    assert tiled_map.imagemap == expected_map.imagemap
+    assert tiled_map.tiledgidmap == expected_map.tiledgidmap
+
+def test_decode_layer_data_encodings() -> None:
+    """
+    Verifies the CSV and compressed base64 layer decoders produce the
+    same raw GIDs, including GIDs carrying the Tiled flag bits
+    """
+
+    raw_gids = np.array([1, 2, 2684354576, 0, 70000, 3], dtype='<u4')
+    csv_node = ElementTree.fromstring(
+        '<data encoding="csv">\n1,2,\n2684354576,0,\n70000,3\n</data>')
+    zlib_node = ElementTree.fromstring(
+        '<data encoding="base64" compression="zlib">%s</data>' % (
+            base64.b64encode(zlib.compress(raw_gids.tobytes())).decode('ascii')))
+
+    assert tmx.decode_layer_data(csv_node, 6).tolist() == raw_gids.tolist()
+    assert tmx.decode_layer_data(zlib_node, 6).tolist() == raw_gids.tolist()
+
+def test_decode_layer_data_rejects_malformed_csv() -> None:
+    """
+    Verifies CSV layer data with invalid values or the wrong number
+    of tiles raises rather than returning a short array
+    """
+
+    for data, error in (('1,2,x,4', 'not valid CSV'), ('1,2,-3,4', 'not valid CSV'), ('1,2,\n3', 'has 3 tiles')):
+        with pytest.raises(Exception, match=error):
+            tmx.decode_layer_data(ElementTree.fromstring('<data encoding="csv">%s</data>' % data), 4)
+
+def test_streaming_parser_matches_dom_parser(tmp_path: object) -> None:
+    """
+    Verifies the streaming iterparse parser produces the same layers
+    and GID mappings as the DOM parser
+    """
+
+    tmx_filename = tmp_path / 'interleaved.tmx'
+    tmx_filename.write_text(interleaved_map)
+
+    for filename in (str(tmx_filename), get_asset_path('zones/test/desert.tmx')):
+        expected = tmx.TiledMap(filename)
+        result = tmx.TiledMap(filename, streaming=True)
+
+        assert [layer.name for layer in result.layers] == [layer.name for layer in expected.layers]
+        assert result.gidmap == expected.gidmap
+        assert result.imagemap == expected.imagemap
+        assert result.tile_properties == expected.tile_properties
+        assert result.images == expected.images
+        for result_layer, expected_layer in zip(result.layers, expected.layers):
+            if isinstance(expected_layer, tmx.TiledTileLayer):
+                assert np.array_equal(result_layer.data, expected_layer.data)
+
+        for result_obj, expected_obj in zip(result.objects, expected.objects):
+            assert result_obj.parent is result
+            assert (result_obj.gid, result_obj.y) == (expected_obj.gid, expected_obj.y)
+
+def test_chunked_layer_decodes_lazily(tmp_path: object) -> None:
+    """
+    Verifies infinite map layers only decode the chunks that are
+    requested and load the images of their GIDs on demand
+    """
+
+    tmx_filename = tmp_path / 'infinite.tmx'
+    tmx_filename.write_text(infinite_map)
+
+    tiled_map = tmx.TiledMap(str(tmx_filename))
+    layer = tiled_map.layers[0]
+
+    assert isinstance(layer, tmx.TiledChunkedTileLayer)
+    assert layer.bounds == (-2, 0, 2, 4)
+    assert layer.decoded_chunk_count == 0
+
+    chunks = layer.get_chunks_in_rect(0, 0, 2, 2)
+    assert [(chunk.x, chunk.y) for chunk in chunks] == [(0, 0)]
+    assert layer.get_chunk(-1, 1) is layer.chunks[(-2, 0)]
+
+    data = chunks[0].data
+    assert layer.decoded_chunk_count == 1
+    assert tiled_map.tiledgidmap[data[0][0]] == 4
+    assert tiled_map.tiledgidmap[data[1][1]] == 1
+    assert tiled_map.images[data[0][0]] is not None
+    assert tiled_map.images[data[1][1]][2].flipped_horizontally
+
+    chunk_layer = layer.get_chunk_layer(chunks[0])
+    assert chunk_layer.name == 'Ground@0,0'
+    assert [tile[:2] for tile in chunk_layer.tiles()] == [(0, 0), (1, 1)]
+
+def test_chunked_layer_resolves_tiles_through_chunks(tmp_path: object) -> None:
+    """
+    Verifies the map's tile accessors resolve the tiles of an infinite
+    map layer through its chunks rather than a layer data array
+    """
+
+    tmx_filename = tmp_path / 'infinite.tmx'
+    tmx_filename.write_text(infinite_map)
+
+    tiled_map = tmx.TiledMap(str(tmx_filename))
+    layer = tiled_map.layers[0]
+    assert not isinstance(layer, tmx.TiledTileLayer)
+    assert not hasattr(layer, 'set_tiles')
+
+    assert tiled_map.tiledgidmap[tiled_map.get_tile_gid(-1, 1, 0)] == 4
+    assert tiled_map.get_tile_gid(1, 1, 0) == layer.chunks[(0, 0)].data[1][1]
+    assert tiled_map.get_tile_gid(5, 5, 0) == 0
+    assert tiled_map.get_tile_image(-2, 0, 0) is tiled_map.images[layer.get_tile_gid(-2, 0)]
+    assert layer.decoded_chunk_count == 2
+
+    tiled_map.set_tile_gid(1, 3, 0, 0)
+    assert layer.chunks[(0, 2)].data.tolist() == [[layer.get_tile_gid(0, 2)] * 2, [layer.get_tile_gid(0, 3), 0]]
+
+    gids = [gid for gid, props in tiled_map.get_tile_properties_by_layer(0)]
+    assert gids == [gid for gid in layer.get_gids() if gid in tiled_map.tile_properties]
+    assert len(layer.get_gids()) == 5
+    assert list(tiled_map.visible_tile_layers) == []
+
+def test_empty_chunked_layer_has_no_chunks(tmp_path: object) -> None:
+    """
+    Verifies chunk lookups on an infinite map layer without any chunks
+    find nothing rather than failing on its unknown chunk size
+    """
+
+    tmx_filename = tmp_path / 'infinite.tmx'
+    tmx_filename.write_text(infinite_map.replace(' </layer>', """ </layer>
+ <layer id="2" name="Empty" width="4" height="4">
+  <data encoding="csv">
+  </data>
+ </layer>"""))
+
+    tiled_map = tmx.TiledMap(str(tmx_filename))
+    layer = tiled_map.layers[1]
+    assert layer.chunks == {}
+    assert layer.get_chunk(1, 1) is None
+    assert layer.get_chunks_in_rect(0, 0, 4, 4) == []
+    assert layer.get_tile_gid(1, 1) == 0
+    assert tiled_map.get_tile_gid(1, 1, 1) == 0
+
+def test_chunk_layer_edits_skip_gid_index(tmp_path: object) -> None:
+    """
+    Edits the streamed layer of a single chunk, which is not one of the
+    map's layers, and verifies the GID index ignores it
+    """
+
+    tmx_filename = tmp_path / 'infinite.tmx'
+    tmx_filename.write_text(infinite_map)
+
+    tiled_map = tmx.TiledMap(str(tmx_filename))
+    layer = tiled_map.layers[0]
+    assert list(tiled_map.get_tile_locations_by_gid(1)) == []
+
+    chunk = layer.chunks[(0, 0)]
+    chunk_layer = layer.get_chunk_layer(chunk)
+    chunk_layer.set_tile_gid(1, 0, 1)
+    chunk_layer.set_tiles(0, 1, np.array([[1, 1]], dtype=np.uint32))
+    assert chunk.data.tolist() == [[chunk.data[0][0], 1], [1, 1]]
+    assert layer.get_tile_gid(1, 0) == 1
+
+def test_gid_index_queries_and_updates() -> None:
+    """
+    Verifies the GID index matches a full scan of the layer data and
+    stays correct when tiles and tile properties change
+    """
+
+    tiled_map = tmx.TiledMap(get_asset_path('zones/test/desert.tmx'))
+    layer = tiled_map.layers[0]
+
+    def scan(gid: int) -> list:
+        """
+        Returns the locations of the gid found by a full layer scan
+        """
+
+        return sorted((x, y, 0) for x, y, tile_gid in layer.iter_data() if tile_gid == gid)
+
+    for gid in (1, 20, 39):
+        assert sorted(tiled_map.get_tile_locations_by_gid(gid)) == scan(gid)
+
+    tiled_map.set_tile_gid(0, 0, 0, 39)
+    tiled_map.set_tile_gid(5, 7, 0, 39)
+    layer.set_tiles(2, 3, np.array([[20, 39], [1, 0]], dtype=np.uint32))
+    for gid in (0, 1, 20, 39):
+        assert sorted(tiled_map.get_tile_locations_by_gid(gid)) == scan(gid)
+
+    tiled_map.set_tile_properties(39, {'spawn': True})
+    assert tiled_map.get_gids_by_property('spawn') == [39]
+    assert tiled_map.get_gids_by_property('spawn', False) == []
+    assert sorted(map(tuple, tiled_map.get_tile_coordinates_by_property('spawn', True).tolist())) == scan(39)
+
+def test_external_tileset_parsed_once() -> None:
+    """
+    Verifies external tilesets are parsed once per process and shared
+    between maps while each map still gets its own properties
+    """
+
+    tmx.clear_tileset_cache()
+    first = tmx.TiledMap(get_asset_path('zones/devplanet/001-1-1.tmx'))
+    assert len(tmx._tileset_cache) == 1
+    description = next(iter(tmx._tileset_cache.values()))[1]
+
+    second = tmx.TiledMap(get_asset_path('zones/devplanet/001-2-2.tmx'))
+    assert next(iter(tmx._tileset_cache.values()))[1] is description
+    assert second.tile_properties == first.tile_properties
+    assert second.tilesets[0].source == first.tilesets[0].source
+    assert second.tilesets[0].tile_rects is first.tilesets[0].tile_rects
+
+    first.tilesets[0].properties['changed'] = True
+    assert 'changed' not in second.tilesets[0].properties
+
+def test_images_load_on_first_access(tmp_path: object) -> None:
+    """
+    Verifies tile images are only loaded when their GID is first accessed,
+    except for optional GIDs which are loaded with the map, and that maps
+    compare their images without loading them
+    """
+
+    tmx_filename = tmp_path / 'interleaved.tmx'
+    tmx_filename.write_text(interleaved_map)
+
+    tiled_map = tmx.TiledMap(str(tmx_filename), optional_gids={4})
+    images = tiled_map.images
+    gid = tiled_map.get_tile_gid(0, 0, 0)
+
+    assert images.materialized_count == 1
+    assert images.is_loaded(tiled_map.map_gid(4)[0][0])
+    assert not images.is_loaded(gid)
+
+    assert images[gid][1:] == ((0, 0, 32, 32), tmx.TileFlags(False, False, False))
+    assert images[gid] is images[gid]
+    assert images.materialized_count == 2
+    assert images[0] is None and images.materialized_count == 2
+
+    other_map = tmx.TiledMap(str(tmx_filename))
+    assert other_map.images == images
+    assert other_map.images.get_source(gid) == images[gid]
+    assert other_map.images.materialized_count == 0
+
+def test_object_index_queries() -> None:
+    """
+    Verifies the object spatial index answers rectangle, radius and point
+    queries and stays correct when objects move or are added
+    """
+
+    tiled_map = tmx.TiledMap.from_xml_string(objects_map)
+    door, spawn, path = (tiled_map.get_object_by_name(name) for name in ('door', 'spawn', 'path'))
+    index = tiled_map.object_index
+
+    assert index.query_rect(0, 0, 128, 128) == [door]
+    assert index.query_rect(0, 0, 512, 512) == [door, spawn, path]
+    assert index.query_point(350, 25) == [path]
+    assert index.query_point(350, 60) == []
+    assert index.query_radius(290, 290, 15) == [spawn]
+    assert index.query_radius(290, 290, 14) == []
+
+    spawn.x, spawn.y = 40, 40
+    assert index.query_point(40, 40) == [door, spawn]
+    assert index.query_rect(256, 256, 128, 128) == []
+
+    # Polyline points move along with their object
+    path.x, path.y = 0, 300
+    assert path.points == ((0, 300), (100, 350), (200, 300))
+    assert index.query_point(100, 325) == [path]
+    assert index.query_point(350, 25) == []
+
+    chest = tmx.TiledObject(tiled_map, ElementTree.fromstring(
+        '<object id="4" name="chest" x="480" y="480" width="16" height="16"/>'))
+    tiled_map.add_object(chest, tiled_map.get_layer_by_name('Triggers'))
+    assert index.query_radius(470, 470, 15) == [chest]
+
+    tiled_map.remove_object(door)
+    assert index.query_point(40, 40) == [spawn]
+    assert door not in list(tiled_map.objects)
+
+def test_import_gids_patches_changed_tiles(tmp_path: object) -> None:
+    """
+    Verifies a re-parsed map's layer data is translated into the loaded
+    map's GIDs and only the changed tiles are written
+    """
+
+    tmx_filename = tmp_path / 'interleaved.tmx'
+    tmx_filename.write_text(interleaved_map)
+    tiled_map = tmx.TiledMap(str(tmx_filename))
+
+    tmx_filename.write_text(interleaved_map.replace('1,2,3,3,2,1', '1,2,8,3,2,2147483650'))
+    edited_map = tmx.TiledMap(str(tmx_filename))
+
+    layer = tiled_map.layers[0]
+    data = tiled_map.import_gids(edited_map, edited_map.layers[0].data)
+    ys, xs = layer.set_data(data)
+
+    assert sorted(zip(xs.tolist(), ys.tolist())) == [(2, 0), (2, 1)]
+    assert tiled_map.tiledgidmap[layer.data[0][2]] == 8
+    assert tiled_map.images[layer.data[1][2]][2].flipped_horizontally
+    assert sorted(tiled_map.get_tile_locations_by_gid(layer.data[0][2])) == [(2, 0, 0)]
+
+    assert len(layer.set_data(data)[0]) == 0
+
+#----------------------------------------------------------------------------------------------------------------------------------#
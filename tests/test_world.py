@@ -0,0 +1,296 @@
+"""
+Test cases for the world module found in Quest/World
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+import os
+import types
+import threading
+import pytest
+import numpy as np
+
+from panda3d import core as p3d
+
+from quest.engine import prc
+from quest.world import scheduler, world
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+# Test infinite TMX map data with 2x2 chunks used for PyTest
+infinite_map = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.4" orientation="orthogonal" renderorder="right-down" width="4" height="4" tilewidth="8" tileheight="8" infinite="1">
+ <tileset firstgid="1" name="tiles" tilewidth="8" tileheight="8" tilecount="4" columns="2">
+  <image source="tiles.png" width="16" height="16"/>
+ </tileset>
+ <layer id="1" name="Ground" width="4" height="4">
+  <data encoding="csv">
+   <chunk x="-2" y="0" width="2" height="2">1,2,3,4</chunk>
+   <chunk x="0" y="0" width="2" height="2">4,0,0,1</chunk>
+   <chunk x="0" y="2" width="2" height="2">2,2,2,2</chunk>
+  </data>
+ </layer>
+</map>
+"""
+
+# Root directory of the game assets used for PyTest
+assets_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets')
+
+# Test finite TMX map data using a 2x2 tile sheet. The layers are filled in per test
+finite_map = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.4" orientation="orthogonal" renderorder="right-down" width="4" height="4" tilewidth="8" tileheight="8">
+ <tileset firstgid="1" name="tiles" tilewidth="8" tileheight="8" tilecount="4" columns="2">
+  <image source="tiles.png" width="16" height="16"/>
+ </tileset>
+%(layers)s
+</map>
+"""
+
+# Test tile layer of the finite TMX map
+finite_layer = """ <layer id="%(id)d" name="%(name)s" width="4" height="4">
+  <data encoding="csv">%(data)s</data>
+ </layer>"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def write_finite_map(path: object, filename: str, layers: dict) -> None:
+    """
+    Writes the test sheet and a finite map with the requested
+    layer name to layer data items
+    """
+
+    p3d.PNMImage(16, 16, 4).write(p3d.Filename.from_os_specific(str(path / 'tiles.png')))
+    layers = '\n'.join(finite_layer % {'id': layer_id, 'name': name, 'data': ','.join(map(str, data.ravel().tolist()))}
+        for layer_id, (name, data) in enumerate(layers.items(), 1))
+    (path / filename).write_text(finite_map % {'layers': layers})
+
+def build_test_chunk(chunk: object) -> None:
+    """
+    Sets up the chunk with the geometry cache disabled and
+    runs its build work. The layer shader is loaded from the
+    assets directory
+    """
+
+    model_path = p3d.get_model_path()
+    model_path.prepend_directory(p3d.Filename.from_os_specific(assets_directory))
+    prc.set_prc_bool('want-geometry-cache', False)
+    try:
+        chunk.setup()
+        run_test_chunk(chunk)
+    finally:
+        prc.set_prc_bool('want-geometry-cache', True)
+        model_path.clear_local_value()
+
+def run_test_chunk(chunk: object) -> None:
+    """
+    Runs all of the queued build work of the chunk and its layers
+    """
+
+    model_path = p3d.get_model_path()
+    model_path.prepend_directory(p3d.Filename.from_os_specific(assets_directory))
+    try:
+        while chunk._scheduler.run(budget=1000):
+            pass
+    finally:
+        model_path.clear_local_value()
+
+def create_test_chunk(path: object, filename: str) -> object:
+    """
+    Creates a world chunk for a TMX file in path, as part of a world
+    without a tile atlas
+    """
+
+    game_world = types.SimpleNamespace(world_directory=str(path), atlas=None)
+    return world.GameWorldChunk(game_world, {'fileName': filename})
+
+@pytest.fixture
+def build_scheduler(monkeypatch: object) -> scheduler.BuildScheduler:
+    """
+    Replaces the process wide build scheduler used by the chunks
+    and their layers with a private one for the test
+    """
+
+    build_scheduler = scheduler.BuildScheduler(budget=0, batch_size=64)
+    monkeypatch.setattr(scheduler, '_build_scheduler', build_scheduler)
+
+    return build_scheduler
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def test_stream_chunks_creates_layers_on_main_thread(tmp_path: object, build_scheduler: object) -> None:
+    """
+    Streams the chunks around a viewer from a worker thread and verifies
+    the chunks are only decoded and given layer nodes once the handed
+    over work is run
+    """
+
+    p3d.PNMImage(16, 16, 4).write(p3d.Filename.from_os_specific(str(tmp_path / 'tiles.png')))
+    (tmp_path / 'infinite.tmx').write_text(infinite_map)
+    chunk = create_test_chunk(tmp_path, 'infinite.tmx')
+    chunk.setup()
+
+    viewer = chunk.root.attach_new_node('Viewer')
+    viewer.set_pos(1, 1, 0)
+
+    worker = threading.Thread(target=chunk.stream_chunks, args=(viewer, 1))
+    worker.start()
+    worker.join()
+
+    tiled_layer = chunk._tiled_map.layers[0]
+    assert tiled_layer.decoded_chunk_count == 0
+    assert chunk.get_layer_by_name('Ground@0,0') is None
+
+    # Chunks that are already requested are not requested again
+    chunk.stream_chunks(viewer, 1)
+    run_test_chunk(chunk)
+    assert tiled_layer.decoded_chunk_count == 2
+
+    for name, position in (('Ground@0,0', (0, 0, 0)), ('Ground@0,2', (0, 2, 0))):
+        layer_inst = chunk.get_layer_by_name(name)
+        assert layer_inst is not None
+        assert layer_inst.root.get_parent() == chunk.root
+        assert layer_inst.root.get_pos() == p3d.LPoint3(*position)
+
+    assert chunk.get_layer_by_name('Ground@-2,0') is None
+    assert not chunk._requested_chunks
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def test_chunk_reload_patches_changed_tiles(tmp_path: object, build_scheduler: object, monkeypatch: object) -> None:
+    """
+    Edits a chunk's TMX file and verifies reloading the chunk rewrites
+    only the quads of the changed tiles in its existing layer node
+    """
+
+    data = np.arange(16).reshape(4, 4) % 4 + 1
+    write_finite_map(tmp_path, 'chunk.tmx', {'Ground': data})
+    chunk = create_test_chunk(tmp_path, 'chunk.tmx')
+    build_test_chunk(chunk)
+
+    layer_inst = chunk.get_layer_by_name('Ground')
+    vertex_data = layer_inst._vertex_data
+    before = bytes(vertex_data.get_array(0).get_handle().get_data())
+
+    updates = []
+    handle_tiles_update = layer_inst._handle_tiles_update
+    monkeypatch.setattr(layer_inst, '_handle_tiles_update',
+        lambda xs, ys: (updates.extend(zip(xs.tolist(), ys.tolist())), handle_tiles_update(xs, ys)))
+
+    edited = data.copy()
+    edited[1, 2] = 4 if data[1, 2] != 4 else 1
+    edited[3, 0] = 0
+    write_finite_map(tmp_path, 'chunk.tmx', {'Ground': edited})
+    assert chunk.reload()
+    run_test_chunk(chunk)
+
+    assert chunk.get_layer_by_name('Ground') is layer_inst
+    assert layer_inst._vertex_data is vertex_data
+    assert sorted(updates) == [(0, 3), (2, 1)]
+    assert np.array_equal(chunk._tiled_map.layers[0].data, edited)
+
+    # Four 16 byte vertices are written per quad
+    after = bytes(vertex_data.get_array(0).get_handle().get_data())
+    quads_before = np.frombuffer(before, dtype=np.uint8).reshape(-1, 64)
+    quads_after = np.frombuffer(after, dtype=np.uint8).reshape(-1, 64)
+    changed_quads = np.flatnonzero((quads_before != quads_after).any(axis=1))
+    assert set(changed_quads.tolist()) <= {1 * 4 + 2, 3 * 4 + 0}
+    assert 1 * 4 + 2 in changed_quads
+
+def test_chunk_reload_rebuilds_changed_layout(tmp_path: object, build_scheduler: object) -> None:
+    """
+    Verifies reloading a chunk whose TMX file gained a layer falls
+    back to rebuilding all of the chunk's layers
+    """
+
+    data = np.ones((4, 4), dtype=np.uint32)
+    write_finite_map(tmp_path, 'chunk.tmx', {'Ground': data})
+    chunk = create_test_chunk(tmp_path, 'chunk.tmx')
+    build_test_chunk(chunk)
+    ground = chunk.get_layer_by_name('Ground')
+
+    write_finite_map(tmp_path, 'chunk.tmx', {'Ground': data, 'Detail': data * 2})
+    prc.set_prc_bool('want-geometry-cache', False)
+    try:
+        assert not chunk.reload()
+    finally:
+        prc.set_prc_bool('want-geometry-cache', True)
+    run_test_chunk(chunk)
+
+    assert chunk.get_layer_by_name('Ground') is not ground
+    assert ground.root.is_empty()
+    assert chunk.get_layer_by_name('Detail') is not None
+    assert [layer.name for layer in chunk._tiled_map.layers] == ['Ground', 'Detail']
+
+def test_chunk_reload_rebuilds_changed_tileset(tmp_path: object, build_scheduler: object) -> None:
+    """
+    Verifies reloading a chunk patches it while its external tileset is
+    unchanged and rebuilds it once the tileset file was edited
+    """
+
+    tileset = """<?xml version="1.0" encoding="UTF-8"?>
+<tileset version="1.4" name="tiles" tilewidth="8" tileheight="8" tilecount="4" columns="2">
+ <image source="tiles.png" width="16" height="16"/>
+%s</tileset>
+"""
+
+    data = np.ones((4, 4), dtype=np.uint32)
+    write_finite_map(tmp_path, 'chunk.tmx', {'Ground': data})
+    chunk_map = (tmp_path / 'chunk.tmx').read_text()
+    chunk_map = chunk_map.replace(chunk_map[chunk_map.index(' <tileset'):chunk_map.index('</tileset>') + 10],
+        ' <tileset firstgid="1" source="tiles.tsx"/>')
+    (tmp_path / 'chunk.tmx').write_text(chunk_map)
+    (tmp_path / 'tiles.tsx').write_text(tileset % '')
+
+    chunk = create_test_chunk(tmp_path, 'chunk.tmx')
+    build_test_chunk(chunk)
+    ground = chunk.get_layer_by_name('Ground')
+    assert chunk.reload()
+
+    # The tileset file is dated after the loaded map
+    tileset_filename = tmp_path / 'tiles.tsx'
+    tileset_filename.write_text(tileset % """ <tile id="0">
+  <animation>
+   <frame tileid="0" duration="100"/>
+   <frame tileid="1" duration="100"/>
+  </animation>
+ </tile>
+""")
+    os.utime(tileset_filename, (tileset_filename.stat().st_atime, tileset_filename.stat().st_mtime + 10))
+
+    prc.set_prc_bool('want-geometry-cache', False)
+    try:
+        assert not chunk.reload()
+    finally:
+        prc.set_prc_bool('want-geometry-cache', True)
+    run_test_chunk(chunk)
+
+    assert chunk.get_layer_by_name('Ground') is not ground
+    assert 'frames' in chunk._tiled_map.tile_properties[1]
+
+def test_world_reload_chunk_matches_paths(tmp_path: object, monkeypatch: object) -> None:
+    """
+    Verifies the world reloads the chunk whose file name matches the
+    requested path, either relative to the world directory or joined
+    with it, and ignores files that are not part of the world
+    """
+
+    world_directory = tmp_path / 'zone'
+    world_directory.mkdir()
+    config_file = tmp_path / 'zone.ini'
+    config_file.write_text('[Configuration]\nworld_file = %s\n' % (world_directory / 'zone.world'))
+    game_world = world.GameWorld(1, str(config_file))
+
+    reloaded = []
+    for position, filename in (((0, 0), 'maps/west.tmx'), ((1, 0), 'maps/east.tmx')):
+        chunk = types.SimpleNamespace(filename=filename)
+        chunk.reload = lambda filename=filename: reloaded.append(filename)
+        game_world._chunks[position] = chunk
+
+    assert game_world.reload_chunk('maps/east.tmx')
+    assert game_world.reload_chunk(os.path.join(str(world_directory), 'maps', 'west.tmx'))
+    assert game_world.reload_chunk(os.path.join(str(world_directory), 'maps', '..', 'maps', 'east.tmx'))
+    assert not game_world.reload_chunk(os.path.join(str(tmp_path), 'maps', 'east.tmx'))
+    assert not game_world.reload_chunk('maps/north.tmx')
+    assert reloaded == ['maps/east.tmx', 'maps/west.tmx', 'maps/east.tmx']
+
+#----------------------------------------------------------------------------------------------------------------------------------#
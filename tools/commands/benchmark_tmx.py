@@ -0,0 +1,111 @@
+"""
+Setuptools command for benchmarking the TMX layer data decoders
+against the map files shipped with the application
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+import glob
+import os
+import struct
+import timeit
+
+from setuptools import Command
+from xml.etree import ElementTree
+
+from tools.command import command
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+def legacy_decode_layer_data(data_node: object) -> list:
+    """
+    Per-tile reference decoder matching the original pytmx implementation.
+    Used as the baseline for the benchmark results
+    """
+
+    encoding = data_node.get('encoding', None)
+    if encoding == 'csv':
+        return list(map(int, ''.join(
+            line.strip() for line in data_node.text.strip()).split(',')))
+
+    from base64 import b64decode
+    data = b64decode(data_node.text.strip())
+
+    compression = data_node.get('compression', None)
+    if compression == 'zlib':
+        import zlib
+        data = zlib.decompress(data)
+    elif compression == 'gzip':
+        import gzip
+        data = gzip.decompress(data)
+
+    fmt = struct.Struct('<L')
+    iterator = (data[i:i + 4] for i in range(0, len(data), 4))
+    return [fmt.unpack(i)[0] for i in iterator]
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+@command('benchmark_tmx')
+class BenchmarkTmxCommand(Command):
+    """
+    Times the vectorized TMX layer decoder against the legacy
+    per-tile decoder for every layer in the requested map files
+    """
+
+    description = 'Benchmarks TMX layer data decoding against the shipped zone maps'
+    user_options = [
+        ('pattern=', 'p', 'Glob pattern of the TMX files to benchmark'),
+        ('repeat=', 'r', 'Number of timed decodes per layer'),
+    ]
+
+    def initialize_options(self) -> None:
+        """
+        Sets the default command option values
+        """
+
+        self.pattern = os.path.join('assets', 'zones', 'devplanet', '*.tmx')
+        self.repeat = 20
+
+    def finalize_options(self) -> None:
+        """
+        Validates the command option values
+        """
+
+        self.repeat = int(self.repeat)
+
+    def run(self) -> None:
+        """
+        Performs the benchmark and prints the per-layer results
+        """
+
+        from quest.world import tmx
+
+        filenames = sorted(glob.glob(self.pattern))
+        if not filenames:
+            print('No TMX files found matching: %s' % self.pattern)
+            return
+
+        print('%-32s %-12s %10s %12s %12s %8s' % (
+            'File', 'Layer', 'Tiles', 'Legacy (ms)', 'Numpy (ms)', 'Speedup'))
+
+        for filename in filenames:
+            root = ElementTree.parse(filename).getroot()
+            for layer_node in root.findall('layer'):
+                data_node = layer_node.find('data')
+                count = int(layer_node.get('width')) * int(layer_node.get('height'))
+
+                legacy = timeit.timeit(
+                    lambda: legacy_decode_layer_data(data_node), number=self.repeat)
+                vectorized = timeit.timeit(
+                    lambda: tmx.decode_layer_data(data_node, count), number=self.repeat)
+
+                assert tmx.decode_layer_data(data_node, count).tolist() == legacy_decode_layer_data(data_node)
+                print('%-32s %-12s %10d %12.3f %12.3f %7.1fx' % (
+                    os.path.basename(filename),
+                    layer_node.get('name'),
+                    count,
+                    legacy * 1000.0 / self.repeat,
+                    vectorized * 1000.0 / self.repeat,
+                    legacy / max(vectorized, 1e-9)))
+
+#----------------------------------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,72 @@
+"""
+Setuptools command for packing the tiles used by each Tiled world
+into the tile atlas pages shared by its tile layers
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+import glob
+import os
+
+from setuptools import Command
+
+from tools.command import command
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+@command('build_atlas')
+class BuildAtlasCommand(Command):
+    """
+    Builds the tile atlas of every world file matching the requested
+    pattern and writes it next to the world file
+    """
+
+    description = 'Packs the tiles used by the zone worlds into tile atlas pages'
+    user_options = [
+        ('pattern=', 'p', 'Glob pattern of the world files to build atlases for'),
+        ('page-size=', 's', 'Width and height of each atlas page in pixels'),
+        ('padding=', 'd', 'Pixels of extruded padding around each tile'),
+        ('force', 'f', 'Rebuild atlases that are already up to date'),
+    ]
+
+    boolean_options = ['force']
+
+    def initialize_options(self) -> None:
+        """
+        Sets the default command option values
+        """
+
+        self.pattern = os.path.join('assets', 'zones', '**', '*.world')
+        self.page_size = 1024
+        self.padding = 2
+        self.force = False
+
+    def finalize_options(self) -> None:
+        """
+        Validates the command option values
+        """
+
+        self.page_size = int(self.page_size)
+        self.padding = int(self.padding)
+
+    def run(self) -> None:
+        """
+        Builds the atlases of the matching world files
+        """
+
+        from quest.world import atlas
+
+        for filename in sorted(glob.glob(self.pattern, recursive=True)):
+            if not self.force and atlas.is_atlas_up_to_date(atlas.get_atlas_path(filename)):
+                print('Skipping %s. Already up to date' % filename)
+                continue
+
+            try:
+                atlas_filename = atlas.write_atlas(filename, self.page_size, self.padding)
+            except atlas.AtlasError as e:
+                print(str(e))
+                continue
+
+            print('Built %s -> %s' % (filename, atlas_filename))
+
+#----------------------------------------------------------------------------------------------------------------------------------#
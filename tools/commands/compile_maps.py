@@ -0,0 +1,66 @@
+"""
+Setuptools command for compiling the Tiled TMX zone maps into
+the binary qmap format loaded by the world chunks
+"""
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+import glob
+import os
+
+from setuptools import Command
+
+from tools.command import command
+
+#----------------------------------------------------------------------------------------------------------------------------------#
+
+@command('compile_maps')
+class CompileMapsCommand(Command):
+    """
+    Compiles every TMX map matching the requested pattern into a
+    qmap file written next to its source
+    """
+
+    description = 'Compiles the TMX zone maps into the binary qmap format'
+    user_options = [
+        ('pattern=', 'p', 'Glob pattern of the TMX files to compile'),
+        ('force', 'f', 'Recompile maps that are already up to date'),
+    ]
+
+    boolean_options = ['force']
+
+    def initialize_options(self) -> None:
+        """
+        Sets the default command option values
+        """
+
+        self.pattern = os.path.join('assets', 'zones', '**', '*.tmx')
+        self.force = False
+
+    def finalize_options(self) -> None:
+        """
+        Validates the command option values
+        """
+
+    def run(self) -> None:
+        """
+        Compiles the matching TMX maps
+        """
+
+        from quest.world import tmx, qmap
+
+        for filename in sorted(glob.glob(self.pattern, recursive=True)):
+            qmap_filename = qmap.get_qmap_path(filename)
+            if not self.force and qmap.is_qmap_up_to_date(qmap_filename):
+                print('Skipping %s. Already up to date' % filename)
+                continue
+
+            try:
+                qmap.write_qmap(tmx.TiledMap(filename), qmap_filename)
+            except qmap.QMapError as e:
+                print(str(e))
+                continue
+
+            print('Compiled %s -> %s' % (filename, qmap_filename))
+
+#----------------------------------------------------------------------------------------------------------------------------------#